@@ -1,15 +1,45 @@
 \
 from __future__ import annotations
-import os
+import time
+_import_t0 = time.perf_counter()
+import asyncio, os
+from contextlib import asynccontextmanager
+from dataclasses import asdict
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 
 from .routers.docs import router as docs_router
 from .routers.chat import router as chat_router
+from .routers.profiles import router as profiles_router
+from .routers.search import router as search_router
+from .services.jobs import SCHEDULER
+from .services.providers import RESPONSE_CACHE
+from .services.retriever import DOC_CACHE
+from .services.warmup import STARTUP, WARMUP_DOCS, save_recent, warm_up
+from .store.answers import ANSWER_CACHE
+from .utils.admission import AdmissionMiddleware, admission_samples
+from .utils.imports import import_samples
+from .utils.metrics import REGISTRY, MetricsMiddleware
+from .utils.profiling import ProfilingMiddleware
 
-app = FastAPI(title="PDF Summarizer & Q&A")
+STARTUP.import_seconds = time.perf_counter() - _import_t0
+
+DATA_DIR = os.getenv("DATA_DIR", "app/data")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if WARMUP_DOCS > 0:
+        # served meanwhile; /ready answers 503 until the documents are loaded
+        STARTUP.ready = False
+        asyncio.get_running_loop().run_in_executor(None, warm_up, DATA_DIR, WARMUP_DOCS)
+    yield
+    if WARMUP_DOCS > 0:
+        save_recent(DATA_DIR)
+    SCHEDULER.shutdown(wait=False)
+
+app = FastAPI(title="PDF Summarizer & Q&A", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,11 +49,39 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(AdmissionMiddleware)  # inside the metrics middleware, so rejections are timed too
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(docs_router)
 app.include_router(chat_router)
+app.include_router(profiles_router)
+app.include_router(search_router)
 
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
+def _stats_samples(stats):
+    return lambda: [({"stat": k}, v) for k, v in stats().items() if isinstance(v, (int, float))]
+
+REGISTRY.gauge("pdfqa_document_cache", "Loaded-document cache counters and sizes", _stats_samples(DOC_CACHE.stats))
+REGISTRY.gauge("pdfqa_answer_cache", "Chat answer cache counters and sizes", _stats_samples(ANSWER_CACHE.stats))
+REGISTRY.gauge("pdfqa_llm_cache", "LLM response cache counters and sizes", _stats_samples(RESPONSE_CACHE.stats))
+REGISTRY.gauge("pdfqa_admission", "Admission control slots, queue depth and counters per route class", admission_samples)
+REGISTRY.gauge("pdfqa_ingest_queue", "Ingestion scheduler occupancy", _stats_samples(SCHEDULER.stats))
+REGISTRY.gauge("pdfqa_startup", "Startup import and warm-up timings and readiness", _stats_samples(STARTUP.stats))
+REGISTRY.gauge("pdfqa_import_seconds", "First-use import time of deferred libraries", import_samples)
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/ready", include_in_schema=False)
+def ready():
+    body = asdict(STARTUP)
+    if not STARTUP.ready:
+        return JSONResponse(body, status_code=503, headers={"Retry-After": "1"})
+    return body
+
 @app.get("/")
 def index():
     return FileResponse("app/static/index.html")
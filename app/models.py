@@ -1,6 +1,6 @@
 from __future__ import annotations
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Literal, Optional
 from datetime import datetime
 
 class DocumentMeta(BaseModel):
@@ -10,10 +10,25 @@ class DocumentMeta(BaseModel):
     chunk_size: int
     overlap: int
     num_chunks: int
+    content_key: Optional[str] = None  # sha256 of the PDF bytes + chunking params (deduplicated uploads)
+    updated_at: Optional[datetime] = None  # last append
 
 class UploadResponse(BaseModel):
-    doc_id: str
+    job_id: str
     filename: str
+    status: str
+    doc_id: Optional[str] = None
+
+class JobStatus(BaseModel):
+    job_id: str
+    filename: str
+    status: str  # queued | running | done | failed
+    stage: Optional[str] = None  # extract | chunk | index | summarize | facts | save
+    stages: List[str] = Field(default_factory=list)
+    doc_id: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
 
 class SummaryResponse(BaseModel):
     summary: str
@@ -23,11 +38,44 @@ class SourceChunk(BaseModel):
     idx: int
     score: float
     chunk: str
+    doc_id: Optional[str] = None  # set by collection chat
+
+Retrieval = Literal["sparse", "dense", "hybrid"]
 
 class ChatRequest(BaseModel):
     doc_id: str
     message: str = Field(..., min_length=1)
+    retrieval: Optional[Retrieval] = None  # default: RETRIEVAL_MODE
 
 class ChatResponse(BaseModel):
     answer: str
     sources: List[SourceChunk]
+
+class BatchChatRequest(BaseModel):
+    doc_id: str
+    messages: List[str] = Field(..., min_length=1, max_length=100)
+    retrieval: Optional[Retrieval] = None
+
+class BatchChatResponse(BaseModel):
+    results: List[ChatResponse]
+
+class SearchRequest(BaseModel):
+    query: str = Field(..., min_length=1)
+    k: int = Field(10, ge=1, le=200)
+    doc_ids: Optional[List[str]] = None  # restrict to these documents
+    per_doc: Optional[int] = Field(None, ge=1)  # at most this many chunks per document
+
+class SearchHit(BaseModel):
+    doc_id: str
+    filename: str
+    idx: int
+    score: float
+    chunk: str
+
+class SearchResponse(BaseModel):
+    results: List[SearchHit]
+
+class CollectionChatRequest(BaseModel):
+    message: str = Field(..., min_length=1)
+    k: int = Field(8, ge=1, le=50)
+    doc_ids: Optional[List[str]] = None
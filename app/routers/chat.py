@@ -1,40 +1,215 @@
 from __future__ import annotations
-from fastapi import APIRouter, HTTPException
-import os
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+import asyncio, json, os, time
+from typing import List, Optional, Tuple
 from pathlib import Path
 
-from ..models import ChatRequest, ChatResponse, SourceChunk
-from ..services.retriever import retrieve_topk, stitch_answer, rule_based_answer
-from ..services.providers import openai_answer
+from ..models import ChatRequest, ChatResponse, SourceChunk, BatchChatRequest, BatchChatResponse, CollectionChatRequest
+from ..services.retriever import (
+    retrieve_topk, retrieve_topk_batch, stitch_answer_indexed, stitch_answer, load_document, LoadedDocument, DOC_CACHE,
+    DenseIndexMissing, retrieve_collection, RETRIEVAL_MODE, _document_generation, _rewrite_question,
+)
+from ..services.rules import rule_based_answer
+from ..services.providers import aopenai_answer, astream_openai_answer, llm_configured, RESPONSE_CACHE, _model
+from ..store.answers import ANSWER_CACHE, answer_key
+from ..store.storage import open_storage
+from ..utils.metrics import ANSWER_PATH, observe_stage, timed
 
 DATA_DIR = os.getenv("DATA_DIR", "app/data")
 router = APIRouter(prefix="/api", tags=["chat"])
 
-@router.post("/chat", response_model=ChatResponse)
-async def chat(req: ChatRequest):
-    ddir = Path(DATA_DIR) / req.doc_id
-    if not ddir.exists():
+def _document(doc_id: str) -> Path:
+    """The document's location (its key in the document cache); 404 if it does not exist."""
+    storage = open_storage(DATA_DIR)
+    if not storage.exists(doc_id):
         raise HTTPException(status_code=404, detail="Document not found")
+    return storage.location(doc_id)
+
+# ---------- Answer cache ----------
+def _answer_key(ddir: Path, message: str, retrieval: Optional[str]) -> str:
+    # "What is the rent?" and "what is the  rent" share an entry; so do the rewrite's synonyms
+    question = " ".join(_rewrite_question(message).split()).rstrip("?!. ")
+    model = _model() if llm_configured() else None
+    return answer_key(ddir, _document_generation(ddir), question, retrieval or RETRIEVAL_MODE, model)
+
+def _cacheable(path: str) -> bool:
+    # an extractive answer while an LLM is configured means the LLM failed or timed out:
+    # answer from it again next time rather than serving the fallback for the whole TTL
+    return not (path == "extractive" and llm_configured())
+
+def _use_answer_cache(request: Request) -> bool:
+    """`Cache-Control: no-cache` recomputes the answer (and refreshes the entry)."""
+    return ANSWER_CACHE.enabled and "no-cache" not in request.headers.get("cache-control", "")
+
+def _cached_answer(ddir: Path, key: str) -> Tuple[Optional[ChatResponse], float]:
+    found = ANSWER_CACHE.get(ddir, key)
+    if found is None:
+        return None, 0.0
+    return ChatResponse.model_validate(found[0]), found[1]
+
+@router.post("/chat", response_model=ChatResponse)
+async def chat(req: ChatRequest, request: Request, response: Response):
+    """Repeated questions are answered from the answer cache (`X-Answer-Cache: hit | miss | bypass`)."""
+    ddir = _document(req.doc_id)
 
     try:
+        key = _answer_key(ddir, req.message, req.retrieval)
+        if _use_answer_cache(request):
+            cached, age = _cached_answer(ddir, key)
+            if cached is not None:
+                response.headers["X-Answer-Cache"] = "hit"
+                response.headers["Age"] = str(int(age))
+                return cached
+            response.headers["X-Answer-Cache"] = "miss"
+        else:
+            response.headers["X-Answer-Cache"] = "bypass"
         # Retrieve a few more chunks for better recall
-        triples = retrieve_topk(ddir, req.message, k=8)
-        sources = [SourceChunk(idx=i, score=s, chunk=c) for (i, s, c) in triples]
-        contexts = [c for (_, _, c) in triples]
+        triples = retrieve_topk(ddir, req.message, k=8, mode=req.retrieval)
+        res, path = await _answer(req.message, triples, load_document(ddir), req.doc_id)
+        if _cacheable(path):
+            ANSWER_CACHE.put(ddir, key, res.model_dump())
+        return res
 
-        # 1) Rule-based answers (fast & precise; handles lease facts, author/source/date,
-        #    photosynthesis pack, etc.)
-        answer = rule_based_answer(req.message, contexts)
+    except DenseIndexMissing as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # 2) LLM (optional; returns None if no OPENAI_API_KEY or on failure)
-        if answer is None:
-            answer = openai_answer(req.message, contexts)
+@router.post("/chat/batch", response_model=BatchChatResponse)
+async def chat_batch(req: BatchChatRequest, request: Request, response: Response):
+    """Cached questions are answered from the answer cache (`X-Answer-Cache: hit | partial | miss | bypass`)."""
+    ddir = _document(req.doc_id)
 
-        # 3) Offline extractive fallback (always available)
-        if answer is None:
-            answer = stitch_answer(req.message, contexts, max_sentences=5)
+    try:
+        keys = [_answer_key(ddir, msg, req.retrieval) for msg in req.messages]
+        use_cache = _use_answer_cache(request)
+        results: List[Optional[ChatResponse]] = [_cached_answer(ddir, key)[0] if use_cache else None for key in keys]
+        todo = [i for i, res in enumerate(results) if res is None]
+        if not use_cache:
+            response.headers["X-Answer-Cache"] = "bypass"
+        else:
+            response.headers["X-Answer-Cache"] = "miss" if len(todo) == len(keys) else "partial" if todo else "hit"
+        if todo:
+            # One query matrix and one sparse product for every uncached question
+            messages = [req.messages[i] for i in todo]
+            batches = retrieve_topk_batch(ddir, messages, k=8, mode=req.retrieval)
+            doc = load_document(ddir)
+            answers = await asyncio.gather(*(_answer(msg, triples, doc, req.doc_id) for msg, triples in zip(messages, batches)))
+            for i, (res, path) in zip(todo, answers):
+                if _cacheable(path):
+                    ANSWER_CACHE.put(ddir, keys[i], res.model_dump())
+                results[i] = res
+        return BatchChatResponse(results=results)
+
+    except DenseIndexMissing as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/chat/collection", response_model=ChatResponse)
+async def chat_collection(req: CollectionChatRequest):
+    """Answer from the best chunks across every document (or `doc_ids`); sources carry their `doc_id`."""
+    try:
+        hits = retrieve_collection(DATA_DIR, req.message, k=req.k, doc_ids=req.doc_ids)
+        triples = [(h.idx, h.score, h.chunk) for h in hits]
+        res, _ = await _answer(req.message, triples, None, None, source_docs=[h.doc_id for h in hits])
+        return res
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        return ChatResponse(answer=answer, sources=sources)
+@router.post("/chat/stream")
+async def chat_stream(req: ChatRequest):
+    """
+    Server-Sent Events: `sources` as soon as retrieval is done, then either `token` events
+    as the LLM produces text or a single `answer` event (rule / extractive answers), then `done`.
+    """
+    ddir = _document(req.doc_id)
 
+    try:
+        triples = retrieve_topk(ddir, req.message, k=8, mode=req.retrieval)
+        doc = load_document(ddir)
+    except DenseIndexMissing as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+    return StreamingResponse(
+        _stream_answer(req.message, triples, doc, req.doc_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def _stream_answer(message: str, triples, doc: LoadedDocument, doc_id: str):
+    sources = [SourceChunk(idx=i, score=s, chunk=c) for (i, s, c) in triples]
+    contexts = [c for (_, _, c) in triples]
+    chunk_ids = [i for (i, _, _) in triples]
+    yield _sse("sources", [s.model_dump() for s in sources])
+
+    try:
+        with timed("chat", "rules"):
+            answer = rule_based_answer(message, contexts, doc.facts)
+        path, streamed = "rule", False
+        if answer is None and llm_configured():
+            parts = []
+            t0 = time.perf_counter()
+            async for delta in astream_openai_answer(message, contexts, chunk_ids=chunk_ids, doc_id=doc_id):
+                parts.append(delta)
+                yield _sse("token", {"text": delta})
+            observe_stage("chat", "llm", time.perf_counter() - t0)
+            answer = "".join(parts).strip() or None
+            path, streamed = "llm", answer is not None
+        if answer is None:
+            with timed("chat", "stitch"):
+                answer = stitch_answer_indexed(message, doc, chunk_ids, max_sentences=5)
+            path = "extractive"
+        ANSWER_PATH.inc(path=path)
+        if not streamed:
+            yield _sse("answer", {"answer": answer})
+        yield _sse("done", {"answer": answer})
+    except Exception as e:
+        yield _sse("error", {"detail": str(e)})
+
+async def _answer(message: str, triples, doc: Optional[LoadedDocument], doc_id: Optional[str],
+                  source_docs: Optional[List[str]] = None) -> Tuple[ChatResponse, str]:
+    """
+    The answer and the path that produced it (rule, llm, extractive). `doc` is None for
+    collection chat: `triples` then come from several documents (`source_docs`).
+    """
+    sources = [SourceChunk(idx=i, score=s, chunk=c, doc_id=source_docs[j] if source_docs else None)
+               for j, (i, s, c) in enumerate(triples)]
+    contexts = [c for (_, _, c) in triples]
+    # chunk ids only identify contexts within one document; otherwise the LLM cache hashes the texts
+    chunk_ids = [i for (i, _, _) in triples] if doc is not None else None
+
+    # 1) Rule-based answers (fast & precise; handles lease facts, author/source/date,
+    #    photosynthesis pack, etc.): facts extracted at ingest, else a scan of the contexts
+    with timed("chat", "rules"):
+        answer = rule_based_answer(message, contexts, doc.facts if doc is not None else {})
+    path = "rule"
+
+    # 2) LLM (optional; returns None if no OPENAI_API_KEY or on failure)
+    if answer is None and llm_configured():
+        with timed("chat", "llm"):
+            answer = await aopenai_answer(message, contexts, chunk_ids=chunk_ids, doc_id=doc_id)
+        path = "llm"
+
+    # 3) Offline extractive fallback (always available)
+    if answer is None:
+        with timed("chat", "stitch"):
+            if doc is not None:
+                answer = stitch_answer_indexed(message, doc, chunk_ids, max_sentences=5)
+            else:
+                answer = stitch_answer(message, contexts, max_sentences=5)
+        path = "extractive"
+
+    ANSWER_PATH.inc(path=path)
+
+    return ChatResponse(answer=answer, sources=sources), path
+
+@router.get("/cache/stats")
+async def cache_stats():
+    return {**DOC_CACHE.stats(), "llm": RESPONSE_CACHE.stats(), "answers": ANSWER_CACHE.stats()}
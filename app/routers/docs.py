@@ -1,56 +1,175 @@
 \
 from __future__ import annotations
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from pathlib import Path
-import os, json
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Response
+from typing import Literal, Optional
+import os, hashlib, tempfile
 
-from ..services.ingest import ingest_pdf
-from ..models import UploadResponse, SummaryResponse, DocumentMeta
+from ..services.jobs import SCHEDULER, DocumentBusy, QueueFull, SchedulerUnavailable
+from ..services.ingest import DEFAULT_CHUNK_SIZE, DEFAULT_OVERLAP
+from ..services.retriever import DOC_CACHE, load_document
+from ..services.summarizer import RankedSummary, SUMMARY_MAX_SENTENCES, summarize_stored
+from ..store.answers import ANSWER_CACHE
+from ..store.catalog import Catalog
+from ..store.collection import CollectionIndex
+from ..store.content import ContentIndex, content_key
+from ..store.storage import open_storage
+from ..models import UploadResponse, SummaryResponse, DocumentMeta, JobStatus
 
 DATA_DIR = os.getenv("DATA_DIR", "app/data")
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or None  # default: system temp dir
+UPLOAD_READ_SIZE = 1024 * 1024
+PDF_HEADER_WINDOW = 1024  # readers accept the %PDF- header anywhere in the first 1 KB
 
 router = APIRouter(prefix="/api", tags=["docs"])
 
-@router.post("/upload", response_model=UploadResponse)
-async def upload_pdf(file: UploadFile = File(...)):
+@router.post("/upload", response_model=UploadResponse, status_code=202)
+async def upload_pdf(response: Response, file: UploadFile = File(...)):
+    """202 with a job to poll; 200 with the existing `doc_id` when the same PDF was already ingested."""
+    if not file.filename.lower().endswith(".pdf"):
+        raise HTTPException(status_code=400, detail="Please upload a .pdf file")
+    spool, digest = await _spool_upload(file)
     try:
-        if not file.filename.lower().endswith(".pdf"):
-            raise HTTPException(status_code=400, detail="Please upload a .pdf file")
-        data = await file.read()
-        doc_id = ingest_pdf(data, file.filename, DATA_DIR)
-        return UploadResponse(doc_id=doc_id, filename=file.filename)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+        key = content_key(digest, DEFAULT_CHUNK_SIZE, DEFAULT_OVERLAP)
+        job = SCHEDULER.submit(spool, file.filename, DATA_DIR, content_key=key)
+    except (QueueFull, SchedulerUnavailable) as e:
+        os.unlink(spool)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except Exception:
+        _unlink_quietly(spool)
+        raise
+    if job.status == "done":
+        response.status_code = 200
+    return UploadResponse(job_id=job.job_id, filename=job.filename, status=job.status, doc_id=job.doc_id)
+
+@router.post("/docs/{doc_id}/append", response_model=UploadResponse, status_code=202)
+async def append_pdf(doc_id: str, file: UploadFile = File(...)):
+    """
+    Append the PDF's pages to an existing document; 202 with a job to poll (409 while another
+    append runs, or when other uploads share the document).
+    """
+    if not file.filename.lower().endswith(".pdf"):
+        raise HTTPException(status_code=400, detail="Please upload a .pdf file")
+    storage = open_storage(DATA_DIR)
+    if not storage.exists(doc_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+    shared_key = storage.read_meta(doc_id).get("content_key")
+    entry = ContentIndex(DATA_DIR).get(shared_key) if shared_key else None
+    if entry is not None and entry["refs"] > 1:
+        raise HTTPException(status_code=409, detail=f"Document {doc_id} is shared by {entry['refs']} uploads; "
+                                                    "upload the combined PDF instead")
+    spool, digest = await _spool_upload(file)
+    try:
+        key = content_key(digest, DEFAULT_CHUNK_SIZE, DEFAULT_OVERLAP)
+        job = SCHEDULER.submit(spool, file.filename, DATA_DIR, content_key=key, append_to=doc_id)
+    except DocumentBusy as e:
+        os.unlink(spool)
+        raise HTTPException(status_code=409, detail=str(e), headers={"Retry-After": "5"})
+    except (QueueFull, SchedulerUnavailable) as e:
+        os.unlink(spool)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except Exception:
+        _unlink_quietly(spool)
+        raise
+    return UploadResponse(job_id=job.job_id, filename=job.filename, status=job.status, doc_id=doc_id)
+
+async def _spool_upload(file: UploadFile):
+    """
+    Copy the upload to a private temp file in fixed-size reads, hashing it on the way.
+    Returns (path, sha256 hex); the ingest job deletes the file.
+    """
+    fd, path = tempfile.mkstemp(suffix=".pdf", dir=UPLOAD_SPOOL_DIR)
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                block = await file.read(UPLOAD_READ_SIZE)
+                if not block:
+                    break
+                digest.update(block)
+                out.write(block)
+    except Exception:
+        os.unlink(path)
+        raise
+    # validate here, where a bad upload is still the client's error; the job reports anything later
+    with open(path, "rb") as f:
+        head = f.read(PDF_HEADER_WINDOW)
+    if not head:
+        os.unlink(path)
+        raise HTTPException(status_code=400, detail="Uploaded file is empty")
+    if b"%PDF-" not in head:
+        os.unlink(path)
+        raise HTTPException(status_code=400, detail="Uploaded file is not a PDF")
+    return path, digest.hexdigest()
+
+def _unlink_quietly(path: str):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass  # the scheduler may already have taken (and deleted) the spooled upload
+
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str):
+    job = SCHEDULER.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 @router.get("/docs/{doc_id}/summary", response_model=SummaryResponse)
-async def get_summary(doc_id: str):
-    ddir = Path(DATA_DIR) / doc_id
-    if not ddir.exists():
+async def get_summary(doc_id: str, max_sentences: Optional[int] = Query(None, ge=1, le=SUMMARY_MAX_SENTENCES)):
+    """`max_sentences` takes that many sentences from the ranking saved at ingest."""
+    storage = open_storage(DATA_DIR)
+    if not storage.exists(doc_id):
         raise HTTPException(status_code=404, detail="Document not found")
     try:
-        with open(ddir / "summary.txt", "r", encoding="utf-8") as f:
-            summary = f.read().strip()
-        with open(ddir / "meta.json", "r", encoding="utf-8") as f:
-            meta = DocumentMeta.model_validate_json(f.read())
+        src = storage.source(doc_id)
+        if max_sentences is None:
+            summary = src.text("summary.txt").strip()
+        else:
+            ranked = RankedSummary.load(src)
+            if ranked is None:
+                # ingested before ranked summaries: rank from the stored sentence table for this
+                # response only (a GET does not rewrite the document; `app.store.migrate --summaries` saves it)
+                doc = load_document(storage.location(doc_id))
+                ranked = summarize_stored(doc.chunks, doc.sentences)
+            summary = ranked.text(max_sentences)
+        meta = DocumentMeta.model_validate(src.json("meta.json"))
         return SummaryResponse(summary=summary, meta=meta)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.delete("/docs/{doc_id}")
+async def delete_doc(doc_id: str):
+    """Drop one reference to the document; its files are removed with the last one."""
+    storage = open_storage(DATA_DIR)
+    if not storage.exists(doc_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+    meta = DocumentMeta.model_validate(storage.read_meta(doc_id))
+    refs = ContentIndex(DATA_DIR).release(meta.content_key) if meta.content_key else 0
+    if refs == 0:
+        Catalog(DATA_DIR).delete(doc_id)
+        storage.delete(doc_id)
+        DOC_CACHE.invalidate(storage.location(doc_id))
+        ANSWER_CACHE.invalidate(storage.location(doc_id))
+        CollectionIndex(DATA_DIR).remove(doc_id)
+    return {"doc_id": doc_id, "deleted": refs == 0, "refs": refs}
+
 @router.get("/docs")
-async def list_docs():
-    ddir = Path(DATA_DIR)
-    if not ddir.exists():
-        return []
-    results = []
-    for child in ddir.iterdir():
-        if not child.is_dir():
-            continue
-        meta_file = child / "meta.json"
-        if meta_file.exists():
-            try:
-                with open(meta_file, "r", encoding="utf-8") as f:
-                    meta = json.loads(f.read())
-                results.append(meta)
-            except Exception:
-                pass
-    return results
+async def list_docs(
+    response: Response,
+    limit: int = Query(50, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+    order: Literal["asc", "desc"] = "desc",
+    filename_prefix: Optional[str] = None,
+):
+    """
+    Document metadata from the catalog, sorted by created_at (newest first by default).
+    When more documents follow, the X-Next-Cursor header holds the `cursor` of the next page.
+    """
+    try:
+        docs, next_cursor = Catalog(DATA_DIR).list(limit, offset, cursor, order, filename_prefix)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return docs
@@ -0,0 +1,40 @@
+from __future__ import annotations
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import FileResponse
+from pathlib import Path
+from typing import Optional
+import re
+
+from ..utils import profiling
+
+router = APIRouter(prefix="/api", tags=["profiles"])
+
+def _check_token(request: Request):
+    # the header that triggers profiling also guards access to the profiles; without a
+    # token (profiling by sampling only) they are not served at all: they name routes and doc_ids
+    if not profiling.PROFILE_TOKEN:
+        raise HTTPException(status_code=404, detail="Not found")
+    if request.headers.get(profiling.PROFILE_HEADER) != profiling.PROFILE_TOKEN:
+        raise HTTPException(status_code=403, detail="Profiling token required")
+
+@router.get("/profiles")
+async def list_profiles(
+    request: Request,
+    limit: int = Query(50, ge=1, le=1000),
+    route: Optional[str] = None,
+    doc_id: Optional[str] = None,
+):
+    """Captured request profiles, newest first, each with its top hotspots (by own time)."""
+    _check_token(request)
+    return profiling.list_profiles(limit=limit, route=route, doc_id=doc_id)
+
+@router.get("/profiles/{name}")
+async def download_profile(name: str, request: Request):
+    """The raw profile (pstats format): `python -m pstats <file>` or snakeviz."""
+    _check_token(request)
+    if not re.fullmatch(r"[A-Za-z0-9_-]+", name):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    path = Path(profiling.PROFILE_DIR) / f"{name}.prof"
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=path.name)
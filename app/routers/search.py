@@ -0,0 +1,20 @@
+from __future__ import annotations
+from fastapi import APIRouter, HTTPException
+import os
+
+from ..models import SearchRequest, SearchResponse, SearchHit
+from ..services.retriever import search_collection
+
+DATA_DIR = os.getenv("DATA_DIR", "app/data")
+router = APIRouter(prefix="/api", tags=["search"])
+
+@router.post("/search", response_model=SearchResponse)
+async def search(req: SearchRequest):
+    """Top chunks across every document (the collection index), best first."""
+    try:
+        hits = search_collection(DATA_DIR, req.query, k=req.k, doc_ids=req.doc_ids, per_doc=req.per_doc)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return SearchResponse(results=[
+        SearchHit(doc_id=h.doc_id, filename=h.filename, idx=h.idx, score=h.score, chunk=h.chunk) for h in hits
+    ])
@@ -1,17 +1,30 @@
 \
 from __future__ import annotations
-from typing import List
-import os, json, uuid, re
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import itertools, os, sys, uuid, re
+from contextlib import contextmanager
 from datetime import datetime
-from pathlib import Path
 
-from ..utils.pdf import extract_text_from_pdf_bytes, normalize_text
-from .summarizer import frequency_summarize
+from ..utils.pdf import PdfSource, iter_pages, normalize_text
+from .summarizer import RankedSummary, summarize_chunks, summarize_stored
+from .rules import extract_facts, load_facts, save_facts
 from ..store.vector import TfidfVectorStore
+from ..store.sentences import SentenceTable
+from ..store.chunks import ChunkStore
+from ..store.hashed import HashedTfidfStore, load_index
+from ..store.dense import DenseIndex, DENSE_DIM, DENSE_INDEX
+from .retriever import RETRIEVAL_MODE
+from ..store.answers import ANSWER_CACHE
+from ..store.catalog import Catalog
+from ..store.collection import CollectionIndex
+from ..store.content import ContentIndex, DocumentShared, appended_key
+from ..store.migrate import migrate_document
+from ..store.storage import open_storage
 from ..models import DocumentMeta
 
 DEFAULT_CHUNK_SIZE = 180
 DEFAULT_OVERLAP = 30
+INGEST_MEMORY_BUDGET_MB = int(os.getenv("INGEST_MEMORY_BUDGET_MB", "512"))  # 0 disables the check
 
 _SENT_SPLIT_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'])")
 
@@ -20,23 +33,38 @@ def split_into_sentences(text: str) -> List[str]:
     sents = _SENT_SPLIT_RE.split(text)
     return [s.strip() for s in sents if s and not s.isspace()]
 
-def chunk_sentences(sents: List[str], chunk_size_words: int = DEFAULT_CHUNK_SIZE, overlap_words: int = DEFAULT_OVERLAP) -> List[str]:
-    if not sents:
-        return []
-    chunks: List[str] = []
+def iter_sentences(pages: Iterable[str], budget: Optional["MemoryBudget"] = None) -> Iterator[str]:
+    """
+    Sentence-split a stream of page texts. Only the current page plus the unfinished
+    sentence carried over from the previous page are held at any time.
+    """
+    carry = ""
+    for page in pages:
+        text = normalize_text(carry + "\n" + page if carry else page)
+        held = sys.getsizeof(text)
+        if budget is not None:
+            budget.charge(held)
+        sents = [s.strip() for s in _SENT_SPLIT_RE.split(text) if s and not s.isspace()]
+        carry = sents.pop() if sents else ""
+        del text
+        if budget is not None:
+            budget.release(held)
+        yield from sents
+    if carry:
+        yield carry
+
+def iter_chunk_spans(sents: Iterable[str], chunk_size_words: int = DEFAULT_CHUNK_SIZE, overlap_words: int = DEFAULT_OVERLAP) -> Iterator[Tuple[str, int]]:
+    """Yield (chunk_text, n_overlap_words): the chunk plus how many leading words repeat the previous chunk."""
     curr_words: List[str] = []
     total_words = 0
+    carried = 0
 
-    def flush():
-        if curr_words:
-            chunks.append(" ".join(curr_words).strip())
-
-    i = 0
-    while i < len(sents):
-        sent = sents[i]
+    for sent in sents:
         words = sent.split()
         if total_words + len(words) > chunk_size_words and total_words > 0:
-            flush()
+            text = " ".join(curr_words).strip()
+            if text:
+                yield text, carried
             if overlap_words > 0:
                 overlap = curr_words[-overlap_words:] if len(curr_words) > overlap_words else curr_words
                 curr_words = overlap.copy()
@@ -44,21 +72,50 @@ def chunk_sentences(sents: List[str], chunk_size_words: int = DEFAULT_CHUNK_SIZE
             else:
                 curr_words = []
                 total_words = 0
+            carried = total_words
         curr_words.extend(words)
         total_words += len(words)
-        i += 1
-    flush()
-    return [c for c in chunks if c]
-
-def save_document(doc_id: str, filename: str, chunks: List[str], store: TfidfVectorStore, summary: str, base_dir: str):
-    ddir = Path(base_dir) / doc_id
-    ddir.mkdir(parents=True, exist_ok=True)
-    with open(ddir / "chunks.json", "w", encoding="utf-8") as f:
-        json.dump([{"idx": i, "text": c} for i, c in enumerate(chunks)], f, ensure_ascii=False, indent=2)
-    store.save(ddir / "index.pkl")
-    with open(ddir / "summary.txt", "w", encoding="utf-8") as f:
-        f.write(summary.strip())
+    text = " ".join(curr_words).strip()
+    if text:
+        yield text, carried
+
+def chunk_sentences(sents: Iterable[str], chunk_size_words: int = DEFAULT_CHUNK_SIZE, overlap_words: int = DEFAULT_OVERLAP) -> List[str]:
+    return [c for c, _ in iter_chunk_spans(sents, chunk_size_words, overlap_words)]
+
+# ---------- Memory budget ----------
+class MemoryBudgetExceeded(RuntimeError):
+    pass
+
+class MemoryBudget:
+    """Accounts for the document data an ingest holds (chunk strings, page buffers, index arrays)."""
 
+    def __init__(self, limit_bytes: Optional[int] = None):
+        self.limit = limit_bytes if limit_bytes and limit_bytes > 0 else None
+        self.used = 0
+        self.peak = 0
+
+    def charge(self, nbytes: int):
+        self.used += nbytes
+        self.peak = max(self.peak, self.used)
+        if self.limit is not None and self.used > self.limit:
+            raise MemoryBudgetExceeded(
+                f"Document is too large to ingest: needs more than {self.limit // (1024 * 1024)} MB "
+                f"(INGEST_MEMORY_BUDGET_MB)"
+            )
+
+    def release(self, nbytes: int):
+        self.used -= nbytes
+
+def _build_dense() -> bool:
+    # SVD (+ k-means on large documents) is a large share of ingest time; it is paid when dense
+    # retrieval is the default or DENSE_INDEX=1 opts in (for per-request "retrieval": "dense"/"hybrid").
+    # Otherwise `python -m app.store.migrate --dense` builds it.
+    return DENSE_DIM > 0 and (DENSE_INDEX or RETRIEVAL_MODE in ("dense", "hybrid"))
+
+def save_document(doc_id: str, filename: str, chunks: List[str], store: TfidfVectorStore, summary: str, base_dir: str,
+                  facts: Optional[Dict[str, str]] = None, sentences: Optional[SentenceTable] = None,
+                  content_key: Optional[str] = None, overlaps: Optional[List[int]] = None,
+                  dense: Optional[DenseIndex] = None, ranked: Optional[RankedSummary] = None):
     meta = DocumentMeta(
         id=doc_id,
         filename=filename,
@@ -66,20 +123,206 @@ def save_document(doc_id: str, filename: str, chunks: List[str], store: TfidfVec
         chunk_size=DEFAULT_CHUNK_SIZE,
         overlap=DEFAULT_OVERLAP,
         num_chunks=len(chunks),
+        content_key=content_key,
     )
-    with open(ddir / "meta.json", "w", encoding="utf-8") as f:
-        f.write(meta.model_dump_json(indent=2))
+    # written to a staging directory; the document appears (as a directory or a packed file) on commit
+    with open_storage(base_dir).create(doc_id) as ddir:
+        ChunkStore.build(chunks, overlaps).save(ddir / "chunks")
+        store.save(ddir / "index")
+        (sentences or SentenceTable.build(chunks)).save(ddir / "sentences")
+        if dense is not None:
+            dense.save(ddir / "dense")
+        with open(ddir / "summary.txt", "w", encoding="utf-8") as f:
+            f.write(summary.strip())
+        if ranked is not None:
+            ranked.save(ddir / "summary.json")
+        save_facts(ddir / "facts.json", facts or {})
+        with open(ddir / "meta.json", "w", encoding="utf-8") as f:
+            f.write(meta.model_dump_json(indent=2))
+    ANSWER_CACHE.invalidate(open_storage(base_dir).location(doc_id))
+    Catalog(base_dir).upsert(meta.model_dump(mode="json"))
+    CollectionIndex(base_dir).add(doc_id, filename, chunks)
+
+def ingest_pages(
+    pages: Iterable[str],
+    filename: str,
+    data_dir: str,
+    progress: Optional[Callable[[str], None]] = None,
+    budget: Optional[MemoryBudget] = None,
+    content_key: Optional[str] = None,
+) -> str:
+    """
+    Streaming ingest: pages -> sentences -> chunks are produced lazily, and the chunk list
+    is the only copy of the document text kept. The summary re-reads sentences from it.
+    """
+    stage = progress or (lambda name: None)
+    budget = budget or MemoryBudget(INGEST_MEMORY_BUDGET_MB * 1024 * 1024)
 
-def ingest_pdf(file_bytes: bytes, filename: str, data_dir: str) -> str:
-    text = extract_text_from_pdf_bytes(file_bytes)
-    if not text or not text.strip():
+    stage("extract")
+    chunks: List[str] = []
+    carried: List[int] = []
+    for text, n_overlap in iter_chunk_spans(iter_sentences(pages, budget), DEFAULT_CHUNK_SIZE, DEFAULT_OVERLAP):
+        if not chunks:
+            stage("chunk")  # extraction and chunking are interleaved from here on
+        budget.charge(sys.getsizeof(text))
+        chunks.append(text)
+        carried.append(n_overlap)
+    if not chunks:
         raise RuntimeError("The uploaded PDF did not contain extractable text. Please use a digital (non-scanned) PDF.")
-    sentences = split_into_sentences(text)
-    chunks = chunk_sentences(sentences, DEFAULT_CHUNK_SIZE, DEFAULT_OVERLAP)
 
+    stage("index")
     store = TfidfVectorStore.fit_from_chunks(chunks)
-    summary = frequency_summarize(" ".join(chunks), max_sentences=6)
+    budget.charge(store.nbytes())
+    sentences = SentenceTable.build(chunks)
+    budget.charge(sentences.nbytes())
+    dense = DenseIndex.build(store.matrix) if _build_dense() else None
+    if dense is not None:
+        budget.charge(dense.nbytes())
 
-    doc_id = str(uuid.uuid4())[:8]
-    save_document(doc_id, filename, chunks, store, summary, data_dir)
+    stage("summarize")
+    # sentences starting in a chunk's overlap prefix belong to its predecessor and are skipped
+    ranked = summarize_chunks(chunks, carried, sentences)
+    summary = ranked.text()
+
+    stage("facts")
+    # chunk by chunk: a match across a chunk boundary is whole in the next chunk's overlap
+    facts = extract_facts(chunks)
+
+    stage("save")
+    doc_id = uuid.uuid4().hex
+    save_document(doc_id, filename, chunks, store, summary, data_dir, facts=facts, sentences=sentences,
+                  content_key=content_key, overlaps=carried, dense=dense, ranked=ranked)
+    return doc_id
+
+def ingest_pdf(source: PdfSource, filename: str, data_dir: str, progress: Optional[Callable[[str], None]] = None,
+               budget: Optional[MemoryBudget] = None, content_key: Optional[str] = None) -> str:
+    """`source` is the PDF bytes or, preferably, the path of the spooled upload."""
+    pages = (p.text for p in iter_pages(source))
+    return ingest_pages(pages, filename, data_dir, progress=progress, budget=budget, content_key=content_key)
+
+# ---------- Append ----------
+@contextmanager
+def _exclusive_content(index: ContentIndex, key: Optional[str], appended: Optional[str]) -> Iterator[Optional[str]]:
+    """
+    Claim the document for an append: DocumentShared if other uploads share its content key
+    (they must keep seeing the original). With `appended` the entry moves to the new key
+    before the append starts, so an identical upload meanwhile no longer resolves to it, and
+    moves back if the append fails. Yields the document's content key after the append.
+    """
+    if not key:
+        yield None
+        return
+    if not appended:
+        entry = index.get(key)
+        if entry is not None and entry["refs"] > 1:
+            raise DocumentShared(f"Document {entry['doc_id']} is shared by {entry['refs']} uploads")
+        yield key
+        return
+    new_key = appended_key(key, appended)
+    index.rekey(key, new_key, exclusive=True)
+    try:
+        yield new_key
+    except BaseException:
+        index.rekey(new_key, key)
+        raise
+
+def append_pages(
+    doc_id: str,
+    pages: Iterable[str],
+    data_dir: str,
+    progress: Optional[Callable[[str], None]] = None,
+    budget: Optional[MemoryBudget] = None,
+    content_key: Optional[str] = None,
+) -> str:
+    """
+    Add pages to an ingested document in place. The new text is chunked as a continuation
+    of the last chunk, and the chunk store, index and sentence table grow by the new chunks
+    only; a document with a fitted index moves to the hashed (appendable) index on its first
+    append. The summary is recomputed over the stored text, facts found in the new text fill
+    in missing ones, and `content_key` (of the appended PDF) re-keys the document. A document
+    shared by several uploads (deduplicated) is not changed: DocumentShared.
+    """
+    stage = progress or (lambda name: None)
+    budget = budget or MemoryBudget(INGEST_MEMORY_BUDGET_MB * 1024 * 1024)
+    storage = open_storage(data_dir)
+    if not storage.exists(doc_id):
+        raise RuntimeError(f"Document {doc_id} not found")
+    claim = _exclusive_content(ContentIndex(data_dir), storage.read_meta(doc_id).get("content_key"), content_key)
+    # in place for a directory; a packed document is unpacked here and repacked on success
+    with claim as new_key, storage.edit(doc_id) as ddir:
+        with open(ddir / "meta.json", "r", encoding="utf-8") as f:
+            meta = DocumentMeta.model_validate_json(f.read())
+        migrate_document(ddir)  # legacy index.pkl / chunks.json
+
+        stage("extract")
+        stored = ChunkStore.load(ddir / "chunks")
+        last_words = stored[-1].split() if len(stored) else []
+        # the words the next chunk would have carried over, had the pages been part of the upload
+        seed = last_words[-DEFAULT_OVERLAP:] if DEFAULT_OVERLAP > 0 else []
+        sents: Iterable[str] = iter_sentences(pages, budget)
+        if seed:
+            sents = itertools.chain([" ".join(seed)], sents)
+        chunks: List[str] = []
+        carried: List[int] = []
+        for text, n_overlap in iter_chunk_spans(sents, DEFAULT_CHUNK_SIZE, DEFAULT_OVERLAP):
+            if not chunks:
+                if text == " ".join(seed):
+                    continue  # the carried words alone: already stored
+                stage("chunk")
+                n_overlap = max(n_overlap, len(seed))
+            budget.charge(sys.getsizeof(text))
+            chunks.append(text)
+            carried.append(n_overlap)
+        if not chunks:
+            raise RuntimeError("The uploaded PDF did not contain extractable text. Please use a digital (non-scanned) PDF.")
+
+        stage("index")
+        ChunkStore.append(ddir / "chunks", chunks, carried)
+        stored = ChunkStore.load(ddir / "chunks")
+        if HashedTfidfStore.is_hashed(ddir / "index"):
+            HashedTfidfStore.append(ddir / "index", chunks)
+            if DenseIndex.load(ddir / "dense") is not None:
+                # folded in with the current idf; the latent term vectors stay as built
+                DenseIndex.append(ddir / "dense", load_index(ddir / "index").transform(chunks))
+        else:
+            # the hashed feature space has new columns, so a dense index is rebuilt with it
+            had_dense = (ddir / "dense" / "format.json").exists()
+            store = HashedTfidfStore.from_chunks(stored)
+            budget.charge(store.nbytes())
+            store.save(ddir / "index")
+            dense = DenseIndex.build(store.tfidf_matrix()) if DENSE_DIM > 0 and (had_dense or _build_dense()) else None
+            if dense is not None:
+                dense.save(ddir / "dense")
+        sentences = SentenceTable.load(ddir / "sentences", mmap=False)
+        sentences = SentenceTable.build(stored) if sentences is None else sentences.extend(chunks)
+        sentences.save(ddir / "sentences")
+
+        stage("summarize")
+        ranked = summarize_stored(stored, sentences)
+        summary = ranked.text()
+
+        stage("facts")
+        new_facts = extract_facts(chunks)  # the first chunk carries the stored document's last words
+        facts = {**new_facts, **load_facts(ddir)}  # facts found earlier in the document win
+
+        stage("save")
+        tmp = ddir / "summary.txt.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(summary.strip())
+        os.replace(tmp, ddir / "summary.txt")
+        ranked.save(ddir / "summary.json")
+        save_facts(ddir / "facts.json", facts)
+        meta.num_chunks = len(stored)
+        meta.updated_at = datetime.utcnow()
+        meta.content_key = new_key
+        with open(ddir / "meta.json", "w", encoding="utf-8") as f:
+            f.write(meta.model_dump_json(indent=2))
+    ANSWER_CACHE.invalidate(storage.location(doc_id))
+    Catalog(data_dir).upsert(meta.model_dump(mode="json"))
+    CollectionIndex(data_dir).add(doc_id, meta.filename, chunks, first_chunk=meta.num_chunks - len(chunks))
     return doc_id
+
+def append_pdf(source: PdfSource, doc_id: str, data_dir: str, progress: Optional[Callable[[str], None]] = None,
+               budget: Optional[MemoryBudget] = None, content_key: Optional[str] = None) -> str:
+    pages = (p.text for p in iter_pages(source))
+    return append_pages(doc_id, pages, data_dir, progress=progress, budget=budget, content_key=content_key)
@@ -0,0 +1,286 @@
+from __future__ import annotations
+from typing import Callable, Dict, Optional, Tuple, Union
+from collections import OrderedDict
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+import multiprocessing as mp
+import os, threading, time, uuid
+
+from ..models import JobStatus
+from ..store.content import ContentIndex
+from ..utils.metrics import INGEST_JOBS, observe_stage
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "16"))
+INGEST_EXECUTOR = os.getenv("INGEST_EXECUTOR", "process")  # "process" | "thread"
+INGEST_MP_START = os.getenv("INGEST_MP_START", "spawn")
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", "1000"))
+
+class QueueFull(RuntimeError):
+    pass
+
+class DocumentBusy(RuntimeError):
+    pass
+
+class SchedulerUnavailable(RuntimeError):
+    """The worker pool cannot take jobs (shut down, or broken and not replaceable)."""
+
+# ---------- Worker side ----------
+# Set in each pool process by the initializer; progress events flow back to the parent through it.
+_progress_queue = None
+
+def _init_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+
+def _discard(source: Union[bytes, str]):
+    if isinstance(source, str):
+        try:
+            os.unlink(source)
+        except OSError:
+            pass
+
+def run_ingest_job(job_id: str, source: Union[bytes, str], filename: str, data_dir: str,
+                   progress: Optional[Callable[[str], None]] = None, content_key: Optional[str] = None,
+                   append_to: Optional[str] = None) -> str:
+    """
+    `source` is PDF bytes or the path of a spooled upload, which the job owns and deletes.
+    With `append_to`, the PDF's pages are appended to that document instead.
+    """
+    from .ingest import append_pdf, ingest_pdf
+    if progress is None and _progress_queue is not None:
+        progress = lambda stage: _progress_queue.put((job_id, stage, time.time()))
+    try:
+        if append_to is not None:
+            return append_pdf(source, append_to, data_dir, progress=progress, content_key=content_key)
+        return ingest_pdf(source, filename, data_dir, progress=progress, content_key=content_key)
+    finally:
+        _discard(source)
+
+# ---------- Scheduler ----------
+class IngestScheduler:
+    """
+    Runs ingest_pdf off the event loop on a bounded pool and tracks job status.
+
+    At most `max_queue` jobs may be queued or running at once; `submit` raises
+    QueueFull beyond that so the API can shed load instead of buffering uploads.
+
+    Submissions with a content key are deduplicated: an already ingested document
+    gains a reference and comes back as a finished job, and an identical upload that
+    is still being ingested returns that job (its reference is added when it finishes).
+
+    Appends (`append_to`) are not deduplicated; one append per document runs at a time and
+    `submit` raises DocumentBusy for another.
+    """
+
+    def __init__(self, workers: int = INGEST_WORKERS, max_queue: int = INGEST_QUEUE_SIZE,
+                 executor: str = INGEST_EXECUTOR, history: int = JOB_HISTORY):
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        self.kind = executor
+        self.history = history
+        self._jobs: "OrderedDict[str, JobStatus]" = OrderedDict()
+        self._active = 0
+        self._lock = threading.Lock()
+        self._executor: Optional[Executor] = None
+        self._progress = None
+        self._listener: Optional[threading.Thread] = None
+        self._inflight: Dict[str, str] = {}                    # content key -> job id
+        self._job_keys: Dict[str, Tuple[str, str, int]] = {}  # job id -> (content key, data dir, references)
+        self._current_stage: Dict[str, Tuple[str, float]] = {}  # job id -> (stage, wall-clock start)
+        self._appending: Dict[str, str] = {}                  # job id -> doc id being appended to
+
+    def _ensure_executor(self) -> Executor:
+        if self._executor is not None:
+            return self._executor
+        if self.kind == "process":
+            ctx = mp.get_context(INGEST_MP_START)
+            self._progress = ctx.Queue()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=ctx,
+                initializer=_init_worker, initargs=(self._progress,),
+            )
+            self._listener = threading.Thread(target=self._drain_progress, name="ingest-progress", daemon=True)
+            self._listener.start()
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ingest")
+        return self._executor
+
+    def submit(self, source: Union[bytes, str], filename: str, data_dir: str,
+               content_key: Optional[str] = None, append_to: Optional[str] = None) -> JobStatus:
+        with self._lock:
+            if append_to is not None and append_to in self._appending.values():
+                raise DocumentBusy(f"Document {append_to} is already being appended to")
+            if content_key is not None and append_to is None:
+                jid = self._inflight.get(content_key)
+                if jid is not None:
+                    key, ddir, refs = self._job_keys[jid]
+                    self._job_keys[jid] = (key, ddir, refs + 1)
+                    _discard(source)
+                    return self._jobs[jid].model_copy()
+                doc_id = ContentIndex(data_dir).acquire(content_key)
+                if doc_id is not None:
+                    _discard(source)
+                    now = datetime.utcnow()
+                    job = JobStatus(job_id=uuid.uuid4().hex, filename=filename, status="done", doc_id=doc_id,
+                                    created_at=now, updated_at=now)
+                    self._jobs[job.job_id] = job
+                    self._trim()
+                    return job.model_copy()
+            if self._active >= self.max_queue:
+                raise QueueFull(f"Ingestion queue is full ({self.max_queue} jobs)")
+            self._active += 1
+            now = datetime.utcnow()
+            job = JobStatus(job_id=uuid.uuid4().hex, filename=filename, status="queued", created_at=now, updated_at=now)
+            self._jobs[job.job_id] = job
+            self._trim()
+            if append_to is not None:
+                self._appending[job.job_id] = append_to
+            elif content_key is not None:
+                self._inflight[content_key] = job.job_id
+                self._job_keys[job.job_id] = (content_key, data_dir, 1)
+            executor = self._ensure_executor()
+        try:
+            try:
+                fut = self._submit_to(executor, job.job_id, source, filename, data_dir, content_key, append_to)
+            except BrokenProcessPool:
+                # a worker died after the last job finished: start a fresh pool and retry once
+                self._discard_executor(executor)
+                with self._lock:
+                    executor = self._ensure_executor()
+                fut = self._submit_to(executor, job.job_id, source, filename, data_dir, content_key, append_to)
+        except Exception as e:
+            with self._lock:
+                self._active -= 1
+                self._jobs.pop(job.job_id, None)
+                if job.job_id in self._job_keys:
+                    self._inflight.pop(content_key, None)
+                self._job_keys.pop(job.job_id, None)
+                self._appending.pop(job.job_id, None)
+            if isinstance(e, RuntimeError):
+                # executors raise RuntimeError (BrokenExecutor included) when they cannot take work
+                raise SchedulerUnavailable(f"Ingestion workers are unavailable: {e}") from e
+            raise
+        fut.add_done_callback(lambda f, jid=job.job_id, src=source, ex=executor: self._on_done(jid, f, src, ex))
+        return job.model_copy()
+
+    def _submit_to(self, executor: Executor, job_id: str, source: Union[bytes, str], filename: str,
+                   data_dir: str, content_key: Optional[str], append_to: Optional[str]) -> Future:
+        if self.kind == "process":
+            return executor.submit(run_ingest_job, job_id, source, filename, data_dir,
+                                   content_key=content_key, append_to=append_to)
+        return executor.submit(run_ingest_job, job_id, source, filename, data_dir,
+                               lambda stage: self._on_progress(job_id, stage),
+                               content_key=content_key, append_to=append_to)
+
+    def _discard_executor(self, executor: Executor) -> None:
+        """Shut down a broken pool and forget it, so the next submission starts a fresh one."""
+        with self._lock:
+            if self._executor is not executor:
+                return  # already replaced by another job's callback
+            self._executor = None
+            progress, self._progress = self._progress, None
+        executor.shutdown(wait=False, cancel_futures=True)
+        if progress is not None:
+            progress.put(None)  # stops that pool's progress listener
+
+    def get(self, job_id: str) -> Optional[JobStatus]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.model_copy() if job is not None else None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"active": self._active, "max_queue": self.max_queue, "workers": self.workers}
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=not wait)
+        if self._progress is not None:
+            self._progress.put(None)
+            self._progress = None
+
+    # ----- callbacks -----
+    def _drain_progress(self):
+        q = self._progress
+        while True:
+            try:
+                item = q.get()
+            except (EOFError, OSError):
+                return
+            if item is None:
+                return
+            self._on_progress(*item)
+
+    def _on_progress(self, job_id: str, stage: str, at: Optional[float] = None):
+        # `at` is stamped in the worker, so queue delays do not distort stage durations
+        at = time.time() if at is None else at
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            if job.status in ("queued", "running"):
+                job.status = "running"
+                job.stage = stage
+                prev = self._current_stage.get(job_id)
+                if prev is None or prev[0] != stage:
+                    self._current_stage[job_id] = (stage, at)
+                    if prev is not None:
+                        observe_stage("ingest", prev[0], max(0.0, at - prev[1]))
+            if stage not in job.stages:
+                # stages lists every stage that has started, in order
+                job.stages.append(stage)
+            job.updated_at = datetime.utcnow()
+
+    def _on_done(self, job_id: str, fut: Future, source: Union[bytes, str, None] = None,
+                 executor: Optional[Executor] = None):
+        broken = not fut.cancelled() and isinstance(fut.exception(), BrokenProcessPool)
+        if broken:
+            # a pool process died: the pool refuses all further work, and the job never deleted its upload
+            if executor is not None:
+                self._discard_executor(executor)
+            if source is not None:
+                _discard(source)
+        with self._lock:
+            self._active -= 1
+            keyed = self._job_keys.pop(job_id, None)
+            self._appending.pop(job_id, None)
+            ok = not fut.cancelled() and fut.exception() is None
+            last = self._current_stage.pop(job_id, None)
+            if last is not None and ok:
+                observe_stage("ingest", last[0], max(0.0, time.time() - last[1]))
+            INGEST_JOBS.inc(status="done" if ok else "failed")
+            if keyed is not None:
+                key, data_dir, refs = keyed
+                self._inflight.pop(key, None)
+                if ok:
+                    # registered before the job is reported done, so later uploads find it
+                    ContentIndex(data_dir).add(key, fut.result(), refs)
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            if fut.cancelled():
+                job.status, job.error = "failed", "cancelled"
+            elif broken:
+                job.status, job.error = "failed", "ingest worker died (out of memory or crashed)"
+            elif fut.exception() is not None:
+                job.status, job.error = "failed", str(fut.exception())
+            else:
+                job.status, job.doc_id = "done", fut.result()
+            # progress events from a pool process may still be in flight; stage is only meaningful while running
+            job.stage = None
+            job.updated_at = datetime.utcnow()
+
+    def _trim(self):
+        # Forget the oldest finished jobs once the history bound is exceeded.
+        if len(self._jobs) <= self.history:
+            return
+        for jid in [j for j, job in self._jobs.items() if job.status in ("done", "failed")]:
+            if len(self._jobs) <= self.history:
+                break
+            del self._jobs[jid]
+
+SCHEDULER = IngestScheduler()
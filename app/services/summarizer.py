@@ -1,8 +1,18 @@
-\
 from __future__ import annotations
-from typing import List
-import re
-from collections import Counter
+from typing import List, Optional, Sequence, Tuple, Union
+import json, os, re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
+
+from ..store.packed import Source, as_source
+from ..store.sentences import SentenceTable
+
+SUMMARY_SENTENCES = 6                                                           # summary.txt / default length
+SUMMARY_MAX_SENTENCES = int(os.getenv("SUMMARY_MAX_SENTENCES", "30"))           # longest summary precomputed at ingest
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "auto")                                # single | mapreduce | auto
+SUMMARY_SECTION_SENTENCES = int(os.getenv("SUMMARY_SECTION_SENTENCES", "20000"))  # sentences per map-reduce section
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", "4"))                        # threads summarizing sections
 
 STOP = {
     "the","a","an","of","to","and","or","in","on","for","by","with","is","are","was","were","be","been","being",
@@ -11,41 +21,111 @@ STOP = {
     "also","we","you","they","he","she","them","their","our","us","i"
 }
 
-_SENT_SPLIT_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'])")
+_WORD_RE = re.compile(r"\S+")
+
+def fresh_starts(chunks: Sequence[str], overlaps: Sequence[int]) -> np.ndarray:
+    """Character offset in each chunk after the `overlaps[i]` words it repeats from its predecessor."""
+    starts = np.zeros(len(chunks), dtype=np.int64)
+    for i, (text, n) in enumerate(zip(chunks, overlaps)):
+        if n:
+            for j, m in enumerate(_WORD_RE.finditer(text)):
+                if j == n - 1:
+                    starts[i] = m.end()
+                    break
+    return starts
+
+def fresh_sentences(table: SentenceTable, starts: np.ndarray) -> np.ndarray:
+    """Ids of the summary sentences that begin in their chunk's own text: each sentence of the document once."""
+    heads = np.asarray(table.sum_ptr[:-1])
+    owner = np.searchsorted(np.asarray(table.chunk_ptr), heads, side="right") - 1
+    return np.flatnonzero(np.asarray(table.spans[heads, 0]) >= np.asarray(starts, dtype=np.int64)[owner])
+
+def _stop_mask(table: SentenceTable) -> np.ndarray:
+    mask = np.zeros(len(table.vocab), dtype=bool)
+    ids = [table.vocab.lookup(w) for w in STOP]
+    mask[[i for i in ids if i >= 0]] = True
+    return mask
+
+def rank_sentences(table: SentenceTable, sent_ids: np.ndarray, limit: int,
+                   stop: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    The best `limit` of the summary sentences `sent_ids` by frequency score, best first
+    (ties: earlier first). A sentence scores the summed frequencies (within `sent_ids`) of
+    its non-stop tokens over its word count, computed with bincounts over the stored token ids.
+    """
+    sent_ids = np.asarray(sent_ids, dtype=np.int64)
+    if not len(sent_ids):
+        return sent_ids
+    stop = _stop_mask(table) if stop is None else stop
+    starts = np.asarray(table.tok_ptr[np.asarray(table.sum_ptr[sent_ids])])
+    lens = np.asarray(table.tok_ptr[np.asarray(table.sum_ptr[sent_ids + 1])]) - starts
+    owner = np.repeat(np.arange(len(sent_ids)), lens)
+    pos = np.arange(int(lens.sum())) - np.repeat(np.cumsum(lens) - lens, lens) + np.repeat(starts, lens)
+    toks = np.asarray(table.tok_ids[pos])
+    content = ~stop[toks]
+    freqs = np.bincount(toks[content], minlength=len(stop))
+    words = np.asarray(table.sum_words[sent_ids])
+    scores = np.bincount(owner, weights=freqs[toks] * content, minlength=len(sent_ids)) / (words + 1e-6)
+    order = np.lexsort((sent_ids, -scores))
+    return sent_ids[order[:limit]]
+
+def summarize_table(table: SentenceTable, starts: np.ndarray, limit: int = SUMMARY_MAX_SENTENCES,
+                    mode: str = SUMMARY_MODE) -> np.ndarray:
+    """
+    Ranked sentence ids of the document's summary. `mapreduce` ranks sections of
+    SUMMARY_SECTION_SENTENCES sentences in parallel, then ranks the union of their
+    summaries with frequencies over that union; `auto` does so from two sections on.
+    """
+    ids = fresh_sentences(table, starts)
+    stop = _stop_mask(table)
+    if mode == "single" or (mode == "auto" and len(ids) < 2 * SUMMARY_SECTION_SENTENCES):
+        return rank_sentences(table, ids, limit, stop)
+    sections = [ids[i:i + SUMMARY_SECTION_SENTENCES] for i in range(0, len(ids), SUMMARY_SECTION_SENTENCES)]
+    with ThreadPoolExecutor(max_workers=max(1, SUMMARY_WORKERS)) as pool:
+        partial = list(pool.map(lambda s: rank_sentences(table, s, limit, stop), sections))
+    return rank_sentences(table, np.sort(np.concatenate(partial)), limit, stop)
+
+class RankedSummary:
+    """Summary sentences best first, with their position in the document; any prefix is a summary."""
+
+    def __init__(self, ranked: List[Tuple[int, str]]):
+        self.ranked = ranked
+
+    @classmethod
+    def from_table(cls, table: SentenceTable, chunks: Sequence[str], ranked_ids: np.ndarray) -> "RankedSummary":
+        return cls([(int(s), table.summary_sentence(chunks, int(s)).strip()) for s in ranked_ids])
+
+    def text(self, max_sentences: int = SUMMARY_SENTENCES) -> str:
+        """The best `max_sentences` sentences in document order."""
+        return " ".join(t for _, t in sorted(self.ranked[:max_sentences]))
+
+    def save(self, path: Path):
+        tmp = Path(str(path) + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "ranked": self.ranked}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, doc: Union[Path, Source]) -> Optional["RankedSummary"]:
+        """The summary.json of a document (its directory or storage source); None if ingested before ranked summaries."""
+        try:
+            obj = as_source(doc).json("summary.json")
+        except FileNotFoundError:
+            return None
+        return cls([(int(p), t) for p, t in obj["ranked"]]) if obj.get("version") == 1 else None
 
-def _sentences(text: str) -> List[str]:
-    sents = _SENT_SPLIT_RE.split(text.strip())
-    return [s.strip() for s in sents if s.strip()]
+def summarize_chunks(chunks: Sequence[str], overlaps: Optional[Sequence[int]] = None,
+                     table: Optional[SentenceTable] = None, limit: int = SUMMARY_MAX_SENTENCES) -> RankedSummary:
+    table = table if table is not None else SentenceTable.build(chunks)
+    starts = fresh_starts(chunks, overlaps) if overlaps is not None else np.zeros(len(chunks), dtype=np.int64)
+    return RankedSummary.from_table(table, chunks, summarize_table(table, starts, limit))
 
-def _normalize(token: str) -> str:
-    token = re.sub(r"[^a-z0-9]", "", token.lower())
-    return token
+def summarize_stored(chunks: Sequence[str], table: Optional[SentenceTable] = None,
+                     limit: int = SUMMARY_MAX_SENTENCES) -> RankedSummary:
+    """Ranked summary of a saved document (a ChunkStore knows its overlaps; legacy chunk lists are taken whole)."""
+    table = table if table is not None else SentenceTable.build(chunks)
+    starts = chunks.fresh_starts() if hasattr(chunks, "fresh_starts") else np.zeros(len(chunks), dtype=np.int64)
+    return RankedSummary.from_table(table, chunks, summarize_table(table, starts, limit))
 
 def frequency_summarize(text: str, max_sentences: int = 5) -> str:
-    sents = _sentences(text)
-    if len(sents) <= max_sentences:
-        return " ".join(sents)
-
-    freqs = Counter()
-    for s in sents:
-        for w in s.split():
-            w = _normalize(w)
-            if not w or w in STOP: continue
-            freqs[w] += 1
-    if not freqs:
-        return " ".join(sents[:max_sentences])
-
-    scored = []
-    for i, s in enumerate(sents):
-        score = 0.0
-        words = s.split()
-        for w in words:
-            w = _normalize(w)
-            if not w or w in STOP: continue
-            score += freqs[w]
-        score = score / (len(words) + 1e-6)
-        scored.append((i, score))
-
-    top = sorted(scored, key=lambda x: x[1], reverse=True)[:max_sentences]
-    idxs = sorted([i for i, _ in top])
-    return " ".join([sents[i] for i in idxs])
+    return summarize_chunks([text], limit=max_sentences).text(max_sentences)
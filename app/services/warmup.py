@@ -0,0 +1,79 @@
+from __future__ import annotations
+from typing import Dict, List
+from dataclasses import asdict, dataclass
+import json, os, time
+from pathlib import Path
+
+from .retriever import DOC_CACHE, load_document
+from ..store.catalog import Catalog
+from ..store.storage import DocumentStorage
+from ..utils.imports import lazy_import
+
+WARMUP_DOCS = int(os.getenv("WARMUP_DOCS", "0"))  # documents preloaded at startup, most recently used first
+RECENT_FILE = ".recent.json"                      # document cache order at the last shutdown
+
+# Loading an index and analyzing a query import these; the warm-up pays for them before traffic does
+QUERY_MODULES = ("scipy.sparse", "sklearn.feature_extraction.text", "sklearn.preprocessing")
+
+@dataclass
+class StartupStatus:
+    ready: bool = True
+    import_seconds: float = 0.0   # `import app.main`
+    warmup_seconds: float = 0.0
+    documents: int = 0            # preloaded into the document cache
+    failed: int = 0
+
+    def stats(self) -> Dict[str, float]:
+        return {k: float(v) for k, v in asdict(self).items()}
+
+STARTUP = StartupStatus()
+
+def save_recent(data_dir: str):
+    """Remember which documents were cached, most recently used first, for the next warm-up."""
+    root = Path(data_dir)
+    ids = [p.name for p in DOC_CACHE.keys() if Path(p).parent == root]
+    if not ids or not root.is_dir():
+        return
+    tmp = root / (RECENT_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": 1, "doc_ids": ids}, f)
+    os.replace(tmp, root / RECENT_FILE)
+
+def recent_doc_ids(data_dir: str, n: int) -> List[str]:
+    """Up to `n` documents: those cached at the last shutdown, then the newest in the catalog."""
+    root = Path(data_dir)
+    try:
+        with open(root / RECENT_FILE, "r", encoding="utf-8") as f:
+            ids = list(json.load(f).get("doc_ids", []))
+    except (FileNotFoundError, ValueError):
+        ids = []
+    if len(ids) < n and root.is_dir():
+        ids += [m["id"] for m in Catalog(data_dir).list(limit=n)[0]]
+    storage = DocumentStorage(data_dir)
+    out: List[str] = []
+    for doc_id in ids:
+        if doc_id not in out and storage.exists(doc_id):
+            out.append(doc_id)
+    return out[:n]
+
+def warm_up(data_dir: str, n: int = WARMUP_DOCS, status: StartupStatus = STARTUP) -> StartupStatus:
+    """
+    Import the query path's libraries and load up to `n` documents into the document
+    cache (never more than it holds), each with its query analyzer built.
+    """
+    status.ready = False
+    t0 = time.perf_counter()
+    try:
+        for name in QUERY_MODULES:
+            lazy_import(name)
+        # least recent first, so the cache's LRU order matches the one saved at shutdown
+        for doc_id in reversed(recent_doc_ids(data_dir, min(n, DOC_CACHE.max_items))):
+            try:
+                load_document(DocumentStorage(data_dir).location(doc_id)).store.transform(["warm up"])
+                status.documents += 1
+            except Exception:
+                status.failed += 1
+    finally:
+        status.warmup_seconds = time.perf_counter() - t0
+        status.ready = True
+    return status
@@ -15,6 +15,17 @@ function addMsg(role, text) {
   w.scrollTop = w.scrollHeight;
 }
 
+async function waitForJob(jobId) {
+  const status = document.getElementById('uploadStatus');
+  while (true) {
+    const res = await fetch(`/api/jobs/${jobId}`);
+    const job = await res.json();
+    if (!res.ok || job.status === 'done' || job.status === 'failed') return job;
+    status.textContent = `Processing… (${job.stage || job.status})`;
+    await new Promise(r => setTimeout(r, 500));
+  }
+}
+
 async function uploadPdf() {
   const file = document.getElementById('fileInput').files[0];
   if (!file) { alert('Please choose a PDF first.'); return; }
@@ -28,13 +39,29 @@ async function uploadPdf() {
     return;
   }
   const data = await res.json();
-  currentDocId = data.doc_id;
+  const job = await waitForJob(data.job_id);
+  if (job.status !== 'done') {
+    document.getElementById('uploadStatus').textContent = '❌ ' + (job.error || 'Processing failed');
+    return;
+  }
+  currentDocId = job.doc_id;
   document.getElementById('uploadStatus').textContent = `✅ Uploaded: ${data.filename} (doc_id=${currentDocId})`;
   const sum = await fetch(`/api/docs/${currentDocId}/summary`);
   const sumData = await sum.json();
   document.getElementById('summaryText').textContent = sumData.summary;
 }
 
+function addSources(sources) {
+  const w = document.getElementById('chatWindow');
+  (sources || []).forEach((s, i) => {
+    const el = document.createElement('div');
+    el.className = 'source';
+    el.textContent = `[${i+1}] score=${s.score.toFixed(3)} — ` + s.chunk.slice(0, 180) + '…';
+    w.appendChild(el);
+  });
+}
+
+// Reads the Server-Sent Events of /api/chat/stream: sources, then tokens or one answer, then done
 async function sendMessage() {
   const input = document.getElementById('userMessage');
   const msg = input.value.trim();
@@ -43,7 +70,7 @@ async function sendMessage() {
   addMsg('You', msg);
   input.value = '';
 
-  const res = await fetch('/api/chat', {
+  const res = await fetch('/api/chat/stream', {
     method: 'POST',
     headers: {'Content-Type':'application/json'},
     body: JSON.stringify({ doc_id: currentDocId, message: msg })
@@ -53,17 +80,28 @@ async function sendMessage() {
     addMsg('Bot', '❌ ' + (err.detail || 'Could not answer.'));
     return;
   }
-  const data = await res.json();
-  addMsg('Bot', data.answer);
-  if (data.sources && data.sources.length) {
-    data.sources.forEach((s, i) => {
-      const w = document.getElementById('chatWindow');
-      const el = document.createElement('div');
-      el.className = 'source';
-      el.textContent = `[${i+1}] score=${s.score.toFixed(3)} — ` + s.chunk.slice(0, 180) + '…';
-      w.appendChild(el);
-    });
+  addMsg('Bot', '…');
+  const answerEl = document.getElementById('chatWindow').lastChild.lastChild;
+  let sources = [], text = '', buf = '';
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buf += decoder.decode(value, { stream: true });
+    let sep;
+    while ((sep = buf.indexOf('\n\n')) >= 0) {
+      const block = buf.slice(0, sep);
+      buf = buf.slice(sep + 2);
+      const event = (block.match(/^event: (.*)$/m) || [])[1];
+      const data = JSON.parse((block.match(/^data: (.*)$/m) || [, 'null'])[1]);
+      if (event === 'sources') sources = data;
+      else if (event === 'token') { text += data.text; answerEl.textContent = text; }
+      else if (event === 'answer' || event === 'done') answerEl.textContent = data.answer;
+      else if (event === 'error') answerEl.textContent = '❌ ' + data.detail;
+    }
   }
+  addSources(sources);
 }
 
 document.getElementById('uploadBtn').addEventListener('click', uploadPdf);
@@ -0,0 +1,140 @@
+"""
+Cache of complete chat answers per document. The key covers everything an answer
+depends on: the document's location and generation (so a re-ingested or appended
+document misses), the normalized question, the retrieval mode and the LLM model.
+Entries live in an LRU with a time-to-live and, with ANSWER_CACHE_DISK=1, also in
+DATA_DIR/.answers/<doc_id>/<key>.json so they survive restarts.
+"""
+from __future__ import annotations
+from typing import Any, Dict, Hashable, Optional, Tuple
+from collections import OrderedDict
+import hashlib, json, os, shutil, threading, time
+from pathlib import Path
+
+ANSWER_CACHE_MAX_ITEMS = int(os.getenv("ANSWER_CACHE_MAX_ITEMS", "1024"))  # 0 disables the answer cache
+ANSWER_CACHE_TTL_S = float(os.getenv("ANSWER_CACHE_TTL_S", "3600"))
+ANSWER_CACHE_DISK = os.getenv("ANSWER_CACHE_DISK", "0") == "1"            # also keep answers under DATA_DIR/.answers
+ANSWERS_DIR = ".answers"
+
+def answer_key(location: Path, generation: Hashable, question: str, mode: str, model: Optional[str]) -> str:
+    payload = json.dumps({"doc": str(location), "gen": generation, "q": question, "mode": mode, "model": model},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class AnswerCache:
+    """Thread-safe LRU of answers (JSON-able dicts) with a time-to-live and an optional disk tier."""
+
+    def __init__(self, max_items: int = ANSWER_CACHE_MAX_ITEMS, ttl: float = ANSWER_CACHE_TTL_S,
+                 disk: bool = ANSWER_CACHE_DISK, clock=time.time):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.disk = disk
+        self._clock = clock  # wall clock: disk entries outlive the process
+        # key -> (location, stored at, value)
+        self._items: "OrderedDict[str, Tuple[str, float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.disk_hits = self.misses = 0
+        self.evictions = self.expirations = self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_items > 0
+
+    def get(self, location: Path, key: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        """The cached answer and its age in seconds, or None."""
+        if not self.enabled:
+            return None
+        now = self._clock()
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[1] + self.ttl < now:
+                del self._items[key]
+                self.expirations += 1
+                item = None
+            if item is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return item[2], now - item[1]
+        if self.disk:
+            stored = self._read(location, key, now)
+            if stored is not None:
+                with self._lock:
+                    self._insert(key, (str(location), stored[0], stored[1]))
+                    self.disk_hits += 1
+                return stored[1], now - stored[0]
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, location: Path, key: str, value: Dict[str, Any]):
+        if not self.enabled:
+            return
+        now = self._clock()
+        with self._lock:
+            self._insert(key, (str(location), now, value))
+        if self.disk:
+            self._write(location, key, now, value)
+
+    def invalidate(self, location: Path):
+        """Drop every answer for the document at `location` (re-ingest, append, delete)."""
+        location = Path(location)
+        with self._lock:
+            stale = [k for k, item in self._items.items() if item[0] == str(location)]
+            for k in stale:
+                del self._items[k]
+            self.invalidations += len(stale)
+        shutil.rmtree(self._dir(location), ignore_errors=True)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "items": len(self._items), "max_items": self.max_items, "disk": int(self.disk),
+                "hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                "evictions": self.evictions, "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+    # ----- internals -----
+    def _insert(self, key: str, item: Tuple[str, float, Dict[str, Any]]):
+        # caller holds self._lock
+        self._items[key] = item
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    # ----- persistence -----
+    @staticmethod
+    def _dir(location: Path) -> Path:
+        return location.parent / ANSWERS_DIR / location.name
+
+    def _read(self, location: Path, key: str, now: float) -> Optional[Tuple[float, Dict[str, Any]]]:
+        path = self._dir(location) / f"{key}.json"
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if data.get("version") != 1 or data["stored_at"] + self.ttl < now:
+            path.unlink(missing_ok=True)
+            with self._lock:
+                self.expirations += 1
+            return None
+        return data["stored_at"], data["answer"]
+
+    def _write(self, location: Path, key: str, stored_at: float, value: Dict[str, Any]):
+        d = self._dir(location)
+        try:
+            d.mkdir(parents=True, exist_ok=True)
+            tmp = d / f"{key}.json.tmp{os.getpid()}.{threading.get_ident()}"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "stored_at": stored_at, "answer": value}, f, ensure_ascii=False)
+            os.replace(tmp, d / f"{key}.json")
+        except OSError:
+            pass  # the disk tier is best effort; the answer is still cached in memory
+
+ANSWER_CACHE = AnswerCache()
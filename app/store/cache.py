@@ -0,0 +1,125 @@
+from __future__ import annotations
+from typing import Any, Callable, Dict, Hashable, List, Optional
+from collections import OrderedDict
+from dataclasses import dataclass
+import threading
+
+@dataclass
+class CacheEntry:
+    value: Any
+    generation: Hashable
+    nbytes: int
+
+class DocumentCache:
+    """
+    Bounded, thread-safe LRU cache of loaded per-document objects.
+
+    Entries are evicted by count (max_items) and by approximate size (max_bytes).
+    Each entry remembers the generation it was loaded at; `generation(key)` is
+    re-checked on every lookup so a re-ingested document is reloaded.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[Any], Any],
+        generation: Callable[[Any], Hashable],
+        sizeof: Callable[[Any], int],
+        max_items: int = 32,
+        max_bytes: int = 512 * 1024 * 1024,
+    ):
+        self._loader = loader
+        self._generation = generation
+        self._sizeof = sizeof
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Any, CacheEntry]" = OrderedDict()
+        self._loading: Dict[Any, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Any) -> Any:
+        gen = self._generation(key)
+        with self._lock:
+            entry = self._lookup(key, gen)
+            if entry is not None:
+                self.hits += 1
+                return entry.value
+            self.misses += 1
+            key_lock = self._loading.setdefault(key, threading.Lock())
+
+        # Load outside the global lock; concurrent misses on the same key wait for one loader.
+        with key_lock:
+            with self._lock:
+                entry = self._lookup(key, gen)
+                if entry is not None:
+                    return entry.value
+            try:
+                value = self._loader(key)
+                nbytes = self._sizeof(value)
+                with self._lock:
+                    self._insert(key, CacheEntry(value, gen, nbytes))
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+            return value
+
+    def invalidate(self, key: Any) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry.nbytes
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def keys(self) -> List[Any]:
+        """Cached keys, most recently used first."""
+        with self._lock:
+            return list(reversed(self._entries))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "items": len(self._entries),
+                "bytes": self._bytes,
+                "max_items": self.max_items,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    # ----- internals (callers hold self._lock) -----
+    def _lookup(self, key: Any, gen: Hashable) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.generation != gen:
+            del self._entries[key]
+            self._bytes -= entry.nbytes
+            self.invalidations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _insert(self, key: Any, entry: CacheEntry) -> None:
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old.nbytes
+        if entry.nbytes > self.max_bytes or self.max_items <= 0:
+            # Too large to ever fit: serve it uncached rather than flushing everything else.
+            return
+        self._entries[key] = entry
+        self._bytes += entry.nbytes
+        while self._entries and (len(self._entries) > self.max_items or self._bytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+            self.evictions += 1
@@ -0,0 +1,131 @@
+"""
+SQLite catalog of document metadata, so listing documents does not read every meta.json.
+
+    python -m app.store.catalog [DATA_DIR]      # rebuild it from the document directories
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional, Tuple
+import argparse, base64, json, os, sqlite3
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+
+from .storage import DocumentStorage
+
+CATALOG_FILE = "catalog.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    meta TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS docs_created ON docs (created_at, id);
+CREATE INDEX IF NOT EXISTS docs_filename ON docs (filename);
+"""
+
+def _sort_key(created_at) -> str:
+    # Fixed-width ISO timestamps sort correctly as text (isoformat() drops zero microseconds)
+    if isinstance(created_at, str):
+        created_at = datetime.fromisoformat(created_at)
+    return created_at.strftime("%Y-%m-%dT%H:%M:%S.%f")
+
+def encode_cursor(created_at: str, doc_id: str) -> str:
+    return base64.urlsafe_b64encode(f"{created_at}|{doc_id}".encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        created_at, doc_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return created_at, doc_id
+
+class Catalog:
+    """
+    One row per document (id, filename, created_at and the meta.json payload), kept in
+    DATA_DIR/catalog.sqlite3. Ingest worker processes write to it while the API reads, so
+    every operation opens its own short-lived connection and the database runs in WAL mode.
+    A catalog that does not exist yet is backfilled from the document directories.
+    """
+
+    def __init__(self, data_dir: str):
+        self.data_dir = Path(data_dir)
+        self.path = self.data_dir / CATALOG_FILE
+
+    def _connect(self) -> sqlite3.Connection:
+        fresh = not self.path.exists()
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        if fresh:
+            self._backfill(conn)
+        return conn
+
+    def _backfill(self, conn: sqlite3.Connection) -> int:
+        rows = []
+        storage = DocumentStorage(str(self.data_dir))
+        for doc_id in storage.doc_ids():
+            try:
+                rows.append(self._row(storage.read_meta(doc_id)))
+            except Exception:
+                pass
+        with conn:
+            conn.execute("DELETE FROM docs")
+            conn.executemany("INSERT OR REPLACE INTO docs VALUES (?, ?, ?, ?)", rows)
+        return len(rows)
+
+    @staticmethod
+    def _row(meta: Dict) -> tuple:
+        return meta["id"], meta["filename"], _sort_key(meta["created_at"]), json.dumps(meta, ensure_ascii=False)
+
+    def upsert(self, meta: Dict):
+        with closing(self._connect()) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO docs VALUES (?, ?, ?, ?)", self._row(meta))
+
+    def delete(self, doc_id: str):
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM docs WHERE id = ?", (doc_id,))
+
+    def rebuild(self) -> int:
+        with closing(self._connect()) as conn:
+            return self._backfill(conn)
+
+    def list(self, limit: int = 50, offset: int = 0, cursor: Optional[str] = None, order: str = "desc",
+             filename_prefix: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """
+        A page of meta dicts sorted by (created_at, id), plus the cursor of the next page
+        (None on the last one). A cursor continues after the row it names, so pages stay
+        stable while documents are added; `offset` applies after the cursor.
+        """
+        desc = order == "desc"
+        where, args = [], []
+        if cursor:
+            created_at, doc_id = decode_cursor(cursor)
+            where.append(f"(created_at, id) {'<' if desc else '>'} (?, ?)")
+            args += [created_at, doc_id]
+        if filename_prefix:
+            # a range instead of LIKE so the filename index is used (and matching is case-sensitive)
+            where.append("filename >= ? AND filename < ?")
+            args += [filename_prefix, filename_prefix + "\U0010ffff"]
+        direction = "DESC" if desc else "ASC"
+        sql = (
+            "SELECT created_at, id, meta FROM docs"
+            + (" WHERE " + " AND ".join(where) if where else "")
+            + f" ORDER BY created_at {direction}, id {direction} LIMIT ? OFFSET ?"
+        )
+        with closing(self._connect()) as conn:
+            rows = conn.execute(sql, args + [limit + 1, offset]).fetchall()
+        next_cursor = encode_cursor(*rows[limit - 1][:2]) if len(rows) > limit else None
+        return [json.loads(meta) for _, _, meta in rows[:limit]], next_cursor
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("data_dir", nargs="?", default=os.getenv("DATA_DIR", "app/data"))
+    args = parser.parse_args(argv)
+    n = Catalog(args.data_dir).rebuild()
+    print(f"Catalogued {n} document(s) in {args.data_dir}")
+
+if __name__ == "__main__":
+    main()
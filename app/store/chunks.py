@@ -0,0 +1,175 @@
+from __future__ import annotations
+from typing import Iterator, List, Optional, Sequence, Union
+import json, os, shutil
+from collections.abc import Sequence as _SequenceABC
+from pathlib import Path
+import numpy as np
+
+from .packed import Source, as_source
+
+CHUNKS_FORMAT = "chunk-spans"
+CHUNKS_FORMAT_VERSION = 1
+MAX_DETECTED_OVERLAP = 64  # words compared when the overlap of consecutive chunks is not given
+
+def _shared_prefix(prev: str, chunk: str, n_words: Optional[int]) -> str:
+    """
+    The longest run of `prev`'s trailing words that `chunk` starts with (exactly `n_words`
+    when known). Empty when nothing is shared, so the chunk is stored on its own.
+    """
+    prev_words, words = prev.split(), chunk.split()
+    limit = min(len(prev_words), len(words), MAX_DETECTED_OVERLAP)
+    candidates = [n_words] if n_words is not None else range(limit, 0, -1)
+    for n in candidates:
+        if not 0 < n <= min(len(prev_words), len(words)) or prev_words[-n:] != words[:n]:
+            continue
+        shared = " ".join(words[:n])
+        # both chunks must hold the words literally (single spaces), or the spans would differ
+        if prev.endswith(shared) and chunk.startswith(shared) and chunk[len(shared):len(shared) + 1] in ("", " "):
+            return shared
+    return ""
+
+def _encode(chunks: Sequence[str], overlaps: Optional[Sequence[int]] = None, prev: str = "", pos: int = 0):
+    """
+    The UTF-8 bytes to write after `pos` bytes of stored text (whose last chunk is `prev`)
+    and the (start, end) spans of `chunks` in the combined text.
+    """
+    parts: List[bytes] = []
+    offsets = np.zeros((len(chunks), 2), dtype=np.int64)
+    for i, chunk in enumerate(chunks):
+        shared = _shared_prefix(prev, chunk, overlaps[i] if overlaps is not None else None) if prev else ""
+        if shared:
+            start = pos - len(shared.encode("utf-8"))
+            tail = chunk[len(shared):].encode("utf-8")
+        else:
+            if pos:
+                parts.append(b"\n")
+                pos += 1
+            start = pos
+            tail = chunk.encode("utf-8")
+        parts.append(tail)
+        pos += len(tail)
+        offsets[i] = (start, pos)
+        prev = chunk
+    return b"".join(parts), offsets
+
+class ChunkStore(_SequenceABC):
+    """
+    Chunk texts as spans over the document text stored once.
+
+    text.bin is the UTF-8 text with each chunk's overlap written only once; offsets[i] is
+    chunk i's (start, end) byte range in it, so consecutive chunks' spans overlap by the
+    words they share. Reading chunk i decodes one slice of the memory-mapped file.
+    """
+
+    FILES = ("text.bin", "offsets.npy")
+
+    def __init__(self, text: np.ndarray, offsets: np.ndarray):
+        self.text = text
+        self.offsets = offsets
+
+    @classmethod
+    def build(cls, chunks: Sequence[str], overlaps: Optional[Sequence[int]] = None) -> "ChunkStore":
+        """`overlaps[i]`: leading words chunk i repeats from chunk i-1 (detected when omitted)."""
+        text, offsets = _encode(chunks, overlaps)
+        return cls(np.frombuffer(text, dtype=np.uint8), offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def _chunk(self, i: int) -> str:
+        a, b = self.offsets[i]
+        return self.text[a:b].tobytes().decode("utf-8")
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._chunk(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("chunk index out of range")
+        return self._chunk(i)
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self._chunk(i)
+
+    def fresh_text(self) -> Iterator[str]:
+        """Each chunk without the words it repeats from its predecessor (the document text once)."""
+        end = 0
+        for i in range(len(self)):
+            a, b = self.offsets[i]
+            yield self.text[max(a, end):b].tobytes().decode("utf-8").strip()
+            end = b
+
+    def fresh_starts(self) -> np.ndarray:
+        """Character offset in each chunk where the text it does not share with its predecessor begins."""
+        starts = np.zeros(len(self), dtype=np.int64)
+        end = 0
+        for i in range(len(self)):
+            a, b = self.offsets[i]
+            if end > a:
+                starts[i] = len(self.text[a:min(end, b)].tobytes().decode("utf-8"))
+            end = b
+        return starts
+
+    def nbytes(self) -> int:
+        """Size of the arrays (mmapped pages are shared via the page cache)."""
+        return self.text.nbytes + self.offsets.nbytes
+
+    # ----- persistence -----
+    def save(self, path: Path):
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        with open(tmp / "text.bin", "wb") as f:
+            f.write(self.text.tobytes())
+        np.save(tmp / "offsets.npy", self.offsets)
+        with open(tmp / "format.json", "w", encoding="utf-8") as f:
+            json.dump({"format": CHUNKS_FORMAT, "version": CHUNKS_FORMAT_VERSION, "num_chunks": len(self),
+                       "text_bytes": int(self.text.nbytes)}, f)
+        if path.exists():
+            shutil.rmtree(path)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Union[Path, Source], mmap: bool = True) -> Optional["ChunkStore"]:
+        """None when the document predates the chunk store (callers fall back to chunks.json)."""
+        src = as_source(path)
+        try:
+            header = src.json("format.json")
+        except FileNotFoundError:
+            return None
+        if header.get("format") != CHUNKS_FORMAT or header.get("version") != CHUNKS_FORMAT_VERSION:
+            return None
+        offsets = src.array("offsets.npy", mmap)
+        # chunks and bytes past the header's counts belong to an append that has not been committed
+        offsets = offsets[:header.get("num_chunks", len(offsets))]
+        size = header.get("text_bytes", src.size("text.bin"))
+        return cls(src.raw("text.bin", np.uint8, size, mmap), offsets)
+
+    @classmethod
+    def append(cls, path: Path, chunks: Sequence[str], overlaps: Optional[Sequence[int]] = None) -> int:
+        """
+        Add `chunks` to the store saved at `path`: their new text is appended to text.bin in
+        place, offsets.npy and then format.json are replaced. Returns the new chunk count.
+        """
+        path = Path(path)
+        current = cls.load(path, mmap=False)
+        if current is None:
+            raise RuntimeError(f"No chunk store at {path}")
+        size = int(current.text.nbytes)
+        prev = current[-1] if len(current) else ""
+        text, offsets = _encode(chunks, overlaps, prev, size)
+        with open(path / "text.bin", "r+b") as f:
+            f.truncate(size)
+            f.seek(size)
+            f.write(text)
+        offsets = np.concatenate([np.asarray(current.offsets), offsets])
+        np.save(path / "offsets.tmp.npy", offsets)
+        os.replace(path / "offsets.tmp.npy", path / "offsets.npy")
+        with open(path / "format.tmp.json", "w", encoding="utf-8") as f:
+            json.dump({"format": CHUNKS_FORMAT, "version": CHUNKS_FORMAT_VERSION, "num_chunks": len(offsets),
+                       "text_bytes": size + len(text)}, f)
+        os.replace(path / "format.tmp.json", path / "format.json")
+        return len(offsets)
@@ -0,0 +1,359 @@
+"""
+Collection-wide inverted index over the chunks of every document, in DATA_DIR/.collection/.
+
+    python -m app.store.collection [DATA_DIR]      # rebuild it from the document directories
+"""
+from __future__ import annotations
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import argparse, fcntl, json, os, shutil
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+import numpy as np
+
+from .vector import VECTORIZER_PARAMS
+from .hashed import HASHED_INDEX_FEATURES, _count, _hashing_vectorizer
+from .chunks import ChunkStore
+from .packed import Source
+from .storage import DocumentStorage
+from .postings import select_top_k
+
+COLLECTION_DIR = ".collection"
+COLLECTION_FORMAT = "collection"
+COLLECTION_FORMAT_VERSION = 1
+COLLECTION_COMPACT_RATIO = float(os.getenv("COLLECTION_COMPACT_RATIO", "0.25"))  # deleted share of rows that triggers a rebuild
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+def _doc_chunks(src: Source) -> Sequence[str]:
+    store = ChunkStore.load(src.sub("chunks"))
+    if store is not None:
+        return store
+    return [x["text"] for x in src.json("chunks.json")]
+
+class _Part:
+    """
+    Immutable posting lists for a contiguous range of rows: for terms[t] (hashed features,
+    ascending), rows[ptr[t]:ptr[t + 1]] are the rows containing it and tf the counts there.
+    lens holds each row's term count.
+    """
+
+    FILES = ("terms.npy", "ptr.npy", "rows.npy", "tf.npy", "lens.npy")
+
+    def __init__(self, terms: np.ndarray, ptr: np.ndarray, rows: np.ndarray, tf: np.ndarray, lens: np.ndarray):
+        self.terms = terms
+        self.ptr = ptr
+        self.rows = rows
+        self.tf = tf
+        self.lens = lens
+
+    @classmethod
+    def build(cls, terms: np.ndarray, rows: np.ndarray, tf: np.ndarray, lens: np.ndarray) -> "_Part":
+        """From unordered (term, row, tf) triples."""
+        order = np.lexsort((rows, terms))
+        terms, rows, tf = terms[order], rows[order], tf[order]
+        keys, starts = np.unique(terms, return_index=True)
+        ptr = np.append(starts, len(terms)).astype(np.int64)
+        return cls(keys.astype(np.int32), ptr, rows.astype(np.int32), np.minimum(tf, 65535).astype(np.uint16),
+                   lens.astype(np.int32))
+
+    @classmethod
+    def from_chunks(cls, chunks: Sequence[str], first_row: int) -> "_Part":
+        counts = _count(_hashing_vectorizer(VECTORIZER_PARAMS, HASHED_INDEX_FEATURES), chunks).tocoo()
+        lens = np.bincount(counts.row, weights=counts.data, minlength=counts.shape[0])
+        return cls.build(counts.col, counts.row + first_row, counts.data, lens)
+
+    @classmethod
+    def merge(cls, parts: Sequence["_Part"]) -> "_Part":
+        """Parts covering consecutive row ranges, in row order."""
+        return cls.build(
+            np.concatenate([np.repeat(p.terms, np.diff(p.ptr)) for p in parts]),
+            np.concatenate([p.rows for p in parts]),
+            np.concatenate([p.tf for p in parts]),
+            np.concatenate([p.lens for p in parts]),
+        )
+
+    def postings(self, terms: np.ndarray) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """(rows, tf) of each of the int32 `terms` (empty where the part lacks it)."""
+        found = np.minimum(np.searchsorted(self.terms, terms), max(len(self.terms) - 1, 0))
+        out = []
+        for term, i in zip(terms, found):
+            if not len(self.terms) or self.terms[i] != term:
+                out.append((self.rows[:0], self.tf[:0]))
+            else:
+                out.append((self.rows[self.ptr[i]:self.ptr[i + 1]], self.tf[self.ptr[i]:self.ptr[i + 1]]))
+        return out
+
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.terms, self.ptr, self.rows, self.tf, self.lens))
+
+    def save(self, path: Path):
+        tmp = path.with_name(path.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        for name, arr in zip(self.FILES, (self.terms, self.ptr, self.rows, self.tf, self.lens)):
+            np.save(tmp / name, arr)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "_Part":
+        return cls(*(np.load(path / name, mmap_mode="r") for name in cls.FILES))
+
+@dataclass
+class CollectionSnapshot:
+    """
+    A loaded collection. Segment s covers rows starts[s]..starts[s + 1] and holds chunks
+    first_chunk[s].. of document doc_ids[s]; rows of deleted segments stay in the posting
+    lists (tombstoned) until the next rebuild.
+    """
+    parts: List[_Part]
+    lens: np.ndarray  # term count per row
+    starts: np.ndarray
+    first_chunk: np.ndarray
+    doc_ids: List[str]
+    filenames: List[str]
+    live: np.ndarray  # per row
+    _norms: Optional[Tuple[int, np.ndarray]] = None
+
+    def nbytes(self) -> int:
+        return sum(p.nbytes() for p in self.parts) + self.lens.nbytes + self.live.nbytes + self.starts.nbytes
+
+    def _length_norms(self) -> Tuple[int, np.ndarray]:
+        # live row count and k1 * (1 - b + b * len / avgdl) per row, computed once per snapshot
+        if self._norms is None:
+            live_lens = self.lens[self.live]
+            avgdl = max(1.0, float(live_lens.mean())) if len(live_lens) else 1.0
+            self._norms = (max(1, len(live_lens)), BM25_K1 * (1 - BM25_B + BM25_B * self.lens / avgdl))
+        return self._norms
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every row: only the query terms' posting lists are read."""
+        n = len(self.live)
+        n_live, norm = self._length_norms()
+        terms = np.unique(_count(_hashing_vectorizer(VECTORIZER_PARAMS, HASHED_INDEX_FEATURES), [query]).indices)
+        per_part = [p.postings(terms.astype(np.int32)) for p in self.parts]
+        rows, weights = [], []
+        for t in range(len(terms)):
+            found = [postings[t] for postings in per_part]
+            r = np.concatenate([f[0] for f in found])
+            if not len(r):
+                continue
+            tf = np.concatenate([f[1] for f in found]).astype(np.float64)
+            idf = np.log(1.0 + (n_live - len(r) + 0.5) / (len(r) + 0.5))
+            rows.append(r)
+            weights.append(idf * tf * (BM25_K1 + 1) / (tf + norm[r]))
+        if not rows:
+            return np.zeros(n)
+        return np.bincount(np.concatenate(rows), weights=np.concatenate(weights), minlength=n)[:n]
+
+    def search(self, query: str, k: int = 10, doc_ids: Optional[Sequence[str]] = None,
+               per_doc: Optional[int] = None) -> List[Tuple[str, str, int, float]]:
+        """(doc_id, filename, chunk index, score) of the best matching chunks, best first; zero scores are left out."""
+        rows = len(self.live)
+        if not rows:
+            return []
+        mask = self.live
+        if doc_ids is not None:
+            wanted = np.isin(np.asarray(self.doc_ids, dtype=object), list(doc_ids))
+            mask = mask & np.repeat(wanted, np.diff(np.append(self.starts, rows)))
+        scores = np.where(mask, self.scores(query), 0.0)
+        if per_doc is None:
+            top_scores, top_rows = select_top_k(scores, k)
+        else:
+            # every matching row in score order, at most per_doc of them per document
+            found = np.flatnonzero(scores > 0)
+            found = found[np.lexsort((found, -scores[found]))]
+            seg = np.searchsorted(self.starts, found, side="right") - 1
+            taken: Dict[str, int] = {}
+            picked = []
+            for row, s in zip(found, seg):
+                doc = self.doc_ids[s]
+                if taken.get(doc, 0) < per_doc:
+                    taken[doc] = taken.get(doc, 0) + 1
+                    picked.append(row)
+                    if len(picked) >= k:
+                        break
+            top_rows = np.asarray(picked, dtype=np.int64)
+            top_scores = scores[top_rows]
+        hits = []
+        for row, score in zip(top_rows, top_scores):
+            if score <= 0:
+                continue
+            s = int(np.searchsorted(self.starts, np.int64(row), side="right") - 1)
+            hits.append((self.doc_ids[s], self.filenames[s], int(self.first_chunk[s] + row - self.starts[s]), float(score)))
+        return hits
+
+class CollectionIndex:
+    """
+    One BM25 inverted index over the chunks of every document, so a query reads the
+    posting lists of its own terms across the corpus instead of loading one index per
+    document. Terms are hashed features with the chunk index's analyzer, and BM25 needs
+    only term counts, row lengths and document frequencies, so nothing is refitted as
+    the collection grows.
+
+    The posting lists are split into immutable parts over consecutive row ranges. Saving a
+    document writes its chunks as a new part; parts are then merged while the newest is at
+    least half the size of the one before it, which keeps a logarithmic number of parts.
+    Deleting a document tombstones its segments; once deleted rows exceed
+    COLLECTION_COMPACT_RATIO the index is rebuilt from the document directories.
+
+    segments.json lists the parts and the segments (doc_id, filename, first row, first
+    chunk, chunk count, deleted). Writers (the API process and ingest workers) serialize on
+    an flock; new parts are written before segments.json is replaced, so readers see either
+    the old or the new collection.
+    """
+
+    def __init__(self, data_dir: str):
+        self.data_dir = Path(data_dir)
+        self.root = self.data_dir / COLLECTION_DIR
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / ".lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read(self) -> Optional[dict]:
+        try:
+            with open(self.root / "segments.json", "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if state.get("format") != COLLECTION_FORMAT or state.get("version") != COLLECTION_FORMAT_VERSION:
+            return None
+        return state
+
+    def _commit(self, state: dict):
+        tmp = self.root / "segments.tmp.json"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.root / "segments.json")
+        # readers that loaded a dropped part keep their memory maps of the unlinked files
+        keep = {p["name"] for p in state["parts"]}
+        for old in self.root.glob("part-*"):
+            if old.name not in keep:
+                shutil.rmtree(old, ignore_errors=True)
+
+    def _new_part(self, state: dict, part: _Part, first_row: int) -> dict:
+        name = f"part-{state['next_part']}"
+        state["next_part"] += 1
+        part.save(self.root / name)
+        return {"name": name, "row": first_row, "rows": len(part.lens), "postings": len(part.rows)}
+
+    def exists(self) -> bool:
+        return self._read() is not None
+
+    # ----- writers -----
+    def add(self, doc_id: str, filename: str, chunks: Sequence[str], first_chunk: int = 0):
+        """Index `chunks` (chunk `first_chunk` onwards of the document); a collection that does not exist yet is built from disk."""
+        with self._locked():
+            state = self._read()
+            if state is None:
+                self._rebuild()
+                return
+            if any(s["doc_id"] == doc_id and s["chunk"] == first_chunk and not s["deleted"] for s in state["segments"]):
+                return  # already indexed (a retried job)
+            if not len(chunks):
+                return
+            parts = state["parts"]
+            parts.append(self._new_part(state, _Part.from_chunks(chunks, state["rows"]), state["rows"]))
+            while len(parts) > 1 and 2 * parts[-1]["postings"] >= parts[-2]["postings"]:
+                a, b = parts[-2], parts.pop()
+                merged = _Part.merge([_Part.load(self.root / a["name"]), _Part.load(self.root / b["name"])])
+                parts[-1] = self._new_part(state, merged, a["row"])
+            state["segments"].append({"doc_id": doc_id, "filename": filename, "row": state["rows"],
+                                      "chunk": first_chunk, "n": len(chunks), "deleted": False})
+            state["rows"] += len(chunks)
+            self._commit(state)
+
+    def remove(self, doc_id: str):
+        """Tombstone the document's rows; rebuild when too much of the index is dead."""
+        with self._locked():
+            state = self._read()
+            if state is None:
+                return
+            for s in state["segments"]:
+                if s["doc_id"] == doc_id:
+                    s["deleted"] = True
+            dead = sum(s["n"] for s in state["segments"] if s["deleted"])
+            if state["rows"] and dead > COLLECTION_COMPACT_RATIO * state["rows"]:
+                self._rebuild(exclude={doc_id})
+            else:
+                self._commit(state)
+
+    def rebuild(self) -> int:
+        """Re-index every document; returns the number of documents."""
+        with self._locked():
+            return self._rebuild()
+
+    def _rebuild(self, exclude: Sequence[str] = ()) -> int:
+        old = self._read()
+        state = {"format": COLLECTION_FORMAT, "version": COLLECTION_FORMAT_VERSION, "rebuilds": (old["rebuilds"] + 1) if old else 0,
+                 "next_part": old["next_part"] if old else 0, "rows": 0, "parts": [], "segments": []}
+        parts: List[_Part] = []
+        storage = DocumentStorage(str(self.data_dir))
+        for doc_id in storage.doc_ids():
+            if doc_id in exclude:
+                continue
+            try:
+                src = storage.source(doc_id)
+                filename = src.json("meta.json").get("filename", "")
+                chunks = _doc_chunks(src)
+                if not len(chunks):
+                    continue
+                parts.append(_Part.from_chunks(chunks, state["rows"]))
+            except (FileNotFoundError, ValueError):
+                continue  # removed or half-written meanwhile
+            state["segments"].append({"doc_id": doc_id, "filename": filename, "row": state["rows"], "chunk": 0,
+                                      "n": len(chunks), "deleted": False})
+            state["rows"] += len(chunks)
+        if parts:
+            state["parts"].append(self._new_part(state, _Part.merge(parts), 0))
+        self._commit(state)
+        return len(state["segments"])
+
+    # ----- readers -----
+    def generation(self):
+        try:
+            st = os.stat(self.root / "segments.json")
+            return (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def load(self) -> Optional[CollectionSnapshot]:
+        """None while the collection is empty (or not built yet)."""
+        for _ in range(3):
+            state = self._read()
+            if state is None or not state["segments"]:
+                return None
+            try:
+                parts = [_Part.load(self.root / p["name"]) for p in state["parts"]]
+                break
+            except FileNotFoundError:
+                continue  # a writer merged those parts after we read segments.json
+        else:
+            raise RuntimeError(f"Collection index in {self.root} changed while loading")
+        segments = state["segments"]
+        n = np.array([s["n"] for s in segments], dtype=np.int64)
+        return CollectionSnapshot(
+            parts=parts,
+            lens=np.concatenate([np.asarray(p.lens) for p in parts]),
+            starts=np.array([s["row"] for s in segments], dtype=np.int64),
+            first_chunk=np.array([s["chunk"] for s in segments], dtype=np.int64),
+            doc_ids=[s["doc_id"] for s in segments],
+            filenames=[s["filename"] for s in segments],
+            live=np.repeat(np.array([not s["deleted"] for s in segments]), n),
+        )
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("data_dir", nargs="?", default=os.getenv("DATA_DIR", "app/data"))
+    args = parser.parse_args(argv)
+    print(f"Indexed {CollectionIndex(args.data_dir).rebuild()} document(s) in {args.data_dir}")
+
+if __name__ == "__main__":
+    main()
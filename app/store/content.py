@@ -0,0 +1,108 @@
+from __future__ import annotations
+from typing import Iterator, Optional
+from contextlib import contextmanager
+from pathlib import Path
+import fcntl, hashlib, json, os
+
+from .storage import DocumentStorage
+
+CONTENT_DIR = ".content"
+
+def content_key(pdf_sha256: str, chunk_size: int, overlap: int) -> str:
+    """Identity of an ingested document: the PDF bytes plus the parameters that shape its chunks."""
+    return hashlib.sha256(f"{pdf_sha256}:{chunk_size}:{overlap}".encode("ascii")).hexdigest()
+
+def appended_key(key: str, appended: str) -> str:
+    """Identity of a document after the PDF with content key `appended` was appended to it."""
+    return hashlib.sha256(f"{key}+{appended}".encode("ascii")).hexdigest()
+
+class DocumentShared(RuntimeError):
+    pass
+
+class ContentIndex:
+    """
+    Maps content keys to document ids with a reference count, one small JSON file per key
+    under DATA_DIR/.content/. A document's files are only removed when its last reference
+    is released. Entries are read-modify-written under an flock on `.lock`: the API process
+    and ingest workers both update them.
+    """
+
+    def __init__(self, data_dir: str):
+        self.data_dir = Path(data_dir)
+        self.root = self.data_dir / CONTENT_DIR
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / ".lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _path(self, key: str) -> Path:
+        return self.root / f"{key}.json"
+
+    def _read(self, key: str) -> Optional[dict]:
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write(self, key: str, entry: dict):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self._path(key).with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp, self._path(key))
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._locked():
+            return self._read(key)
+
+    def acquire(self, key: str) -> Optional[str]:
+        """Take one more reference on the document stored for `key`; None if there is none."""
+        with self._locked():
+            entry = self._read(key)
+            if entry is None:
+                return None
+            if not DocumentStorage(str(self.data_dir)).exists(entry["doc_id"]):
+                # the document was removed behind our back
+                self._path(key).unlink(missing_ok=True)
+                return None
+            entry["refs"] += 1
+            self._write(key, entry)
+            return entry["doc_id"]
+
+    def add(self, key: str, doc_id: str, refs: int = 1):
+        with self._locked():
+            self._write(key, {"doc_id": doc_id, "refs": refs})
+
+    def rekey(self, old: str, new: str, exclusive: bool = False):
+        """
+        Move the entry (and its references) to `new`: the document no longer matches `old`.
+        With `exclusive`, raise DocumentShared instead if more than one upload references it.
+        """
+        with self._locked():
+            entry = self._read(old)
+            if entry is None:
+                return
+            if exclusive and entry["refs"] > 1:
+                raise DocumentShared(f"Document {entry['doc_id']} is shared by {entry['refs']} uploads")
+            self._write(new, entry)
+            self._path(old).unlink(missing_ok=True)
+
+    def release(self, key: str) -> int:
+        """Drop one reference; returns the references left (0: the caller removes the document)."""
+        with self._locked():
+            entry = self._read(key)
+            if entry is None:
+                return 0
+            entry["refs"] -= 1
+            if entry["refs"] <= 0:
+                self._path(key).unlink(missing_ok=True)
+                return 0
+            self._write(key, entry)
+            return entry["refs"]
@@ -0,0 +1,205 @@
+from __future__ import annotations
+from typing import Optional, Tuple, Union
+import json, os, shutil
+from pathlib import Path
+import numpy as np
+
+from .postings import select_top_k
+from .vector import csr_matrix
+from ..utils.imports import lazy_import
+from .hashed import _append_raw
+from .packed import Source, as_source
+
+DENSE_FORMAT = "lsa-ivf"
+DENSE_FORMAT_VERSION = 1
+DENSE_DIM = int(os.getenv("DENSE_DIM", "64"))                      # 0: no dense index is built
+DENSE_INDEX = os.getenv("DENSE_INDEX", "0") == "1"                  # build it at upload even under sparse retrieval
+DENSE_MAX_TERMS = int(os.getenv("DENSE_MAX_TERMS", "20000"))       # most frequent terms given a latent vector
+DENSE_IVF_MIN_CHUNKS = int(os.getenv("DENSE_IVF_MIN_CHUNKS", "2000"))  # smaller documents are searched exhaustively
+DENSE_NPROBE = int(os.getenv("DENSE_NPROBE", "8"))                 # IVF lists scanned per query
+DENSE_RERANK = 4  # int8 candidates re-scored with the float32 vectors, per result
+
+def _quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # symmetric per-vector int8: v ~= codes * scale
+    scales = np.abs(vectors).max(axis=1) / 127.0 if len(vectors) else np.zeros(0, dtype=np.float32)
+    scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales
+
+def _unit_rows(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return np.divide(x, norms, out=np.zeros_like(x), where=norms > 0).astype(np.float32)
+
+class DenseIndex:
+    """
+    Latent semantic (LSA) chunk vectors with an IVF index over int8 codes.
+
+    A truncated SVD of the chunks' TF-IDF rows (restricted to the DENSE_MAX_TERMS most
+    frequent terms) gives every term a `dim`-dimensional vector; a chunk or a question is
+    the normalized sum of its TF-IDF-weighted term vectors, so paraphrases sharing related
+    terms score without sharing words. Large documents are clustered (k-means, about
+    sqrt(n) lists): a query scans the int8 codes of its `nprobe` nearest lists and re-scores
+    the best candidates with the float32 vectors.
+
+    On disk: keys.npy (index columns with a term vector), term_vectors.npy, centroids.npy
+    and append-only vectors.bin/codes.bin/scales.bin/assign.bin (chunk order; list of each
+    chunk), with format.json recording the committed chunk count.
+    """
+
+    def __init__(self, keys: np.ndarray, term_vectors: np.ndarray, centroids: np.ndarray, vectors: np.ndarray,
+                 codes: np.ndarray, scales: np.ndarray, assign: np.ndarray):
+        self.keys = keys
+        self.term_vectors = term_vectors
+        self.centroids = centroids
+        self.vectors = vectors
+        self.codes = codes
+        self.scales = scales
+        self.assign = assign
+        self._lists: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    @property
+    def dim(self) -> int:
+        return self.term_vectors.shape[1]
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    @classmethod
+    def build(cls, tfidf: csr_matrix, dim: int = DENSE_DIM, max_terms: int = DENSE_MAX_TERMS,
+              ivf_min_chunks: int = DENSE_IVF_MIN_CHUNKS, nlist: Optional[int] = None) -> Optional["DenseIndex"]:
+        """From L2-normalized TF-IDF rows (any column space); None when the document is too small."""
+        tfidf = csr_matrix(tfidf)
+        n = tfidf.shape[0]
+        cols, df = np.unique(tfidf.indices, return_counts=True)
+        keys = np.sort(cols[np.argsort(-df, kind="stable")[:max_terms]]).astype(np.int32)
+        compact = _compact(tfidf, keys)
+        dim = min(dim, n - 1, len(keys) - 1)
+        if dim < 2:
+            return None
+        svd = lazy_import("sklearn.decomposition").TruncatedSVD(dim, n_iter=4, random_state=0).fit(compact)
+        term_vectors = np.ascontiguousarray(svd.components_.T, dtype=np.float32)
+        vectors = _unit_rows(np.asarray(compact @ term_vectors, dtype=np.float32))
+        if nlist is None:
+            nlist = int(np.sqrt(n)) if n >= ivf_min_chunks else 1
+        if nlist > 1:
+            km = lazy_import("sklearn.cluster").MiniBatchKMeans(nlist, batch_size=4096, n_init=1, random_state=0).fit(vectors)
+            centroids, assign = km.cluster_centers_.astype(np.float32), km.labels_.astype(np.int32)
+        else:
+            centroids, assign = np.zeros((1, dim), dtype=np.float32), np.zeros(n, dtype=np.int32)
+        codes, scales = _quantize(vectors)
+        return cls(keys, term_vectors, centroids, vectors, codes, scales, assign)
+
+    # ----- query side -----
+    def embed(self, tfidf: csr_matrix) -> np.ndarray:
+        """Unit latent vectors of TF-IDF rows in the same column space as the build."""
+        return _unit_rows(np.asarray(_compact(csr_matrix(tfidf), self.keys) @ self.term_vectors, dtype=np.float32))
+
+    @property
+    def lists(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(chunk ids grouped by list, list_ptr): list l is ids[list_ptr[l]:list_ptr[l + 1]]."""
+        if self._lists is None:
+            order = np.argsort(self.assign, kind="stable")
+            ptr = np.searchsorted(self.assign[order], np.arange(len(self.centroids) + 1))
+            self._lists = (order, ptr)
+        return self._lists
+
+    def search(self, query: np.ndarray, k: int, nprobe: Optional[int] = None):
+        """(scores, chunk ids) of the best k chunks by cosine; exhaustive unless the index has lists."""
+        if len(self.centroids) <= 1:
+            return select_top_k(self.vectors @ query, k)
+        nprobe = min(nprobe or DENSE_NPROBE, len(self.centroids))
+        order, ptr = self.lists
+        nearest = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        ids = np.concatenate([order[ptr[l]:ptr[l + 1]] for l in nearest])
+        approx = (self.codes[ids].astype(np.float32) @ query) * self.scales[ids]
+        _, pos = select_top_k(approx, k * DENSE_RERANK)
+        ids = ids[pos]
+        return select_top_k(self.vectors[ids] @ query, k, ids)
+
+    def scores_for(self, query: np.ndarray, ids: np.ndarray) -> np.ndarray:
+        return self.vectors[ids] @ query
+
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.keys, self.term_vectors, self.centroids, self.vectors,
+                                      self.codes, self.scales, self.assign))
+
+    # ----- persistence -----
+    _APPENDED = (("vectors.bin", np.float32), ("codes.bin", np.int8), ("scales.bin", np.float32), ("assign.bin", np.int32))
+
+    def _header(self) -> dict:
+        return {"format": DENSE_FORMAT, "version": DENSE_FORMAT_VERSION, "dim": self.dim,
+                "n_chunks": len(self), "nlist": len(self.centroids)}
+
+    def save(self, path: Path):
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        np.save(tmp / "keys.npy", self.keys)
+        np.save(tmp / "term_vectors.npy", self.term_vectors)
+        np.save(tmp / "centroids.npy", self.centroids)
+        for (name, dtype), arr in zip(self._APPENDED, (self.vectors, self.codes, self.scales, self.assign)):
+            with open(tmp / name, "wb") as f:
+                f.write(np.ascontiguousarray(arr, dtype=dtype).tobytes())
+        with open(tmp / "format.json", "w", encoding="utf-8") as f:
+            json.dump(self._header(), f, indent=2)
+        if path.exists():
+            shutil.rmtree(path)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Union[Path, Source], mmap: bool = True) -> Optional["DenseIndex"]:
+        """None when the document has no dense index (built at ingest unless DENSE_DIM=0)."""
+        src = as_source(path)
+        try:
+            header = src.json("format.json")
+        except FileNotFoundError:
+            return None
+        if header.get("format") != DENSE_FORMAT or header.get("version") != DENSE_FORMAT_VERSION:
+            return None
+        n, dim = header["n_chunks"], header["dim"]
+        vectors, codes, scales, assign = (
+            src.raw(name, dtype, n * (dim if name in ("vectors.bin", "codes.bin") else 1), mmap)
+            for name, dtype in cls._APPENDED
+        )
+        return cls(src.array("keys.npy", mmap), src.array("term_vectors.npy", mmap),
+                   src.array("centroids.npy", mmap=False), vectors.reshape(n, dim), codes.reshape(n, dim), scales, assign)
+
+    @classmethod
+    def append(cls, path: Path, tfidf: csr_matrix) -> int:
+        """
+        Fold new chunks (their TF-IDF rows) into the index at `path` with the existing term
+        vectors and lists; terms first seen in them have no latent vector. Returns the chunk count.
+        """
+        path = Path(path)
+        index = cls.load(path, mmap=False)
+        if index is None:
+            raise RuntimeError(f"No dense index at {path}")
+        vectors = index.embed(tfidf)
+        codes, scales = _quantize(vectors)
+        c = index.centroids
+        # nearest centroid in Euclidean distance, as k-means assigned the others
+        assign = np.argmin((c * c).sum(axis=1)[None, :] - 2 * vectors @ c.T, axis=1).astype(np.int32)
+        n, dim = len(index), index.dim
+        for (name, dtype), arr in zip(cls._APPENDED, (vectors, codes, scales, assign)):
+            width = dim if name in ("vectors.bin", "codes.bin") else 1
+            _append_raw(path / name, n * width * np.dtype(dtype).itemsize, arr.astype(dtype))
+        header = index._header()
+        header["n_chunks"] = n + len(vectors)
+        tmp = path / "format.tmp.json"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(header, f, indent=2)
+        os.replace(tmp, path / "format.json")
+        return header["n_chunks"]
+
+def _compact(tfidf: csr_matrix, keys: np.ndarray) -> csr_matrix:
+    """The columns of `tfidf` listed in the sorted `keys`, renumbered to their positions."""
+    n = tfidf.shape[0]
+    if not len(keys):
+        return csr_matrix((n, 0), dtype=np.float32)
+    pos = np.minimum(np.searchsorted(keys, tfidf.indices), len(keys) - 1)
+    keep = keys[pos] == tfidf.indices
+    rows = np.repeat(np.arange(n), np.diff(tfidf.indptr))[keep]
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return csr_matrix((np.asarray(tfidf.data[keep], dtype=np.float32), pos[keep], indptr), shape=(n, len(keys)))
@@ -0,0 +1,295 @@
+from __future__ import annotations
+from typing import Dict, Optional, Sequence, Union
+import json, os, shutil
+from pathlib import Path
+import numpy as np
+
+from .vector import TfidfVectorStore, VECTORIZER_PARAMS, TOPK_ENGINE, TOPK_PRUNE_MIN_CHUNKS, csr_matrix, row_dots
+from .packed import Source, as_source
+from ..utils.imports import lazy_import
+from .postings import PostingIndex, select_top_k
+
+HASHED_FORMAT = "hashed-tf"
+HASHED_FORMAT_VERSION = 1
+HASHED_INDEX_FEATURES = int(os.getenv("HASHED_INDEX_FEATURES", str(2 ** 24)))  # few collisions at 100k+ terms
+
+def _append_raw(path: Path, committed_bytes: int, arr: np.ndarray):
+    with open(path, "r+b" if path.exists() else "wb") as f:
+        f.truncate(committed_bytes)
+        f.seek(committed_bytes)
+        f.write(np.ascontiguousarray(arr).tobytes())
+
+class HashedTfidfStore:
+    """
+    Appendable TF-IDF index: the columns are hashed features, so there is no vocabulary
+    to fit, and the document frequencies are counts kept next to the raw term counts.
+    idf (sklearn's smooth idf and max_df cut-off over the current chunk count) and the
+    chunk vector norms are derived when the index is loaded, so appending chunks only
+    writes their own rows plus the df table.
+
+    On disk: data.bin (float32 counts), indices.bin (int32 features), indptr.bin (int32)
+    are appended in place; format.json records how much of them is committed and names
+    the df table (`df-<n_chunks>.npy`, written under a new name by every append). The df
+    table is sparse, (feature, chunks containing it) rows sorted by feature, so a large
+    hashed space costs nothing for features no chunk contains.
+    """
+
+    def __init__(self, counts: csr_matrix, df: np.ndarray, params: Optional[Dict] = None,
+                 n_features: int = HASHED_INDEX_FEATURES):
+        self.matrix = counts
+        self.df = df
+        self.params = dict(params or VECTORIZER_PARAMS)
+        self.n_features = n_features
+        self._idf: Optional[np.ndarray] = None
+        self._norms: Optional[np.ndarray] = None
+        self._compact: Optional[csr_matrix] = None
+        self._postings: Optional[PostingIndex] = None
+
+    def _vectorizer(self):
+        return _hashing_vectorizer(self.params, self.n_features)
+
+    @classmethod
+    def from_chunks(cls, chunks: Sequence[str], n_features: int = HASHED_INDEX_FEATURES) -> "HashedTfidfStore":
+        counts = _count(_hashing_vectorizer(VECTORIZER_PARAMS, n_features), chunks)
+        return cls(counts, _df_table(counts.indices), VECTORIZER_PARAMS, n_features)
+
+    # ----- weights derived at load time -----
+    @property
+    def idf(self) -> np.ndarray:
+        """idf of every row of `df` (0 for features a refit would drop)."""
+        if self._idf is None:
+            n = self.matrix.shape[0]
+            df = np.asarray(self.df[:, 1], dtype=np.float64)
+            idf = (np.log((1.0 + n) / (1.0 + df)) + 1.0).astype(np.float32)
+            max_df = self.params.get("max_df", 1.0)
+            limit = max_df * n if isinstance(max_df, float) else max_df
+            if n > 1:
+                # terms in too many chunks are dropped, as a refit with max_df would
+                idf[df > limit] = 0.0
+            self._idf = idf
+        return self._idf
+
+    def _positions(self, features: np.ndarray):
+        """(row of `df` holding each feature, whether it is there at all)."""
+        keys = self.df[:, 0]
+        if not len(keys):
+            return np.zeros(len(features), dtype=np.int32), np.zeros(len(features), dtype=bool)
+        pos = np.minimum(np.searchsorted(keys, features), len(keys) - 1).astype(np.int32)
+        return pos, keys[pos] == features
+
+    def idf_of(self, features: np.ndarray) -> np.ndarray:
+        pos, known = self._positions(features)
+        return np.where(known, self.idf[pos], np.float32(0.0)) if len(pos) else np.zeros(0, dtype=np.float32)
+
+    @property
+    def compact(self) -> csr_matrix:
+        """The counts with columns renumbered to rows of `df` (in memory, built once per load):
+        products against a query then span the document's features, not the hashed space."""
+        if self._compact is None:
+            m = self.matrix
+            pos, _ = self._positions(np.asarray(m.indices))
+            self._compact = csr_matrix((m.data, pos, m.indptr), shape=(m.shape[0], len(self.df)), copy=False)
+        return self._compact
+
+    @property
+    def norms(self) -> np.ndarray:
+        if self._norms is None:
+            m = self.compact
+            weights = np.asarray(m.data, dtype=np.float32) * self.idf[m.indices]
+            rows = np.repeat(np.arange(m.shape[0]), np.diff(m.indptr))
+            self._norms = np.sqrt(np.bincount(rows, weights=weights.astype(np.float64) ** 2, minlength=m.shape[0]))
+        return self._norms
+
+    @property
+    def postings(self) -> PostingIndex:
+        """Posting lists over the normalized TF-IDF rows (columns are rows of `df`), built once
+        per load: idf and norms change with every append, so they are not stored."""
+        if self._postings is None:
+            m = self.compact
+            norms = self.norms
+            rows = np.repeat(np.arange(m.shape[0]), np.diff(m.indptr))
+            weights = np.asarray(m.data, dtype=np.float32) * self.idf[m.indices]
+            weights = np.divide(weights, norms[rows], out=np.zeros_like(weights), where=norms[rows] > 0)
+            self._postings = PostingIndex.from_matrix(csr_matrix((weights, m.indices, m.indptr), shape=m.shape))
+        return self._postings
+
+    # ----- query side -----
+    def transform(self, queries: Sequence[str]) -> csr_matrix:
+        """tf * idf, L2-normalized rows (the query side of TfidfVectorStore.transform)."""
+        q = _count(self._vectorizer(), queries)
+        q.data *= self.idf_of(q.indices)
+        return lazy_import("sklearn.preprocessing").normalize(q, copy=False)
+
+    def _scores(self, queries: Sequence[str]) -> np.ndarray:
+        # cos(q, row) = q . (tf_row * idf) / |tf_row * idf|; idf moves to the query side
+        q = self.transform(queries)
+        pos, known = self._positions(q.indices)
+        rows = np.repeat(np.arange(q.shape[0]), np.diff(q.indptr))[known]
+        # a dense query over the document's features: a sparse-times-dense product per query
+        dense_q = np.zeros((len(self.df), q.shape[0]), dtype=np.float32)
+        np.add.at(dense_q, (pos[known], rows), q.data[known] * self.idf[pos[known]])
+        sims = np.asarray(self.compact @ dense_q).T
+        norms = self.norms
+        return np.divide(sims, norms, out=np.zeros_like(sims), where=norms > 0)
+
+    def score_rows(self, q: csr_matrix, ids: np.ndarray) -> np.ndarray:
+        """Cosine scores of one transformed query (`transform([query])`) against the given chunks only."""
+        sims = row_dots(self.matrix[ids], q.indices, q.data * self.idf_of(q.indices))
+        norms = self.norms[ids]
+        return np.divide(sims, norms, out=np.zeros_like(sims), where=norms > 0)
+
+    def tfidf_matrix(self) -> csr_matrix:
+        """L2-normalized TF-IDF rows of every chunk, as a refit would store them (in memory)."""
+        m = self.matrix
+        weighted = csr_matrix((np.asarray(m.data, dtype=np.float32) * self.idf_of(m.indices), m.indices, m.indptr),
+                              shape=m.shape)
+        return lazy_import("sklearn.preprocessing").normalize(weighted, copy=False)
+
+    def top_k(self, query: str, k: int = 5, engine: Optional[str] = None):
+        """Highest-scoring chunks (descending score, ties by chunk order); engines as in TfidfVectorStore.top_k."""
+        engine = engine or TOPK_ENGINE
+        if engine == "auto":
+            engine = "pruned" if self.matrix.shape[0] >= TOPK_PRUNE_MIN_CHUNKS else "exhaustive"
+        if engine == "pruned":
+            q = self.transform([query])
+            pos, known = self._positions(q.indices)
+            return self.postings.top_k(pos[known], q.data[known], k)
+        return select_top_k(self._scores([query])[0], k)
+
+    def top_k_batch(self, queries: Sequence[str], k: int = 5):
+        top = [select_top_k(row, k) for row in self._scores(queries)]
+        return np.array([s for s, _ in top]), np.array([i for _, i in top])
+
+    def nbytes(self) -> int:
+        m = self.matrix
+        size = m.data.nbytes + m.indices.nbytes + m.indptr.nbytes + self.df.nbytes
+        if self._compact is not None:
+            size += self._compact.indices.nbytes
+        if self._idf is not None:
+            size += self._idf.nbytes + self.norms.nbytes
+        if self._postings is not None:
+            size += self._postings.nbytes()
+        return size
+
+    # ----- persistence -----
+    def _header(self) -> Dict:
+        return {
+            "format": HASHED_FORMAT,
+            "version": HASHED_FORMAT_VERSION,
+            "n_features": self.n_features,
+            "n_chunks": int(self.matrix.shape[0]),
+            "nnz": int(self.matrix.nnz),
+            "df": _df_name(int(self.matrix.shape[0])),
+            "params": {k: list(v) if isinstance(v, tuple) else v for k, v in self.params.items()},
+        }
+
+    def save(self, path: Path):
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        m = self.matrix
+        for name, arr, dtype in (("data.bin", m.data, np.float32), ("indices.bin", m.indices, np.int32),
+                                 ("indptr.bin", m.indptr, np.int32)):
+            with open(tmp / name, "wb") as f:
+                f.write(np.asarray(arr, dtype=dtype).tobytes())
+        header = self._header()
+        np.save(tmp / header["df"], np.asarray(self.df, dtype=np.int32))
+        with open(tmp / "format.json", "w", encoding="utf-8") as f:
+            json.dump(header, f, indent=2)
+        if path.exists():
+            shutil.rmtree(path)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def is_hashed(path: Union[Path, Source]) -> bool:
+        try:
+            return as_source(path).json("format.json").get("format") == HASHED_FORMAT
+        except (FileNotFoundError, NotADirectoryError, ValueError):
+            return False
+
+    @classmethod
+    def load(cls, path: Union[Path, Source], mmap: bool = True) -> "HashedTfidfStore":
+        src = as_source(path)
+        header = src.json("format.json")
+        if header.get("format") != HASHED_FORMAT or header.get("version") != HASHED_FORMAT_VERSION:
+            raise RuntimeError(f"Unsupported index format in {src}: {header.get('format')} v{header.get('version')}")
+        n, nnz, n_features = header["n_chunks"], header["nnz"], header["n_features"]
+        matrix = csr_matrix(
+            (src.raw("data.bin", np.float32, nnz, mmap), src.raw("indices.bin", np.int32, nnz, mmap),
+             src.raw("indptr.bin", np.int32, n + 1, mmap)),
+            shape=(n, n_features), copy=False,
+        )
+        params = dict(header.get("params") or VECTORIZER_PARAMS)
+        if "ngram_range" in params:
+            params["ngram_range"] = tuple(params["ngram_range"])
+        return cls(matrix, src.array(header.get("df", "df.npy"), mmap), params, n_features)
+
+    @classmethod
+    def append(cls, path: Path, chunks: Sequence[str]) -> int:
+        """
+        Add rows for `chunks` to the index saved at `path` in place. Cost follows the new
+        chunks (plus writing a new df table, one row per distinct feature). Rows are appended
+        past the committed counts and the df table gets a new name, so the old format.json
+        still describes a consistent index until the new one replaces it. Returns the new
+        chunk count.
+        """
+        path = Path(path)
+        with open(path / "format.json", "r", encoding="utf-8") as f:
+            header = json.load(f)
+        params = dict(header.get("params") or VECTORIZER_PARAMS)
+        if "ngram_range" in params:
+            params["ngram_range"] = tuple(params["ngram_range"])
+        n, nnz = header["n_chunks"], header["nnz"]
+        counts = _count(_hashing_vectorizer(params, header["n_features"]), chunks)
+
+        _append_raw(path / "data.bin", 4 * nnz, counts.data.astype(np.float32))
+        _append_raw(path / "indices.bin", 4 * nnz, counts.indices.astype(np.int32))
+        _append_raw(path / "indptr.bin", 4 * (n + 1), (counts.indptr[1:] + nnz).astype(np.int32))
+        old_df = header.get("df", "df.npy")
+        rows = np.concatenate([np.load(path / old_df), _df_table(counts.indices)])
+        keys, inverse = np.unique(rows[:, 0], return_inverse=True)
+        df = np.stack([keys, np.bincount(inverse, weights=rows[:, 1])]).T.astype(np.int32)
+        header.update(n_chunks=n + counts.shape[0], nnz=nnz + counts.nnz, df=_df_name(n + counts.shape[0]))
+        tmp = path / "df.tmp.npy"
+        np.save(tmp, df)
+        os.replace(tmp, path / header["df"])
+
+        tmp = path / "format.tmp.json"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(header, f, indent=2)
+        os.replace(tmp, path / "format.json")
+        # the previous table stays for readers holding the previous format.json; older ones go
+        for stale in path.glob("df*.npy"):
+            if stale.name not in (old_df, header["df"]):
+                stale.unlink(missing_ok=True)
+        return header["n_chunks"]
+
+def _df_name(n_chunks: int) -> str:
+    return f"df-{n_chunks}.npy"
+
+def _hashing_vectorizer(params: Dict, n_features: int):
+    # same analyzer as the fitted index; raw counts (no sign flipping, no normalization)
+    return lazy_import("sklearn.feature_extraction.text").HashingVectorizer(
+        n_features=n_features, alternate_sign=False, norm=None,
+        lowercase=params.get("lowercase", True), stop_words=params.get("stop_words"),
+        ngram_range=tuple(params.get("ngram_range", (1, 1))),
+    )
+
+def _df_table(indices: np.ndarray) -> np.ndarray:
+    # CSR rows hold each feature once, so occurrences in `indices` are chunk counts
+    keys, counts = np.unique(indices, return_counts=True)
+    return np.stack([keys, counts]).T.astype(np.int32).reshape(-1, 2)
+
+def _count(vectorizer, texts: Sequence[str]) -> csr_matrix:
+    counts = csr_matrix(vectorizer.transform(texts), dtype=np.float32)
+    counts.sum_duplicates()
+    counts.indices = counts.indices.astype(np.int32, copy=False)
+    counts.indptr = counts.indptr.astype(np.int32, copy=False)
+    return counts
+
+def load_index(path: Union[Path, Source], mmap: bool = True) -> Union[TfidfVectorStore, HashedTfidfStore]:
+    """The fitted (TfidfVectorStore) or appendable (HashedTfidfStore) index saved at `path`."""
+    if HashedTfidfStore.is_hashed(path):
+        return HashedTfidfStore.load(path, mmap=mmap)
+    return TfidfVectorStore.load(path, mmap=mmap)
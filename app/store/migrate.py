@@ -0,0 +1,90 @@
+"""
+Convert legacy per-document files to the current formats: `index.pkl` to the
+memory-mapped index, `chunks.json` to the chunk store, an outdated sentence table to the
+current one; optionally build missing dense indexes and ranked summaries and pack
+document directories into single files.
+
+    python -m app.store.migrate [DATA_DIR] [--remove-pickle] [--remove-chunks-json] [--dense] [--summaries] [--pack]
+"""
+from __future__ import annotations
+from typing import List
+import argparse, json, os
+from pathlib import Path
+
+from .vector import TfidfVectorStore
+from .chunks import ChunkStore
+from .dense import DenseIndex
+from .sentences import SentenceTable
+from .hashed import load_index
+from .storage import PackedStorage
+
+def migrate_document(doc_dir: Path, remove_pickle: bool = False, remove_chunks_json: bool = False,
+                     dense: bool = False, summaries: bool = False) -> bool:
+    migrated = False
+    pkl = doc_dir / "index.pkl"
+    if pkl.exists():
+        out = doc_dir / "index"
+        if not (out / "format.json").exists():
+            TfidfVectorStore.load_pickle(pkl).save(out)
+        if remove_pickle:
+            pkl.unlink()
+        migrated = True
+    legacy = doc_dir / "chunks.json"
+    if legacy.exists():
+        out = doc_dir / "chunks"
+        if not (out / "format.json").exists():
+            with open(legacy, "r", encoding="utf-8") as f:
+                ChunkStore.build([x["text"] for x in json.load(f)]).save(out)
+        if remove_chunks_json:
+            legacy.unlink()
+        migrated = True
+    if ((doc_dir / "sentences" / "format.json").exists() and (doc_dir / "chunks" / "format.json").exists()
+            and SentenceTable.load(doc_dir / "sentences") is None):
+        SentenceTable.build(ChunkStore.load(doc_dir / "chunks")).save(doc_dir / "sentences")
+        migrated = True
+    if dense and (doc_dir / "index" / "format.json").exists() and not (doc_dir / "dense" / "format.json").exists():
+        index = DenseIndex.build(load_index(doc_dir / "index").tfidf_matrix())
+        if index is not None:
+            index.save(doc_dir / "dense")
+            migrated = True
+    if summaries and (doc_dir / "chunks" / "format.json").exists() and not (doc_dir / "summary.json").exists():
+        from ..services.summarizer import summarize_stored  # the ranking lives with the summarizer
+        summarize_stored(ChunkStore.load(doc_dir / "chunks"), SentenceTable.load(doc_dir / "sentences")).save(
+            doc_dir / "summary.json")
+        migrated = True
+    return migrated
+
+def migrate_all(data_dir: str, remove_pickle: bool = False, remove_chunks_json: bool = False,
+                dense: bool = False, pack: bool = False, summaries: bool = False) -> List[str]:
+    base = Path(data_dir)
+    if not base.exists():
+        return []
+    migrated = []
+    for child in sorted(base.iterdir()):
+        if not child.is_dir() or child.name.startswith("."):
+            continue
+        changed = migrate_document(child, remove_pickle, remove_chunks_json, dense, summaries)
+        if pack and (child / "meta.json").exists():
+            # index.pkl / chunks.json are only read from directories, so they are converted first;
+            # summary.json too, since serving a packed document never writes to it
+            migrate_document(child, remove_pickle=True, remove_chunks_json=True, summaries=True)
+            PackedStorage(data_dir).pack(child.name)
+            changed = True
+        if changed:
+            migrated.append(child.name)
+    return migrated
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("data_dir", nargs="?", default=os.getenv("DATA_DIR", "app/data"))
+    parser.add_argument("--remove-pickle", action="store_true", help="delete index.pkl after converting")
+    parser.add_argument("--remove-chunks-json", action="store_true", help="delete chunks.json after converting")
+    parser.add_argument("--dense", action="store_true", help="build the dense (LSA) index where it is missing")
+    parser.add_argument("--summaries", action="store_true", help="save the ranked summary (summary.json) where it is missing")
+    parser.add_argument("--pack", action="store_true", help="convert document directories into single packed files")
+    args = parser.parse_args(argv)
+    done = migrate_all(args.data_dir, args.remove_pickle, args.remove_chunks_json, args.dense, args.pack, args.summaries)
+    print(f"Migrated {len(done)} document(s) in {args.data_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+Single-file document container (`<doc_id>.pdoc`): every file of a document directory
+as one checksummed section, written under a temporary name and renamed into place, and
+read through a single memory map.
+
+    python -m app.store.packed verify FILE...
+    python -m app.store.packed unpack FILE DEST
+
+Layout: header (MAGIC, version), the sections (each starting at a multiple of
+PACK_ALIGN so arrays are used in place), the section table (JSON: name, offset, size,
+crc32 per section) and a trailer (table offset, length and crc32, MAGIC).
+"""
+from __future__ import annotations
+from typing import Dict, Iterable, List, Tuple, Union
+import argparse, io, json, mmap, os, struct, zlib
+from pathlib import Path
+import numpy as np
+
+PACK_MAGIC = b"PDFQAPK\x00"
+PACK_VERSION = 1
+PACK_ALIGN = 64
+PACK_SUFFIX = ".pdoc"
+_HEADER = struct.Struct("<8sII")    # magic, version, reserved
+_TRAILER = struct.Struct("<QII8s")  # table offset, table length, table crc32, magic
+_COPY_BLOCK = 1024 * 1024
+
+class PackCorrupt(RuntimeError):
+    pass
+
+# ---------- Writing ----------
+def write_pack(path: Path, files: Iterable[Tuple[str, Path]]):
+    """Write `(section name, file)` pairs as the container at `path`, atomically."""
+    path = Path(path)
+    tmp = path.with_name(f"{path.name}.tmp{os.getpid()}")
+    sections: List[Dict] = []
+    try:
+        with open(tmp, "wb") as out:
+            out.write(_HEADER.pack(PACK_MAGIC, PACK_VERSION, 0))
+            for name, src in files:
+                out.write(b"\0" * (-out.tell() % PACK_ALIGN))
+                offset, crc = out.tell(), 0
+                with open(src, "rb") as f:
+                    while True:
+                        block = f.read(_COPY_BLOCK)
+                        if not block:
+                            break
+                        crc = zlib.crc32(block, crc)
+                        out.write(block)
+                sections.append({"name": name, "offset": offset, "size": out.tell() - offset, "crc32": crc})
+            table = json.dumps({"version": PACK_VERSION, "sections": sections}).encode("utf-8")
+            table_offset = out.tell()
+            out.write(table)
+            out.write(_TRAILER.pack(table_offset, len(table), zlib.crc32(table), PACK_MAGIC))
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+def pack_directory(src: Path, path: Path):
+    """Pack every file under `src` (section names are their relative paths)."""
+    src = Path(src)
+    files = sorted(p for p in src.rglob("*") if p.is_file() and ".tmp" not in p.name)
+    write_pack(path, [(p.relative_to(src).as_posix(), p) for p in files])
+
+# ---------- Reading ----------
+class PackedFile:
+    """A container mapped once; sections are views into the map (small ones are checksummed on read)."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < _HEADER.size + _TRAILER.size:
+                raise PackCorrupt(f"{self.path}: truncated")
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _ = _HEADER.unpack_from(self._map, 0)
+        table_offset, table_len, table_crc, tail = _TRAILER.unpack_from(self._map, size - _TRAILER.size)
+        if magic != PACK_MAGIC or tail != PACK_MAGIC or version != PACK_VERSION:
+            raise PackCorrupt(f"{self.path}: not a v{PACK_VERSION} document container")
+        table = self._map[table_offset:table_offset + table_len]
+        if table_offset + table_len > size - _TRAILER.size or zlib.crc32(table) != table_crc:
+            raise PackCorrupt(f"{self.path}: bad section table")
+        self.sections: Dict[str, Dict] = {s["name"]: s for s in json.loads(table)["sections"]}
+        if any(s["offset"] + s["size"] > table_offset for s in self.sections.values()):
+            raise PackCorrupt(f"{self.path}: section past the end of the data")
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.sections
+
+    def _section(self, name: str) -> Dict:
+        try:
+            return self.sections[name]
+        except KeyError:
+            raise FileNotFoundError(f"{self.path}:{name}") from None
+
+    def read_bytes(self, name: str) -> bytes:
+        s = self._section(name)
+        data = self._map[s["offset"]:s["offset"] + s["size"]]
+        if zlib.crc32(data) != s["crc32"]:
+            raise PackCorrupt(f"{self.path}:{name}: checksum mismatch")
+        return data
+
+    def raw(self, name: str, dtype, count: int, copy: bool = False) -> np.ndarray:
+        s = self._section(name)
+        arr = np.frombuffer(self._map, dtype=dtype, count=count, offset=s["offset"]) if count else np.zeros(0, dtype)
+        return arr.copy() if copy else arr
+
+    def array(self, name: str, copy: bool = False) -> np.ndarray:
+        """An .npy section as an array over the map."""
+        s = self._section(name)
+        head = io.BytesIO(self._map[s["offset"]:s["offset"] + min(s["size"], 65536)])
+        major, _ = np.lib.format.read_magic(head)
+        read_header = np.lib.format.read_array_header_1_0 if major == 1 else np.lib.format.read_array_header_2_0
+        shape, fortran, dtype = read_header(head)
+        arr = np.ndarray(shape, dtype=dtype, buffer=self._map, offset=s["offset"] + head.tell(),
+                         order="F" if fortran else "C")
+        return arr.copy() if copy else arr
+
+    def verify(self) -> List[str]:
+        """Names of the sections whose checksum does not match."""
+        return [name for name, s in self.sections.items()
+                if zlib.crc32(memoryview(self._map)[s["offset"]:s["offset"] + s["size"]]) != s["crc32"]]
+
+    def unpack(self, dest: Path):
+        dest = Path(dest)
+        for name in self.sections:
+            out = dest / name
+            out.parent.mkdir(parents=True, exist_ok=True)
+            with open(out, "wb") as f:
+                f.write(self.read_bytes(name))
+
+# ---------- Sources: what the stores' load() methods read from ----------
+class DirSource:
+    """Files under a directory."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def __str__(self) -> str:
+        return str(self.root)
+
+    def sub(self, name: str) -> "DirSource":
+        return DirSource(self.root / name)
+
+    def exists(self, name: str) -> bool:
+        return (self.root / name).exists()
+
+    def size(self, name: str) -> int:
+        return os.path.getsize(self.root / name)
+
+    def text(self, name: str) -> str:
+        with open(self.root / name, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def json(self, name: str):
+        return json.loads(self.text(name))
+
+    def array(self, name: str, mmap: bool = True) -> np.ndarray:
+        return np.load(self.root / name, mmap_mode="r" if mmap else None)
+
+    def raw(self, name: str, dtype, count: int, mmap: bool = True) -> np.ndarray:
+        # the files may hold bytes past `count` from an interrupted append; they are ignored
+        if count == 0:
+            return np.zeros(0, dtype=dtype)
+        if mmap:
+            return np.memmap(self.root / name, dtype=dtype, mode="r", shape=(count,))
+        return np.fromfile(self.root / name, dtype=dtype, count=count)
+
+class PackSource:
+    """Sections of a packed container under a name prefix (a subdirectory of the packed document)."""
+
+    def __init__(self, pack: PackedFile, prefix: str = ""):
+        self.pack = pack
+        self.prefix = prefix
+
+    def __str__(self) -> str:
+        return f"{self.pack.path}:{self.prefix}"
+
+    def sub(self, name: str) -> "PackSource":
+        return PackSource(self.pack, f"{self.prefix}{name}/")
+
+    def exists(self, name: str) -> bool:
+        return self.prefix + name in self.pack
+
+    def size(self, name: str) -> int:
+        return self.pack._section(self.prefix + name)["size"]
+
+    def text(self, name: str) -> str:
+        return self.pack.read_bytes(self.prefix + name).decode("utf-8")
+
+    def json(self, name: str):
+        return json.loads(self.text(name))
+
+    def array(self, name: str, mmap: bool = True) -> np.ndarray:
+        return self.pack.array(self.prefix + name, copy=not mmap)
+
+    def raw(self, name: str, dtype, count: int, mmap: bool = True) -> np.ndarray:
+        return self.pack.raw(self.prefix + name, dtype, count, copy=not mmap)
+
+Source = Union[DirSource, PackSource]
+
+def as_source(path: Union[Path, str, Source]) -> Source:
+    return path if isinstance(path, (DirSource, PackSource)) else DirSource(Path(path))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    verify = sub.add_parser("verify", help="check every section's checksum")
+    verify.add_argument("files", nargs="+")
+    unpack = sub.add_parser("unpack", help="write the sections out as a document directory")
+    unpack.add_argument("file")
+    unpack.add_argument("dest")
+    args = parser.parse_args(argv)
+    if args.cmd == "unpack":
+        PackedFile(args.file).unpack(Path(args.dest))
+        return 0
+    failed = 0
+    for name in args.files:
+        try:
+            bad = PackedFile(name).verify()
+        except PackCorrupt as e:
+            bad = [str(e)]
+        print(f"{name}: {'ok' if not bad else 'BAD ' + ', '.join(bad)}")
+        failed += bool(bad)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
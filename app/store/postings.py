@@ -0,0 +1,134 @@
+from __future__ import annotations
+from typing import Optional, Tuple, Union
+from pathlib import Path
+import numpy as np
+
+from .packed import Source, as_source
+
+def select_top_k(scores: np.ndarray, k: int, ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The k highest scores in descending order, ties broken by ascending id, via
+    argpartition (O(n)) plus a sort of only the k selected entries.
+    """
+    ids = np.arange(len(scores)) if ids is None else ids
+    k = min(k, len(scores))
+    if k <= 0:
+        return scores[:0], ids[:0].astype(np.int64)
+    if len(scores) > k:
+        part = np.argpartition(-scores, k - 1)[:k]
+        kth = scores[part].min()
+        # argpartition picks arbitrarily among scores equal to the k-th; keep the lowest ids
+        above = np.flatnonzero(scores > kth)
+        tied = np.flatnonzero(scores == kth)
+        tied = tied[np.argsort(ids[tied], kind="stable")][: k - len(above)]
+        part = np.concatenate([above, tied])
+        scores, ids = scores[part], ids[part]
+    sel = np.lexsort((ids, -scores))
+    return scores[sel], ids[sel].astype(np.int64)
+
+class PostingIndex:
+    """
+    Column-major (inverted) view of a TF-IDF matrix for pruned top-k search.
+
+    For every term: the ascending chunk ids containing it (`rows`), the weights there
+    (`weights`) and the largest of those weights (`term_max`). Query cost is driven by
+    the query terms' posting lengths rather than the number of chunks.
+    """
+
+    FILES = ("post_indptr.npy", "post_rows.npy", "post_weights.npy", "term_max.npy")
+
+    def __init__(self, indptr: np.ndarray, rows: np.ndarray, weights: np.ndarray, term_max: np.ndarray, n_docs: int):
+        self.indptr = indptr
+        self.rows = rows
+        self.weights = weights
+        self.term_max = term_max
+        self.n_docs = n_docs
+
+    @classmethod
+    def from_matrix(cls, matrix) -> "PostingIndex":
+        csc = matrix.tocsc()
+        csc.sort_indices()
+        indptr = csc.indptr.astype(np.int64)
+        weights = csc.data.astype(np.float32)
+        term_max = np.zeros(csc.shape[1], dtype=np.float32)
+        nonempty = np.diff(indptr) > 0
+        if weights.size:
+            term_max[nonempty] = np.maximum.reduceat(weights, indptr[:-1][nonempty])
+        return cls(indptr, csc.indices.astype(np.int32), weights, term_max, csc.shape[0])
+
+    def nbytes(self) -> int:
+        return self.indptr.nbytes + self.rows.nbytes + self.weights.nbytes + self.term_max.nbytes
+
+    def save(self, path: Path):
+        for name, arr in zip(self.FILES, (self.indptr, self.rows, self.weights, self.term_max)):
+            np.save(Path(path) / name, arr)
+
+    @classmethod
+    def exists(cls, path: Union[Path, Source]) -> bool:
+        src = as_source(path)
+        return all(src.exists(name) for name in cls.FILES)
+
+    @classmethod
+    def load(cls, path: Union[Path, Source], n_docs: int, mmap: bool = True) -> "PostingIndex":
+        src = as_source(path)
+        return cls(*(src.array(name, mmap) for name in cls.FILES), n_docs=n_docs)
+
+    def top_k(self, q_cols: np.ndarray, q_vals: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Exact top-k by dot product using MaxScore pruning.
+
+        Terms are visited in decreasing order of their score upper bound (query weight x
+        term_max). While the bounds of the unvisited terms could still lift an unseen chunk
+        into the top k, whole posting lists are merged into the candidate set; after that,
+        remaining terms only update existing candidates (binary search into the posting
+        list), and candidates that can no longer reach the k-th score are dropped.
+        """
+        k = min(k, self.n_docs)
+        if k <= 0:
+            return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+
+        ub = q_vals * self.term_max[q_cols]
+        order = np.argsort(-ub, kind="stable")
+        cols, vals, ub = q_cols[order], q_vals[order], ub[order]
+        remaining = np.concatenate([np.cumsum(ub[::-1])[::-1], [0.0]])  # remaining[i] = sum(ub[i:])
+
+        cand = np.zeros(0, dtype=np.int32)
+        scores = np.zeros(0, dtype=np.float32)
+        theta = 0.0
+        for i, (t, qv) in enumerate(zip(cols, vals)):
+            lo, hi = self.indptr[t], self.indptr[t + 1]
+            if hi == lo:
+                continue
+            rows = self.rows[lo:hi]
+            w = self.weights[lo:hi] * qv
+            if len(cand) >= k and theta > remaining[i]:
+                # Non-essential term: an unseen chunk scores at most remaining[i] < theta.
+                pos = np.searchsorted(rows, cand)
+                pos_c = np.minimum(pos, len(rows) - 1)
+                hit = rows[pos_c] == cand
+                scores = scores + np.where(hit, w[pos_c], 0.0).astype(np.float32)
+                keep = scores + remaining[i + 1] >= theta
+                if not keep.all():
+                    cand, scores = cand[keep], scores[keep]
+            else:
+                # Essential term: merge its whole posting list into the candidates.
+                merged = np.concatenate([cand, rows])
+                uniq, inv = np.unique(merged, return_inverse=True)
+                scores = np.bincount(inv, weights=np.concatenate([scores, w]), minlength=len(uniq)).astype(np.float32)
+                cand = uniq.astype(np.int32)
+            if len(cand) >= k:
+                theta = float(np.partition(scores, len(scores) - k)[len(scores) - k])
+
+        top, idxs = select_top_k(scores, k, cand)
+
+        if len(idxs) < k:
+            # Pad with zero-score chunks in index order, as a full sort would.
+            taken = set(idxs.tolist())
+            pad, j = [], 0
+            while len(pad) < k - len(idxs):
+                if j not in taken:
+                    pad.append(j)
+                j += 1
+            idxs = np.concatenate([idxs, np.asarray(pad, dtype=np.int64)])
+            top = np.concatenate([top, np.zeros(len(pad), dtype=np.float32)])
+        return top, idxs
@@ -0,0 +1,178 @@
+from __future__ import annotations
+from typing import Iterable, List, Optional, Sequence, Union
+import json, os, re, shutil
+from pathlib import Path
+import numpy as np
+
+from .packed import Source, as_source
+from .vector import TermTable
+
+SENTENCES_FORMAT_VERSION = 2
+
+# Same splitting and token normalization as the regex-based retriever.stitch_answer
+_SENT_BOUNDARY_RE = re.compile(r"(?<=[.!?])\s+")
+# The summarizer (like ingest's sentence splitter) only breaks before an uppercase letter, digit or quote,
+# so "approx. five" stays one summary sentence
+_SUMMARY_HEAD_RE = re.compile(r"[A-Z0-9\"']")
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]")
+
+def normalize_tokens(text: str) -> List[str]:
+    toks = (_NON_ALNUM_RE.sub("", t) for t in text.lower().split())
+    return [t for t in toks if t]
+
+class SentenceTable:
+    """
+    Per-chunk sentence boundaries plus normalized token ids, built once at ingest.
+
+    chunk_ptr[c]:chunk_ptr[c+1] are the sentences of chunk c; spans[s] is sentence s's
+    (start, end) character range in its chunk; tok_ids[tok_ptr[s]:tok_ptr[s+1]] are its
+    tokens as positions in the sorted `vocab`.
+
+    Summary sentences are runs of those: sum_ptr[k]:sum_ptr[k+1] are the sentences of
+    summary sentence k (a new one starts each chunk and at each break the summarizer's
+    rule accepts), and sum_words[k] is its whitespace word count.
+    """
+
+    FILES = ("chunk_ptr.npy", "spans.npy", "tok_ptr.npy", "tok_ids.npy", "vocab.npy", "vocab_offsets.npy",
+             "sum_ptr.npy", "sum_words.npy")
+
+    def __init__(self, chunk_ptr: np.ndarray, spans: np.ndarray, tok_ptr: np.ndarray, tok_ids: np.ndarray, vocab: TermTable,
+                 sum_ptr: np.ndarray, sum_words: np.ndarray):
+        self.chunk_ptr = chunk_ptr
+        self.spans = spans
+        self.tok_ptr = tok_ptr
+        self.tok_ids = tok_ids
+        self.vocab = vocab
+        self.sum_ptr = sum_ptr
+        self.sum_words = sum_words
+
+    @classmethod
+    def build(cls, chunks: Sequence[str]) -> "SentenceTable":
+        chunk_ptr = [0]
+        spans: List[tuple] = []
+        sent_tokens: List[List[str]] = []
+        sum_ptr: List[int] = []
+        sum_words: List[int] = []
+        vocab_set = set()
+        for chunk in chunks:
+            body = chunk.strip()
+            offset = len(chunk) - len(chunk.lstrip())
+            bounds, start = [], 0
+            for m in _SENT_BOUNDARY_RE.finditer(body):
+                bounds.append((offset + start, offset + m.start()))
+                start = m.end()
+            bounds.append((offset + start, offset + len(body)))
+            for j, (a, b) in enumerate(bounds):
+                toks = normalize_tokens(chunk[a:b])
+                sent_tokens.append(toks)
+                vocab_set.update(toks)
+                if j == 0 or _SUMMARY_HEAD_RE.match(chunk, a):
+                    sum_ptr.append(len(spans) + j)
+                    sum_words.append(0)
+                sum_words[-1] += len(chunk[a:b].split())
+            spans.extend(bounds)
+            chunk_ptr.append(len(spans))
+        sum_ptr.append(len(spans))
+
+        # ids are positions in the sorted vocabulary, so a TermTable can look them up
+        vocab = sorted(vocab_set)
+        ids = {t: i for i, t in enumerate(vocab)}
+        tok_ptr = np.zeros(len(sent_tokens) + 1, dtype=np.int64)
+        if sent_tokens:
+            np.cumsum([len(t) for t in sent_tokens], out=tok_ptr[1:])
+        tok_ids = np.fromiter((ids[t] for toks in sent_tokens for t in toks), dtype=np.int32, count=int(tok_ptr[-1]))
+        return cls(
+            np.asarray(chunk_ptr, dtype=np.int64),
+            np.asarray(spans, dtype=np.int32).reshape(-1, 2),
+            tok_ptr,
+            tok_ids,
+            TermTable.from_terms(vocab),
+            np.asarray(sum_ptr, dtype=np.int64),
+            np.asarray(sum_words, dtype=np.int32),
+        )
+
+    def extend(self, chunks: Sequence[str]) -> "SentenceTable":
+        """
+        A table covering this one's chunks followed by `chunks`. Only the new chunks are
+        split and tokenized; existing token ids are remapped into the merged vocabulary.
+        """
+        new = SentenceTable.build(chunks)
+        old_terms = [self.vocab.term(i) for i in range(len(self.vocab))]
+        new_terms = [new.vocab.term(i) for i in range(len(new.vocab))]
+        vocab = sorted(set(old_terms).union(new_terms))
+        ids = {t: i for i, t in enumerate(vocab)}
+        old_map = np.array([ids[t] for t in old_terms], dtype=np.int32)
+        new_map = np.array([ids[t] for t in new_terms], dtype=np.int32)
+        return SentenceTable(
+            np.concatenate([self.chunk_ptr, new.chunk_ptr[1:] + len(self.spans)]),
+            np.concatenate([self.spans, new.spans]),
+            np.concatenate([self.tok_ptr, new.tok_ptr[1:] + self.tok_ptr[-1]]),
+            np.concatenate([old_map[self.tok_ids], new_map[new.tok_ids]]).astype(np.int32),
+            TermTable.from_terms(vocab),
+            np.concatenate([self.sum_ptr, new.sum_ptr[1:] + len(self.spans)]),
+            np.concatenate([self.sum_words, new.sum_words]),
+        )
+
+    def nbytes(self) -> int:
+        return (self.chunk_ptr.nbytes + self.spans.nbytes + self.tok_ptr.nbytes + self.tok_ids.nbytes
+                + self.vocab.nbytes + self.sum_ptr.nbytes + self.sum_words.nbytes)
+
+    def sentence(self, chunks: Sequence[str], s: int) -> str:
+        c = int(np.searchsorted(self.chunk_ptr, s, side="right")) - 1
+        a, b = self.spans[s]
+        return chunks[c][a:b]
+
+    def summary_sentence(self, chunks: Sequence[str], k: int) -> str:
+        first, last = int(self.sum_ptr[k]), int(self.sum_ptr[k + 1]) - 1
+        c = int(np.searchsorted(self.chunk_ptr, first, side="right")) - 1
+        return chunks[c][self.spans[first][0]:self.spans[last][1]]
+
+    def score(self, query_tokens: Iterable[str], chunk_idxs: Sequence[int]):
+        """
+        Overlap score (query-token occurrences) of every sentence of the given chunks,
+        in chunk order. Returns (sentence ids, scores).
+        """
+        sent_ids = np.concatenate(
+            [np.arange(self.chunk_ptr[c], self.chunk_ptr[c + 1]) for c in chunk_idxs]
+        ) if len(chunk_idxs) else np.zeros(0, dtype=np.int64)
+        q_ids = np.array([i for i in (self.vocab.lookup(t) for t in set(query_tokens)) if i >= 0], dtype=np.int32)
+        if not len(sent_ids) or not len(q_ids):
+            return sent_ids, np.zeros(len(sent_ids))
+        starts = self.tok_ptr[sent_ids]
+        lens = self.tok_ptr[sent_ids + 1] - starts
+        # flat positions of every token of the selected sentences
+        owner = np.repeat(np.arange(len(sent_ids)), lens)
+        pos = np.arange(int(lens.sum())) - np.repeat(np.cumsum(lens) - lens, lens) + np.repeat(starts, lens)
+        hits = np.isin(self.tok_ids[pos], q_ids)
+        return sent_ids, np.bincount(owner, weights=hits, minlength=len(sent_ids))
+
+    # ----- persistence -----
+    def save(self, path: Path):
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        arrays = (self.chunk_ptr, self.spans, self.tok_ptr, self.tok_ids, self.vocab.blob, self.vocab.offsets,
+                  self.sum_ptr, self.sum_words)
+        for name, arr in zip(self.FILES, arrays):
+            np.save(tmp / name, arr)
+        with open(tmp / "format.json", "w", encoding="utf-8") as f:
+            json.dump({"version": SENTENCES_FORMAT_VERSION}, f)
+        if path.exists():
+            shutil.rmtree(path)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Union[Path, Source], mmap: bool = True) -> Optional["SentenceTable"]:
+        """
+        None when the document predates sentence tables, or summary sentences (version 1):
+        callers fall back to regex splitting, or build the table from the chunks.
+        """
+        src = as_source(path)
+        try:
+            if src.json("format.json").get("version") != SENTENCES_FORMAT_VERSION:
+                return None
+        except FileNotFoundError:
+            return None
+        chunk_ptr, spans, tok_ptr, tok_ids, blob, offsets, sum_ptr, sum_words = (src.array(n, mmap) for n in cls.FILES)
+        return cls(chunk_ptr, spans, tok_ptr, tok_ids, TermTable(blob, offsets), sum_ptr, sum_words)
@@ -0,0 +1,256 @@
+"""
+Where documents live under DATA_DIR. Readers go through a DocumentStorage, which finds
+a document in either layout; new documents are written in DOCUMENT_STORAGE's:
+
+- dir: `<doc_id>`, a symlink to `.generations/<doc_id>/<n>/` with one file per component
+  (an append edits a copy of the current generation)
+- packed: `<doc_id>.pdoc`, one checksummed container (see app.store.packed; appends rewrite it)
+
+A new or edited document is assembled in a staging directory and committed with one
+atomic rename (of the packed file, or of the symlink over the old one), so a crash
+leaves either the old or the new document, never a mix. Commits and edits of one
+document are serialized by an flock.
+"""
+from __future__ import annotations
+from typing import Dict, Iterator, List, Optional
+import fcntl, os, shutil, tempfile, threading, time
+from contextlib import contextmanager
+from pathlib import Path
+
+from .packed import PACK_SUFFIX, DirSource, PackedFile, PackSource, Source, pack_directory
+
+DOCUMENT_STORAGE = os.getenv("DOCUMENT_STORAGE", "dir")  # dir | packed: layout new documents are written in
+STAGING_DIR = ".staging"
+GENERATIONS_DIR = ".generations"
+LOCKS_DIR = ".locks"
+_LEGACY_GENERATION = "0" * 20  # a plain `<doc_id>/` directory from before generations, when converted
+
+# A re-ingest or append rewrites these files, which changes their mtime/size
+_DIR_GENERATION_FILES = ("index/format.json", "index.pkl", "chunks/format.json", "chunks.json", "facts.json",
+                         "sentences/format.json", "dense/format.json", "summary.json", "meta.json")
+
+class DocumentNotFound(FileNotFoundError):
+    pass
+
+class DocumentStorage:
+    """Reads documents in either layout; subclasses commit new documents in theirs."""
+
+    layout = ""
+
+    def __init__(self, data_dir: str):
+        self.data_dir = Path(data_dir)
+
+    def location(self, doc_id: str) -> Path:
+        """The document's key in caches (its directory, whether or not it is packed)."""
+        return self.data_dir / doc_id
+
+    def pack_path(self, doc_id: str) -> Path:
+        return self.data_dir / (doc_id + PACK_SUFFIX)
+
+    def exists(self, doc_id: str) -> bool:
+        return (self.pack_path(doc_id).exists() or (self.location(doc_id) / "meta.json").exists()
+                or self._recover(doc_id))
+
+    def source(self, doc_id: str) -> Source:
+        pack = self.pack_path(doc_id)
+        if pack.exists():
+            try:
+                return PackSource(PackedFile(pack))
+            except FileNotFoundError:
+                pass  # deleted meanwhile
+        if (self.location(doc_id) / "meta.json").exists() or self._recover(doc_id):
+            # resolved once, so every file of a load comes from the same generation
+            return DirSource(self.location(doc_id).resolve())
+        raise DocumentNotFound(f"Document {doc_id} not found")
+
+    def generation(self, doc_id: str):
+        try:
+            st = os.stat(self.pack_path(doc_id))
+            return ("packed", st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            pass
+        try:
+            link: Optional[str] = os.readlink(self.location(doc_id))
+        except OSError:
+            link = None  # missing, or a directory from before generations
+        gen = [link]
+        for name in _DIR_GENERATION_FILES:
+            try:
+                st = os.stat(self.location(doc_id) / name)
+                gen.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                gen.append(None)
+        return tuple(gen)
+
+    def read_meta(self, doc_id: str) -> Dict:
+        return self.source(doc_id).json("meta.json")
+
+    def doc_ids(self) -> List[str]:
+        if not self.data_dir.exists():
+            return []
+        ids = set()
+        for child in self.data_dir.iterdir():
+            if child.name.startswith("."):
+                continue
+            if child.name.endswith(PACK_SUFFIX) and child.is_file():
+                ids.add(child.name[:-len(PACK_SUFFIX)])
+            elif (child / "meta.json").exists():
+                ids.add(child.name)
+        generations = self.data_dir / GENERATIONS_DIR
+        if generations.exists():
+            ids.update(g.name for g in generations.iterdir() if g.name not in ids and self._recover(g.name))
+        return sorted(ids)
+
+    def delete(self, doc_id: str):
+        with self._locked(doc_id):
+            self.pack_path(doc_id).unlink(missing_ok=True)
+            self._remove_dir(doc_id)
+        (self.data_dir / LOCKS_DIR / f"{doc_id}.lock").unlink(missing_ok=True)
+
+    # ----- directory generations -----
+    def _generations(self, doc_id: str) -> Path:
+        return self.data_dir / GENERATIONS_DIR / doc_id
+
+    def _link(self, doc_id: str, generation: Path):
+        """Point `<doc_id>` at `generation` with one rename over the previous link."""
+        tmp = self.data_dir / GENERATIONS_DIR / f"{doc_id}.{os.getpid()}.{threading.get_ident()}.link"
+        tmp.unlink(missing_ok=True)
+        os.symlink(os.path.relpath(generation, self.data_dir), tmp)
+        os.replace(tmp, self.location(doc_id))
+
+    def _recover(self, doc_id: str) -> bool:
+        """
+        Relink a directory document whose link is missing after a crash: while a plain directory
+        was moved to its first generation, or, in older releases, between the two renames of a
+        re-save (which left the document as `.staging/<doc_id>-*/old`). True if it is back.
+        """
+        if not doc_id or "/" in doc_id or doc_id.startswith(".") or os.path.lexists(self.location(doc_id)):
+            return False  # not a document name; present; or a dangling link left by an interrupted delete
+        generations = self._generations(doc_id)
+        found = sorted(g for g in generations.iterdir() if (g / "meta.json").exists()) if generations.is_dir() else []
+        if not found:
+            staging = self.data_dir / STAGING_DIR
+            orphans = [d / "old" for d in staging.iterdir()
+                       if d.name.startswith(f"{doc_id}-") and (d / "old" / "meta.json").exists()] if staging.is_dir() else []
+            if not orphans:
+                return False
+            self._generations(doc_id).mkdir(parents=True, exist_ok=True)
+            found = [self._generations(doc_id) / _LEGACY_GENERATION]
+            os.replace(orphans[0], found[0])
+        self._link(doc_id, found[-1])
+        return True
+
+    def _remove_dir(self, doc_id: str):
+        # generations first: an interrupted delete leaves a dangling link, which is not recovered
+        shutil.rmtree(self._generations(doc_id), ignore_errors=True)
+        location = self.location(doc_id)
+        if location.is_symlink():
+            location.unlink(missing_ok=True)
+        else:
+            shutil.rmtree(location, ignore_errors=True)
+
+    # ----- writers -----
+    @contextmanager
+    def _locked(self, doc_id: str) -> Iterator[None]:
+        lock_dir = self.data_dir / LOCKS_DIR
+        lock_dir.mkdir(parents=True, exist_ok=True)
+        with open(lock_dir / f"{doc_id}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+    def _staging(self, doc_id: str) -> Path:
+        root = self.data_dir / STAGING_DIR
+        root.mkdir(parents=True, exist_ok=True)
+        path = Path(tempfile.mkdtemp(prefix=f"{doc_id}-", dir=root))
+        path.chmod(0o755)  # mkdtemp's 0700 would stick to the committed directory
+        return path
+
+    @contextmanager
+    def create(self, doc_id: str) -> Iterator[Path]:
+        """A directory to write the document's files into; committed when the block succeeds."""
+        staging = self._staging(doc_id)
+        try:
+            yield staging
+            with self._locked(doc_id):
+                self._commit(doc_id, staging)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    @contextmanager
+    def edit(self, doc_id: str) -> Iterator[Path]:
+        """The document's files as a directory to modify, in the layout it is stored in."""
+        owner = PackedStorage if self.pack_path(doc_id).exists() else DirectoryStorage
+        with owner(str(self.data_dir))._edit(doc_id) as path:
+            yield path
+
+    def _commit(self, doc_id: str, staging: Path):
+        raise NotImplementedError
+
+    def _edit(self, doc_id: str):
+        raise NotImplementedError
+
+class DirectoryStorage(DocumentStorage):
+    layout = "dir"
+
+    def _commit(self, doc_id: str, staging: Path):
+        # caller holds the document's lock
+        target = self.location(doc_id)
+        generations = self._generations(doc_id)
+        generations.mkdir(parents=True, exist_ok=True)
+        if target.is_dir() and not target.is_symlink():
+            # a directory from before generations becomes the oldest one; a crash before the
+            # link below replaces it leaves the document missing, which _recover repairs
+            os.replace(target, generations / _LEGACY_GENERATION)
+        generation = generations / f"{time.time_ns():020d}"
+        os.replace(staging, generation)
+        self._link(doc_id, generation)
+        self.pack_path(doc_id).unlink(missing_ok=True)
+        for old in generations.iterdir():
+            if old != generation:
+                shutil.rmtree(old, ignore_errors=True)  # readers keep their open files and mmaps
+
+    @contextmanager
+    def _edit(self, doc_id: str) -> Iterator[Path]:
+        # copy-on-write: components append to a copy, and the link moves to it in one rename,
+        # so a crash mid-append leaves the previous generation with consistent row counts
+        with self._locked(doc_id):
+            staging = self._staging(doc_id)
+            try:
+                shutil.copytree(self.location(doc_id), staging, dirs_exist_ok=True)
+                yield staging
+                self._commit(doc_id, staging)
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+
+class PackedStorage(DocumentStorage):
+    layout = "packed"
+
+    def _commit(self, doc_id: str, staging: Path):
+        # caller holds the document's lock
+        pack_directory(staging, self.pack_path(doc_id))
+        self._remove_dir(doc_id)
+
+    def pack(self, doc_id: str):
+        """Replace the document's directory with a packed file."""
+        with self._locked(doc_id):
+            self._commit(doc_id, self.location(doc_id).resolve())
+
+    @contextmanager
+    def _edit(self, doc_id: str) -> Iterator[Path]:
+        # unpack, modify, repack; the lock keeps two editors from dropping each other's changes
+        with self._locked(doc_id):
+            staging = self._staging(doc_id)
+            try:
+                PackedFile(self.pack_path(doc_id)).unpack(staging)
+                yield staging
+                self._commit(doc_id, staging)
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+
+STORAGE_LAYOUTS = {cls.layout: cls for cls in (DirectoryStorage, PackedStorage)}
+
+def open_storage(data_dir: str, layout: str = "") -> DocumentStorage:
+    """The storage under `data_dir`, writing new documents in `layout` (default DOCUMENT_STORAGE)."""
+    layout = layout or DOCUMENT_STORAGE
+    if layout not in STORAGE_LAYOUTS:
+        raise ValueError(f"Unknown DOCUMENT_STORAGE {layout!r}; use one of {sorted(STORAGE_LAYOUTS)}")
+    return STORAGE_LAYOUTS[layout](data_dir)
@@ -1,37 +1,245 @@
 \
 from __future__ import annotations
-from typing import List, Tuple
-import pickle
+from typing import Dict, List, Optional, Sequence, Union
+import json, os, pickle, shutil
+from collections import Counter
 from pathlib import Path
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import numpy as np
+
+from .packed import Source, as_source
+from .postings import PostingIndex, select_top_k
+from ..utils.imports import lazy_import
+
+INDEX_FORMAT = "tfidf-csr"
+INDEX_FORMAT_VERSION = 1
+
+# "auto" uses the pruned posting-list engine once a document has TOPK_PRUNE_MIN_CHUNKS chunks
+TOPK_ENGINE = os.getenv("TOPK_ENGINE", "auto")  # auto | exhaustive | pruned
+TOPK_PRUNE_MIN_CHUNKS = int(os.getenv("TOPK_PRUNE_MIN_CHUNKS", "500"))
+
+VECTORIZER_PARAMS = dict(
+    lowercase=True, stop_words="english", max_df=0.9, min_df=1, ngram_range=(1, 2)
+)
+
+# SciPy and scikit-learn are imported on first use, not with the app (see app.utils.imports)
+def csr_matrix(*args, **kwargs):
+    return lazy_import("scipy.sparse").csr_matrix(*args, **kwargs)
+
+def _tfidf_vectorizer(**params):
+    return lazy_import("sklearn.feature_extraction.text").TfidfVectorizer(**params)
+
+class TermTable:
+    """
+    Sorted vocabulary stored as one UTF-8 blob plus an offsets array.
+
+    Column j of the index is the j-th term in sorted order (the order scikit-learn
+    assigns), so lookups are a binary search and no dict needs to be built on load.
+    UTF-8 byte order equals code point order, so comparing bytes is enough.
+    """
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def from_terms(cls, terms: Sequence[str]) -> "TermTable":
+        encoded = [t.encode("utf-8") for t in terms]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        if encoded:
+            np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(blob, offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def _bytes(self, i: int) -> bytes:
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes()
+
+    def term(self, i: int) -> str:
+        return self._bytes(i).decode("utf-8")
+
+    def lookup(self, term: str) -> int:
+        key = term.encode("utf-8")
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._bytes(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self) and self._bytes(lo) == key:
+            return lo
+        return -1
+
+    @property
+    def nbytes(self) -> int:
+        return self.blob.nbytes + self.offsets.nbytes
+
+def row_dots(rows: csr_matrix, q_indices: np.ndarray, q_data: np.ndarray) -> np.ndarray:
+    """Dot product of each row with a sparse vector (sorted indices), without building its transpose."""
+    if not len(q_indices):
+        return np.zeros(rows.shape[0], dtype=np.float32)
+    pos = np.minimum(np.searchsorted(q_indices, rows.indices), len(q_indices) - 1)
+    weights = np.where(q_indices[pos] == rows.indices, q_data[pos], 0.0) * rows.data
+    owner = np.repeat(np.arange(rows.shape[0]), np.diff(rows.indptr))
+    return np.bincount(owner, weights=weights, minlength=rows.shape[0]).astype(np.float32)
 
 class TfidfVectorStore:
-    def __init__(self, vectorizer: TfidfVectorizer, matrix):
-        self.vectorizer = vectorizer
+    def __init__(self, terms: TermTable, idf: np.ndarray, matrix, params: Optional[Dict] = None,
+                 postings: Optional[PostingIndex] = None):
+        self.terms = terms
+        self.idf = idf
         self.matrix = matrix
+        self.params = dict(params or VECTORIZER_PARAMS)
+        self._postings = postings
+        self._analyzer = None
+
+    @property
+    def postings(self) -> PostingIndex:
+        # Persisted with the index; built on first use for indexes written before it existed.
+        if self._postings is None:
+            self._postings = PostingIndex.from_matrix(self.matrix)
+        return self._postings
 
     @classmethod
     def fit_from_chunks(cls, chunks: List[str]) -> "TfidfVectorStore":
-        vectorizer = TfidfVectorizer(
-            lowercase=True, stop_words="english", max_df=0.9, min_df=1, ngram_range=(1,2)
-        )
+        vectorizer = _tfidf_vectorizer(**VECTORIZER_PARAMS)
         matrix = vectorizer.fit_transform(chunks)
-        return cls(vectorizer, matrix)
+        return cls.from_vectorizer(vectorizer, matrix)
 
-    def top_k(self, query: str, k: int = 5):
-        q = self.vectorizer.transform([query])
-        sims = cosine_similarity(q, self.matrix).flatten()
-        idxs = sims.argsort()[::-1][:k]
-        scores = sims[idxs]
-        return scores, idxs
+    @classmethod
+    def from_vectorizer(cls, vectorizer, matrix) -> "TfidfVectorStore":
+        terms = TermTable.from_terms(vectorizer.get_feature_names_out().tolist())
+        idf = vectorizer.idf_.astype(np.float32)
+        matrix = csr_matrix(matrix, dtype=np.float32)
+        matrix.indices = matrix.indices.astype(np.int32, copy=False)
+        matrix.indptr = matrix.indptr.astype(np.int32, copy=False)
+        params = {k: vectorizer.get_params()[k] for k in VECTORIZER_PARAMS}
+        return cls(terms, idf, matrix, params)
+
+    # ----- query side -----
+    def _analyze(self, text: str) -> List[str]:
+        if self._analyzer is None:
+            # Only the tokenizer/stop-word/n-gram logic is needed; nothing is fitted.
+            self._analyzer = _tfidf_vectorizer(**self.params).build_analyzer()
+        return self._analyzer(text)
+
+    def transform(self, queries: Sequence[str]):
+        """Same result as the fitted TfidfVectorizer.transform: tf * idf, L2-normalized rows."""
+        data: List[float] = []
+        indices: List[int] = []
+        indptr = [0]
+        for q in queries:
+            counts = Counter()
+            for tok in self._analyze(q):
+                j = self.terms.lookup(tok)
+                if j >= 0:
+                    counts[j] += 1
+            cols = sorted(counts)
+            vals = np.array([counts[j] * float(self.idf[j]) for j in cols], dtype=np.float32)
+            norm = float(np.sqrt(np.dot(vals, vals))) if len(vals) else 0.0
+            if norm > 0:
+                vals /= norm
+            indices.extend(cols)
+            data.extend(vals.tolist())
+            indptr.append(len(indices))
+        return csr_matrix(
+            (np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int32)),
+            shape=(len(queries), len(self.terms)),
+        )
 
+    def top_k(self, query: str, k: int = 5, engine: Optional[str] = None):
+        """
+        Highest-scoring chunks for `query` (descending score, ties by chunk order).
+        Rows are L2-normalized, so the dot product is the cosine similarity.
+        """
+        q = self.transform([query])
+        engine = engine or TOPK_ENGINE
+        if engine == "auto":
+            engine = "pruned" if self.matrix.shape[0] >= TOPK_PRUNE_MIN_CHUNKS else "exhaustive"
+        if engine == "pruned":
+            return self.postings.top_k(q.indices, q.data, k)
+        # M @ q.T walks M's rows once; q @ M.T would first transpose the whole matrix
+        sims = (self.matrix @ q.T).toarray().ravel()
+        return select_top_k(sims, k)
+
+    def top_k_batch(self, queries: Sequence[str], k: int = 5):
+        """
+        Score many queries with one sparse product. Rows on both sides are already
+        L2-normalized, so Q @ M.T is the cosine similarity. Returns (scores, idxs), each (n_queries, k).
+        """
+        q = self.transform(queries)
+        sims = (self.matrix @ q.T).T.toarray()
+        top = [select_top_k(row, k) for row in sims]
+        return np.array([s for s, _ in top]), np.array([i for _, i in top])
+
+    def score_rows(self, q, ids: np.ndarray) -> np.ndarray:
+        """Cosine scores of one transformed query (`transform([query])`) against the given chunks only."""
+        return row_dots(self.matrix[ids], q.indices, q.data)
+
+    def tfidf_matrix(self):
+        """L2-normalized TF-IDF rows of every chunk (the stored matrix)."""
+        return self.matrix
+
+    def nbytes(self) -> int:
+        """Approximate size of the index arrays (mmapped pages are shared via the page cache)."""
+        m = self.matrix
+        size = m.data.nbytes + m.indices.nbytes + m.indptr.nbytes + self.idf.nbytes + self.terms.nbytes
+        if self._postings is not None:
+            size += self._postings.nbytes()
+        return size
+
+    # ----- persistence -----
     def save(self, path: Path):
-        with open(path, "wb") as f:
-            pickle.dump({"vectorizer": self.vectorizer, "matrix": self.matrix}, f)
+        """
+        Write the index as a directory of raw .npy arrays that `load` memory-maps.
+        The directory is assembled under a temporary name and renamed into place.
+        """
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        m = self.matrix
+        np.save(tmp / "data.npy", np.asarray(m.data, dtype=np.float32))
+        np.save(tmp / "indices.npy", np.asarray(m.indices, dtype=np.int32))
+        np.save(tmp / "indptr.npy", np.asarray(m.indptr, dtype=np.int32))
+        np.save(tmp / "idf.npy", np.asarray(self.idf, dtype=np.float32))
+        np.save(tmp / "terms.npy", np.asarray(self.terms.blob, dtype=np.uint8))
+        np.save(tmp / "term_offsets.npy", np.asarray(self.terms.offsets, dtype=np.int64))
+        self.postings.save(tmp)
+        header = {
+            "format": INDEX_FORMAT,
+            "version": INDEX_FORMAT_VERSION,
+            "shape": list(m.shape),
+            "params": {k: list(v) if isinstance(v, tuple) else v for k, v in self.params.items()},
+        }
+        with open(tmp / "format.json", "w", encoding="utf-8") as f:
+            json.dump(header, f, indent=2)
+        if path.exists():
+            shutil.rmtree(path)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Union[Path, Source], mmap: bool = True) -> "TfidfVectorStore":
+        if isinstance(path, (str, Path)) and Path(path).suffix == ".pkl":
+            return cls.load_pickle(Path(path))
+        src = as_source(path)
+        header = src.json("format.json")
+        if header.get("format") != INDEX_FORMAT or header.get("version") != INDEX_FORMAT_VERSION:
+            raise RuntimeError(f"Unsupported index format in {src}: {header.get('format')} v{header.get('version')}")
+        arr = lambda name: src.array(name, mmap)
+        matrix = csr_matrix((arr("data.npy"), arr("indices.npy"), arr("indptr.npy")), shape=tuple(header["shape"]), copy=False)
+        terms = TermTable(arr("terms.npy"), arr("term_offsets.npy"))
+        params = dict(header.get("params") or VECTORIZER_PARAMS)
+        if "ngram_range" in params:
+            params["ngram_range"] = tuple(params["ngram_range"])
+        postings = PostingIndex.load(src, n_docs=matrix.shape[0], mmap=mmap) if PostingIndex.exists(src) else None
+        return cls(terms, arr("idf.npy"), matrix, params, postings)
 
     @classmethod
-    def load(cls, path: Path) -> "TfidfVectorStore":
+    def load_pickle(cls, path: Path) -> "TfidfVectorStore":
+        """Legacy `index.pkl` (pickled vectorizer + matrix). Only load files you created."""
         with open(path, "rb") as f:
             obj = pickle.load(f)
-        return cls(obj["vectorizer"], obj["matrix"])
+        return cls.from_vectorizer(obj["vectorizer"], obj["matrix"])
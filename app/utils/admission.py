@@ -0,0 +1,170 @@
+"""
+Admission control: each route class (upload, chat, summary) runs at most N requests at
+once and lets at most Q more wait for a slot. A request that finds the queue full gets
+429 at once; one that waits longer than ADMISSION_WAIT_S gets 503; both carry
+Retry-After. Upload bodies are counted as they arrive and cut off with 413 past
+MAX_UPLOAD_MB, before the multipart parser has spooled the rest.
+"""
+from __future__ import annotations
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+from collections import deque
+import asyncio, json, os, re, time
+
+from fastapi import HTTPException
+
+from .metrics import ADMISSION_REJECTED, observe_stage
+
+# 0 means unlimited; limits are per server process
+UPLOAD_MAX_CONCURRENCY = int(os.getenv("UPLOAD_MAX_CONCURRENCY", "4"))    # uploads/appends receiving their body
+UPLOAD_MAX_QUEUE = int(os.getenv("UPLOAD_MAX_QUEUE", "16"))
+CHAT_MAX_CONCURRENCY = int(os.getenv("CHAT_MAX_CONCURRENCY", "32"))       # chat and search requests
+CHAT_MAX_QUEUE = int(os.getenv("CHAT_MAX_QUEUE", "64"))
+SUMMARY_MAX_CONCURRENCY = int(os.getenv("SUMMARY_MAX_CONCURRENCY", "8"))
+SUMMARY_MAX_QUEUE = int(os.getenv("SUMMARY_MAX_QUEUE", "32"))
+ADMISSION_WAIT_S = float(os.getenv("ADMISSION_WAIT_S", "5"))              # longest wait for a slot before 503
+ADMISSION_RETRY_AFTER_S = int(os.getenv("ADMISSION_RETRY_AFTER_S", "2"))
+MAX_UPLOAD_MB = float(os.getenv("MAX_UPLOAD_MB", "100"))                 # request body limit for uploads; 0: none
+
+class Rejected(Exception):
+    def __init__(self, status: int, detail: str):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+class AdmissionGate:
+    """
+    At most `limit` holders and `max_queue` waiters, admitted in arrival order. Used from
+    one event loop; a freed slot is handed to the oldest waiter directly.
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int, wait_s: float = ADMISSION_WAIT_S):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.wait_s = wait_s
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.admitted = self.queued = self.rejected_full = self.rejected_timeout = 0
+
+    async def acquire(self):
+        if self.limit <= 0 or (self.in_flight < self.limit and not self._waiters):
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_full += 1
+            raise Rejected(429, f"Too many {self.name} requests; try again later")
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        self.queued += 1
+        t0 = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), self.wait_s)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if fut.done() and not fut.cancelled():
+                self.release()  # the slot arrived as we gave up: pass it on
+            else:
+                fut.cancel()
+                self._waiters.remove(fut)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.rejected_timeout += 1
+            raise Rejected(503, f"Server busy: no {self.name} slot within {self.wait_s:g}s") from None
+        finally:
+            observe_stage("admission", self.name, time.perf_counter() - t0)
+        self.admitted += 1
+
+    def release(self):
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)  # in_flight stays: the slot changes hands
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": self.in_flight, "waiting": len(self._waiters), "limit": self.limit,
+            "max_queue": self.max_queue, "admitted": self.admitted, "queued": self.queued,
+            "rejected_full": self.rejected_full, "rejected_timeout": self.rejected_timeout,
+        }
+
+GATES: Dict[str, AdmissionGate] = {
+    "upload": AdmissionGate("upload", UPLOAD_MAX_CONCURRENCY, UPLOAD_MAX_QUEUE),
+    "chat": AdmissionGate("chat", CHAT_MAX_CONCURRENCY, CHAT_MAX_QUEUE),
+    "summary": AdmissionGate("summary", SUMMARY_MAX_CONCURRENCY, SUMMARY_MAX_QUEUE),
+}
+
+# (method, path pattern, route class); other routes are not limited
+ROUTE_CLASSES: List[Tuple[str, re.Pattern, str]] = [
+    ("POST", re.compile(r"^/api/upload$"), "upload"),
+    ("POST", re.compile(r"^/api/docs/[^/]+/append$"), "upload"),
+    ("POST", re.compile(r"^/api/(chat(/[a-z]+)?|search)$"), "chat"),
+    ("GET", re.compile(r"^/api/docs/[^/]+/summary$"), "summary"),
+]
+
+def route_class(method: str, path: str) -> Optional[str]:
+    for m, pattern, name in ROUTE_CLASSES:
+        if m == method and pattern.match(path):
+            return name
+    return None
+
+def admission_samples() -> Iterable[Tuple[Dict[str, str], float]]:
+    return [({"route_class": name, "stat": k}, v) for name, gate in GATES.items() for k, v in gate.stats().items()]
+
+class AdmissionMiddleware:
+    """Plain ASGI, so a streamed chat answer holds its slot until the last chunk is sent."""
+
+    def __init__(self, app, gates: Optional[Dict[str, AdmissionGate]] = None):
+        self.app = app
+        self.gates = GATES if gates is None else gates
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        name = route_class(scope["method"], scope["path"])
+        gate = self.gates.get(name) if name else None
+        if gate is None:
+            return await self.app(scope, receive, send)
+        if name == "upload" and MAX_UPLOAD_MB > 0:
+            limit = int(MAX_UPLOAD_MB * 1024 * 1024)
+            declared = dict(scope["headers"]).get(b"content-length")
+            if declared is not None and declared.isdigit() and int(declared) > limit:
+                return await self._reject(send, name, "too_large", 413, _too_large(limit))
+            receive = _limited(receive, limit)
+        try:
+            await gate.acquire()
+        except Rejected as e:
+            return await self._reject(send, name, "queue_full" if e.status == 429 else "timeout", e.status, e.detail)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release()
+
+    @staticmethod
+    async def _reject(send, name: str, reason: str, status: int, detail: str):
+        ADMISSION_REJECTED.inc(route_class=name, reason=reason)
+        body = json.dumps({"detail": detail}).encode("utf-8")
+        headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        if status != 413:
+            headers.append((b"retry-after", str(ADMISSION_RETRY_AFTER_S).encode()))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+def _too_large(limit: int) -> str:
+    return f"Upload larger than {limit / (1024 * 1024):g} MB (MAX_UPLOAD_MB)"
+
+def _limited(receive, limit: int):
+    """`receive` that fails with 413 once the body passes `limit` bytes."""
+    seen = [0]
+
+    async def wrapper():
+        message = await receive()
+        if message["type"] == "http.request":
+            seen[0] += len(message.get("body", b""))
+            if seen[0] > limit:
+                ADMISSION_REJECTED.inc(route_class="upload", reason="too_large")
+                # FastAPI re-raises an HTTPException from body parsing as the response
+                raise HTTPException(status_code=413, detail=_too_large(limit))
+        return message
+    return wrapper
@@ -0,0 +1,23 @@
+from __future__ import annotations
+from typing import Dict, Iterable, Tuple
+import importlib, sys, threading, time
+
+# Seconds the first import of each deferred module took (scikit-learn and SciPy are not
+# imported by `import app.main`; the first request or the startup warm-up pays for them)
+IMPORT_SECONDS: Dict[str, float] = {}
+
+_lock = threading.Lock()
+
+def lazy_import(name: str):
+    """The module `name`, imported (and timed) on first use."""
+    if name not in IMPORT_SECONDS:
+        with _lock:
+            # checked again under the lock: another thread may have finished the import meanwhile
+            if name not in IMPORT_SECONDS:
+                t0 = time.perf_counter()
+                importlib.import_module(name)
+                IMPORT_SECONDS[name] = time.perf_counter() - t0
+    return sys.modules[name]
+
+def import_samples() -> Iterable[Tuple[Dict[str, str], float]]:
+    return [({"module": name}, seconds) for name, seconds in sorted(IMPORT_SECONDS.items())]
@@ -0,0 +1,209 @@
+from __future__ import annotations
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+import json, logging, math, os, threading, time
+
+# Log one JSON line per request with its stage timings (logger "app.timing")
+TIMING_LOG = os.getenv("TIMING_LOG", "0") == "1"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BYTES_BUCKETS = tuple(2 ** p for p in range(10, 34, 2))  # 1 KiB .. 8 GiB
+
+log = logging.getLogger("app.timing")
+
+# ---------- Metric types (Prometheus text exposition format) ----------
+def _fmt_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _fmt_value(v: float) -> str:
+    if math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_fmt_labels(self.labelnames, k)} {_fmt_value(v)}" for k, v in items]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, upper in enumerate(self.buckets):
+                if value <= upper:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[2] if state else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, ([*s[0]], s[1], s[2])) for k, s in self._values.items())
+        lines = self.header()
+        inf = 'le="+Inf"'
+        for key, (counts, total, n) in items:
+            cumulative = 0
+            for upper, c in zip(self.buckets, counts):
+                cumulative += c
+                le = 'le="' + _fmt_value(upper) + '"'
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, inf)} {n}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {_fmt_value(total)}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {n}")
+        return lines
+
+# A gauge callback returns [(labels, value), ...] when /metrics is scraped
+GaugeCallback = Callable[[], Iterable[Tuple[Dict[str, str], float]]]
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._gauges: List[Tuple[str, str, GaugeCallback]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help: str, callback: GaugeCallback):
+        """A gauge whose samples are read from `callback` at scrape time (e.g. cache sizes)."""
+        self._gauges = [g for g in self._gauges if g[0] != name] + [(name, help, callback)]
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines += metric.render()
+        for name, help, callback in self._gauges:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+            try:
+                samples = list(callback())
+            except Exception:
+                samples = []
+            for labels, value in samples:
+                lines.append(f"{name}{_fmt_labels(list(labels), list(labels.values()))} {_fmt_value(value)}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "pdfqa_stage_seconds", "Time spent per pipeline stage", ("pipeline", "stage")))
+ANSWER_PATH = REGISTRY.register(Counter(
+    "pdfqa_answer_path_total", "Chat answers by the path that produced them", ("path",)))
+DOCUMENT_LOAD_BYTES = REGISTRY.register(Histogram(
+    "pdfqa_document_load_bytes", "Approximate size of documents loaded into the cache", (), BYTES_BUCKETS))
+INGEST_JOBS = REGISTRY.register(Counter(
+    "pdfqa_ingest_jobs_total", "Finished ingestion jobs by outcome", ("status",)))
+ADMISSION_REJECTED = REGISTRY.register(Counter(
+    "pdfqa_admission_rejected_total", "Requests turned away by admission control", ("route_class", "reason")))
+HTTP_SECONDS = REGISTRY.register(Histogram(
+    "pdfqa_http_request_seconds", "HTTP request latency (until the last body chunk)", ("method", "route", "status")))
+
+# ---------- Stage timers ----------
+# Per-request stage timings collected for the structured log (set by MetricsMiddleware)
+_trace: ContextVar[Optional[Dict[str, float]]] = ContextVar("pdfqa_trace", default=None)
+
+def observe_stage(pipeline: str, stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, pipeline=pipeline, stage=stage)
+    trace = _trace.get()
+    if trace is not None:
+        trace[stage] = trace.get(stage, 0.0) + 1000 * seconds
+
+@contextmanager
+def timed(pipeline: str, stage: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(pipeline, stage, time.perf_counter() - t0)
+
+# ---------- ASGI middleware ----------
+class MetricsMiddleware:
+    """
+    Records request latency per route template and, with TIMING_LOG=1, logs one JSON
+    line per request with the stage timings recorded while it ran. Plain ASGI (not
+    BaseHTTPMiddleware) so streamed responses are timed until their last chunk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        trace: Dict[str, float] = {}
+        token = _trace.set(trace)
+        status = [500]
+        t0 = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - t0
+            _trace.reset(token)
+            route = _route_label(scope)
+            HTTP_SECONDS.observe(elapsed, method=scope["method"], route=route, status=status[0])
+            if TIMING_LOG:
+                log.info(json.dumps({
+                    "method": scope["method"], "route": route, "path": scope["path"], "status": status[0],
+                    "ms": round(1000 * elapsed, 3), "stages_ms": {k: round(v, 3) for k, v in trace.items()},
+                }))
+
+def _route_label(scope) -> str:
+    # The route template keeps label cardinality bounded (/api/docs/{doc_id}/summary, not every id)
+    route = scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path
+    return "/static" if scope["path"].startswith("/static/") else "unmatched"
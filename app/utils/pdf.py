@@ -1,7 +1,29 @@
 \
 from __future__ import annotations
+from typing import Iterator, List, Optional, Union
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from io import BytesIO
-import re
+from pathlib import Path
+import multiprocessing as mp
+import os, re, threading, time
+
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PAGES_PER_SHARD = int(os.getenv("PDF_PAGES_PER_SHARD", "32"))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+
+@dataclass
+class PageText:
+    page: int          # 1-based page number
+    text: str
+    seconds: float     # wall time spent extracting this page
+    engine: str        # "pypdf" | "pdfminer" | "none"
+
+# Raw PDF bytes, or the path of a file on disk (preferred for large uploads: nothing is held in memory)
+PdfSource = Union[bytes, str, Path]
+
+def _open(source: PdfSource):
+    return BytesIO(source) if isinstance(source, (bytes, bytearray)) else open(source, "rb")
 
 def normalize_text(text: str) -> str:
     text = text.replace("\x0c", " ").replace("\r", " ")
@@ -9,31 +31,119 @@ def normalize_text(text: str) -> str:
     text = re.sub(r"\n{2,}", "\n", text)
     return text.strip()
 
-def extract_text_from_pdf_bytes(data: bytes) -> str:
-    """
-    Try pypdf first; if empty, fall back to pdfminer.six
-    """
-    # pypdf
-    try:
-        from pypdf import PdfReader  # type: ignore
-        reader = PdfReader(BytesIO(data))
-        pages = []
-        for page in reader.pages:
+# ---------- Per-page extraction ----------
+def _pdfminer_pages(data: PdfSource, page_indexes: List[int]) -> dict:
+    """pdfminer text for the given 0-based pages, parsed in one pass: {index: (text, seconds)}."""
+    from pdfminer.high_level import extract_pages  # type: ignore
+    from pdfminer.layout import LTTextContainer  # type: ignore
+    out = {}
+    wanted = sorted(page_indexes)
+    t0 = time.perf_counter()
+    with _open(data) as fh:
+        for i, layout in zip(wanted, extract_pages(fh, page_numbers=set(wanted))):
+            text = "".join(el.get_text() for el in layout if isinstance(el, LTTextContainer))
+            t1 = time.perf_counter()
+            out[i] = (text, t1 - t0)
+            t0 = t1
+    return out
+
+def _extract_page_range(data: PdfSource, start: int, stop: int) -> List[PageText]:
+    from pypdf import PdfReader  # type: ignore
+    pages: List[PageText] = []
+    with _open(data) as fh:
+        reader = PdfReader(fh)
+        for i in range(start, stop):
+            t0 = time.perf_counter()
             try:
-                pages.append(page.extract_text() or "")
+                text = reader.pages[i].extract_text() or ""
             except Exception:
-                pages.append("")
-        text = "\n".join(pages)
-        if text and len(text.strip()) > 0:
-            return normalize_text(text)
+                text = ""
+            pages.append(PageText(i + 1, text, time.perf_counter() - t0, "pypdf" if text.strip() else "none"))
+
+    # Fall back to pdfminer only for the pages pypdf could not read
+    empty = [p.page - 1 for p in pages if not p.text.strip()]
+    if empty:
+        try:
+            mined = _pdfminer_pages(data, empty)
+        except Exception:
+            mined = {}
+        for p in pages:
+            if p.page - 1 in mined:
+                text, secs = mined[p.page - 1]
+                p.seconds += secs
+                if text.strip():
+                    p.text, p.engine = text, "pdfminer"
+    return pages
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool._max_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            ctx = mp.get_context(os.getenv("INGEST_MP_START", "spawn"))
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=ctx)
+        return _pool
+
+def _count_pages(data: PdfSource) -> Optional[int]:
+    try:
+        from pypdf import PdfReader  # type: ignore
+        with _open(data) as fh:
+            return len(PdfReader(fh).pages)
     except Exception:
-        pass
+        return None
+
+def iter_pages(
+    data: PdfSource,
+    workers: Optional[int] = None,
+    pages_per_shard: int = PDF_PAGES_PER_SHARD,
+    min_pages: int = PDF_PARALLEL_MIN_PAGES,
+) -> Iterator[PageText]:
+    """
+    Yield every page in order. Documents with at least `min_pages` pages are split
+    into shards of `pages_per_shard` pages that run on a process pool; shards are
+    yielded as soon as they and all earlier shards are done.
+    """
+    workers = PDF_EXTRACT_WORKERS if workers is None else workers
+    if isinstance(data, Path):
+        data = str(data)
+    n_pages = _count_pages(data)
 
-    # pdfminer fallback
+    if n_pages is None:
+        # pypdf cannot even open the file: let pdfminer try the whole document
+        try:
+            from pdfminer.high_level import extract_text  # type: ignore
+            t0 = time.perf_counter()
+            with _open(data) as fh:
+                text = extract_text(fh) or ""
+        except Exception as e:
+            raise RuntimeError(f"Could not extract text from PDF: {e}")
+        yield PageText(1, text, time.perf_counter() - t0, "pdfminer")
+        return
+
+    step = max(1, pages_per_shard)
+    if workers <= 1 or n_pages < max(min_pages, 2):
+        for s in range(0, n_pages, step):
+            yield from _extract_page_range(data, s, min(s + step, n_pages))
+        return
+
+    pool = _get_pool(workers)
+    futures = [pool.submit(_extract_page_range, data, s, min(s + step, n_pages)) for s in range(0, n_pages, step)]
     try:
-        from pdfminer.high_level import extract_text  # type: ignore
-        with BytesIO(data) as bio:
-            text = extract_text(bio) or ""
-        return normalize_text(text)
-    except Exception as e:
-        raise RuntimeError(f"Could not extract text from PDF: {e}")
+        for fut in futures:  # submission order == page order
+            yield from fut.result()
+    finally:
+        for fut in futures:
+            fut.cancel()
+
+def extract_pages(data: PdfSource, **kwargs) -> List[PageText]:
+    return list(iter_pages(data, **kwargs))
+
+def extract_text_from_pdf_bytes(data: PdfSource) -> str:
+    """
+    Try pypdf first per page; pages that come back empty are retried with pdfminer.six
+    """
+    return normalize_text("\n".join(p.text for p in iter_pages(data)))
@@ -0,0 +1,136 @@
+from __future__ import annotations
+from typing import Dict, List, Optional
+from pathlib import Path
+import asyncio, cProfile, json, os, pstats, random, re, threading, time
+
+# Off unless a sample rate or a token is configured
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))  # fraction of requests profiled
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")                       # requests sending it in PROFILE_HEADER are profiled
+PROFILE_HEADER = os.getenv("PROFILE_HEADER", "x-profile").lower()
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.getenv("DATA_DIR", "app/data"), ".profiles"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "200"))                 # newest profiles kept
+PROFILE_HOTSPOTS = 15
+PROFILE_BODY_PEEK = 64 * 1024  # JSON request bodies up to this size are searched for a doc_id
+
+# cProfile hooks the calling thread and only one profiler can be active, so one request at a time
+_active = threading.Lock()
+
+def hotspots(profile: cProfile.Profile, n: int = PROFILE_HOTSPOTS) -> List[Dict[str, object]]:
+    """The `n` functions with the most own time."""
+    stats = pstats.Stats(profile).stats
+    rows = sorted(stats.items(), key=lambda kv: kv[1][2], reverse=True)[:n]
+    return [
+        {"function": f"{os.path.basename(file)}:{line}({func})", "calls": nc,
+         "tottime_ms": round(1000 * tt, 3), "cumtime_ms": round(1000 * ct, 3)}
+        for (file, line, func), (cc, nc, tt, ct, callers) in rows
+    ]
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^A-Za-z0-9]+", "-", text).strip("-")[:60] or "root"
+
+def save_profile(profile: cProfile.Profile, route: str, doc_id: Optional[str], status: int, ms: float,
+                 directory: Optional[str] = None, keep: Optional[int] = None) -> Path:
+    """
+    Write `<time>_<route>_<doc_id>.prof` (pstats format) and a `.json` summary with the
+    hotspots next to it, then delete the oldest profiles beyond `keep`.
+    """
+    out = Path(directory or PROFILE_DIR)
+    out.mkdir(parents=True, exist_ok=True)
+    now = time.time()
+    stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime(now)) + f"-{int(now % 1 * 1e6):06d}"
+    name = f"{stamp}_{_slug(route)}_{_slug(doc_id or 'none')}"
+    profile.dump_stats(out / f"{name}.prof")
+    summary = {"name": name, "route": route, "doc_id": doc_id, "status": status, "ms": round(ms, 3),
+               "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now)), "hotspots": hotspots(profile)}
+    with open(out / f"{name}.json", "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    _rotate(out, PROFILE_KEEP if keep is None else keep)
+    return out / f"{name}.prof"
+
+def _rotate(directory: Path, keep: int):
+    summaries = sorted(directory.glob("*.json"))  # names start with a sortable timestamp
+    for old in summaries[: max(0, len(summaries) - keep)]:
+        old.unlink(missing_ok=True)
+        old.with_suffix(".prof").unlink(missing_ok=True)
+
+def list_profiles(directory: Optional[str] = None, limit: int = 50, route: Optional[str] = None,
+                  doc_id: Optional[str] = None) -> List[Dict[str, object]]:
+    """Newest first, optionally filtered by route template or doc_id."""
+    out = []
+    for path in sorted(Path(directory or PROFILE_DIR).glob("*.json"), reverse=True):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                summary = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if (route and summary.get("route") != route) or (doc_id and summary.get("doc_id") != doc_id):
+            continue
+        out.append(summary)
+        if len(out) >= limit:
+            break
+    return out
+
+class ProfilingMiddleware:
+    """
+    Profiles sampled requests (PROFILE_SAMPLE_RATE) and requests whose PROFILE_HEADER
+    carries PROFILE_TOKEN with cProfile, keyed by route template and doc_id (from the
+    path or a JSON body). The profiler sees code on the event loop thread: async handlers
+    and the synchronous work they call (plus anything other requests run on the loop
+    meanwhile); ingestion itself runs in worker processes.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def _wanted(self, scope) -> bool:
+        if PROFILE_TOKEN:
+            for key, value in scope.get("headers", ()):
+                if key.decode("latin-1").lower() == PROFILE_HEADER:
+                    return value.decode("latin-1") == PROFILE_TOKEN
+        return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wanted(scope) or not _active.acquire(blocking=False):
+            return await self.app(scope, receive, send)
+        body = bytearray()
+        json_body = any(k == b"content-type" and v.startswith(b"application/json") for k, v in scope.get("headers", ()))
+        status = [500]
+
+        async def peek_receive():
+            message = await receive()
+            if json_body and message["type"] == "http.request" and len(body) < PROFILE_BODY_PEEK:
+                body.extend(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        profile = cProfile.Profile()
+        t0 = time.perf_counter()
+        try:
+            profile.enable()
+            try:
+                await self.app(scope, peek_receive, send_wrapper)
+            finally:
+                profile.disable()
+        finally:
+            _active.release()
+        ms = 1000 * (time.perf_counter() - t0)
+        route = getattr(scope.get("route"), "path", None) or scope["path"]
+        doc_id = (scope.get("path_params") or {}).get("doc_id") or _doc_id_from_body(bytes(body))
+        # the response has been sent; write the profile off the event loop
+        try:
+            await asyncio.to_thread(save_profile, profile, route, doc_id, status[0], ms)
+        except OSError:
+            pass
+
+def _doc_id_from_body(body: bytes) -> Optional[str]:
+    if not body:
+        return None
+    try:
+        value = json.loads(body).get("doc_id")
+    except (ValueError, AttributeError):
+        return None
+    return value if isinstance(value, str) else None
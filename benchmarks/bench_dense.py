@@ -0,0 +1,73 @@
+"""
+Dense (LSA) retrieval: IVF recall vs latency, compared with exact dense and sparse top-k.
+
+    python -m benchmarks.bench_dense [--sizes 10000 50000] [--queries 200] [--k 8] [--nprobe 1 4 8 16 32]
+
+For each size the synthetic document gets a fitted TF-IDF index and a dense index with
+IVF lists (forced even below DENSE_IVF_MIN_CHUNKS). recall@k is the share of the exact
+dense top k that the IVF search returns; hybrid is timed through the retriever's fusion.
+"""
+from __future__ import annotations
+from typing import Dict, List
+import argparse, time
+
+import numpy as np
+
+from app.services.retriever import LoadedDocument, _top_k
+from app.store.dense import DenseIndex
+from app.store.postings import select_top_k
+from app.store.vector import TfidfVectorStore
+from benchmarks.bench_topk import synthetic_chunks, synthetic_queries
+from benchmarks.harness import latency_summary, time_each
+
+def recall(found: List[np.ndarray], truth: List[np.ndarray]) -> float:
+    hits = sum(len(set(map(int, f)) & set(map(int, t))) for f, t in zip(found, truth))
+    return hits / max(1, sum(len(t) for t in truth))
+
+def run(sizes: List[int], n_queries: int, k: int, nprobes: List[int]) -> List[Dict[str, object]]:
+    queries = synthetic_queries(n_queries)
+    rows = []
+    for n in sizes:
+        chunks = synthetic_chunks(n)
+        store = TfidfVectorStore.fit_from_chunks(chunks)
+        t0 = time.perf_counter()
+        dense = DenseIndex.build(store.matrix, ivf_min_chunks=0)
+        build_ms = 1000 * (time.perf_counter() - t0)
+        embedded = {q: dense.embed(store.transform([q]))[0] for q in queries}
+        truth = [select_top_k(dense.vectors @ embedded[q], k)[1] for q in queries]
+
+        row: Dict[str, object] = {"name": f"{n}_chunks", "chunks": n, "dim": dense.dim,
+                                  "nlist": len(dense.centroids), "build_ms": build_ms, "bytes": dense.nbytes()}
+        row["sparse"] = latency_summary(time_each(lambda q: store.top_k(q, k=k), queries))
+        row["dense_exact"] = latency_summary(time_each(lambda q: select_top_k(dense.vectors @ embedded[q], k), queries))
+        for nprobe in nprobes:
+            found = [dense.search(embedded[q], k, nprobe)[1] for q in queries]
+            row[f"ivf_nprobe_{nprobe}"] = {
+                **latency_summary(time_each(lambda q: dense.search(embedded[q], k, nprobe), queries)),
+                "recall": recall(found, truth),
+            }
+        doc = LoadedDocument(store=store, chunks=chunks, facts={}, sentences=None, dense=dense)
+        row["hybrid"] = latency_summary(time_each(lambda q: _top_k(doc, q, k, "hybrid"), queries))
+        rows.append(row)
+        probes = "  ".join(
+            f"nprobe {p}: p50 {row[f'ivf_nprobe_{p}']['p50_ms']:.3f} ms recall {row[f'ivf_nprobe_{p}']['recall']:.3f}"
+            for p in nprobes
+        )
+        print(
+            f"{n:>8} chunks  build {build_ms / 1000:6.2f} s  sparse p50 {row['sparse']['p50_ms']:.3f} ms  "
+            f"dense exact p50 {row['dense_exact']['p50_ms']:.3f} ms  hybrid p50 {row['hybrid']['p50_ms']:.3f} ms\n"
+            f"{'':>16}{probes}"
+        )
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    args = parser.parse_args(argv)
+    run(args.sizes, args.queries, args.k, args.nprobe)
+
+if __name__ == "__main__":
+    main()
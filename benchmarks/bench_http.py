@@ -0,0 +1,81 @@
+"""
+End-to-end load through the FastAPI app in-process (TestClient, no sockets).
+
+    python -m benchmarks.bench_http [--chunks 1000] [--requests 500] [--concurrency 8]
+
+A synthetic document is ingested into a temporary DATA_DIR, then each route is hit
+`--requests` times from `--concurrency` client threads. Set OPENAI_BASE_URL to the
+stub in benchmarks/stub_llm.py to include the LLM path.
+"""
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+import argparse, tempfile, time
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.routers import chat as chat_router, docs as docs_router
+from app.services.ingest import MemoryBudget, ingest_pages
+from benchmarks.corpus import synthetic_pages, synthetic_questions
+from benchmarks.harness import latency_summary
+
+WORDS_PER_CHUNK = 150
+
+def _routes(doc_id: str, questions: List[str]) -> Dict[str, Callable[[TestClient, int], object]]:
+    q = lambda i: questions[i % len(questions)]
+    return {
+        "chat": lambda c, i: c.post("/api/chat", json={"doc_id": doc_id, "message": q(i)}),
+        "chat_batch_8": lambda c, i: c.post("/api/chat/batch", json={"doc_id": doc_id, "messages": [q(i + j) for j in range(8)]}),
+        "chat_stream": lambda c, i: c.post("/api/chat/stream", json={"doc_id": doc_id, "message": q(i)}),
+        "list_docs": lambda c, i: c.get("/api/docs", params={"limit": 20}),
+    }
+
+def load(client: TestClient, call: Callable[[TestClient, int], object], n: int, concurrency: int) -> Dict[str, float]:
+    def one(i):
+        t0 = time.perf_counter()
+        res = call(client, i)
+        return time.perf_counter() - t0, res.status_code
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(n)))
+    wall = time.perf_counter() - t0
+    summary = latency_summary([lat for lat, _ in results], wall)
+    summary["errors"] = sum(1 for _, status in results if status >= 400)
+    return summary
+
+def run(n_chunks: int, n_requests: int, concurrency: int, routes: List[str] = None) -> Dict[str, object]:
+    questions = synthetic_questions(max(n_requests, 64), seed=3)
+    with tempfile.TemporaryDirectory() as data_dir:
+        doc_id = ingest_pages(synthetic_pages(n_chunks * WORDS_PER_CHUNK), "bench.pdf", data_dir, budget=MemoryBudget(0))
+        saved = chat_router.DATA_DIR, docs_router.DATA_DIR
+        chat_router.DATA_DIR = docs_router.DATA_DIR = data_dir
+        rows = []
+        try:
+            with TestClient(app) as client:
+                for name, call in _routes(doc_id, questions).items():
+                    if routes and name not in routes:
+                        continue
+                    load(client, call, min(n_requests, 20), concurrency)  # warm-up (loads the index)
+                    row = {"name": name, **load(client, call, n_requests, concurrency)}
+                    rows.append(row)
+                    print(
+                        f"{name:>14}  {row['throughput_per_s']:8.1f} req/s  p50 {row['p50_ms']:7.2f}  "
+                        f"p95 {row['p95_ms']:7.2f}  p99 {row['p99_ms']:7.2f} ms  errors {row['errors']}"
+                    )
+        finally:
+            chat_router.DATA_DIR, docs_router.DATA_DIR = saved
+    return {"http": {"chunks": n_chunks, "concurrency": concurrency, "routes": rows}}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--routes", nargs="*", help="subset of: chat chat_batch_8 chat_stream list_docs")
+    args = parser.parse_args(argv)
+    run(args.chunks, args.requests, args.concurrency, args.routes)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Per-stage ingest timings and per-question retrieval/answer micro-benchmarks.
+
+    python -m benchmarks.bench_stages [--sizes 1000 10000] [--queries 200] [--pdf-pages 50]
+
+For each size (in chunks) a synthetic document is ingested through ingest_pages; the
+time between consecutive progress events gives each stage's cost (extract and chunk
+overlap, since pages are chunked as they stream in). The stored document is then
+queried stage by stage: top-k (both engines), rule lookup, extractive stitch.
+"""
+from __future__ import annotations
+from typing import Dict, List
+import argparse, tempfile, time
+from pathlib import Path
+
+from app.services.ingest import MemoryBudget, ingest_pages, ingest_pdf
+from app.services.retriever import load_document, stitch_answer_indexed, DOC_CACHE
+from app.services.rules import rule_based_answer
+from benchmarks.corpus import make_pdf, synthetic_pages, synthetic_questions
+from benchmarks.harness import latency_summary, time_each
+
+WORDS_PER_CHUNK = 150  # fresh (non-overlapping) words per 180-word chunk
+
+class StageClock:
+    """Progress callback that records how long each stage ran until the next one started."""
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.marks: List[tuple] = []
+
+    def __call__(self, stage: str):
+        self.marks.append((stage, time.perf_counter()))
+
+    def stages(self, end: float) -> Dict[str, float]:
+        out = {}
+        for (name, t), nxt in zip(self.marks, self.marks[1:] + [(None, end)]):
+            out[name] = 1000 * (nxt[1] - t)
+        out["total"] = 1000 * (end - self.t0)
+        return {f"{k}_ms": v for k, v in out.items()}
+
+def bench_ingest(pages: List[str], data_dir: str) -> tuple:
+    clock = StageClock()
+    doc_id = ingest_pages(pages, "bench.pdf", data_dir, progress=clock, budget=MemoryBudget(0))
+    return doc_id, clock.stages(time.perf_counter())
+
+def bench_queries(doc_dir: Path, questions: List[str], k: int) -> Dict[str, Dict[str, float]]:
+    DOC_CACHE.invalidate(doc_dir)
+    t0 = time.perf_counter()
+    doc = load_document(doc_dir)
+    cold_load_ms = 1000 * (time.perf_counter() - t0)
+
+    top = {q: [int(i) for i in doc.store.top_k(q, k=k, engine="exhaustive")[1]] for q in questions}
+    contexts = {q: [doc.chunks[i] for i in idxs] for q, idxs in top.items()}
+    out: Dict[str, Dict[str, float]] = {"load_document_cold": {"ms": cold_load_ms}}
+    for engine in ("exhaustive", "pruned"):
+        out[f"top_k_{engine}"] = latency_summary(time_each(lambda q: doc.store.top_k(q, k=k, engine=engine), questions))
+    out["rule_lookup"] = latency_summary(time_each(lambda q: rule_based_answer(q, contexts[q], doc.facts), questions))
+    out["rule_scan"] = latency_summary(time_each(lambda q: rule_based_answer(q, contexts[q]), questions))
+    out["stitch_indexed"] = latency_summary(time_each(lambda q: stitch_answer_indexed(q, doc, top[q]), questions))
+    return out
+
+def run(sizes: List[int], n_queries: int, k: int, pdf_pages: int = 0) -> Dict[str, object]:
+    questions = synthetic_questions(n_queries)
+    rows = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        for n in sizes:
+            pages = synthetic_pages(n * WORDS_PER_CHUNK, seed=n)
+            doc_id, ingest = bench_ingest(pages, data_dir)
+            row = {"name": f"{n}_chunks", "chunks": n, "ingest": ingest,
+                   "query": bench_queries(Path(data_dir) / doc_id, questions, k)}
+            rows.append(row)
+            q = row["query"]
+            print(
+                f"{n:>8} chunks  ingest {ingest['total_ms'] / 1000:7.2f} s  "
+                f"top_k p50 {q['top_k_exhaustive']['p50_ms']:.3f}/{q['top_k_pruned']['p50_ms']:.3f} ms (exh/pruned)  "
+                f"rules p50 {q['rule_lookup']['p50_ms']:.3f} ms  stitch p50 {q['stitch_indexed']['p50_ms']:.3f} ms"
+            )
+        pdf = None
+        if pdf_pages:
+            data = make_pdf(synthetic_pages(pdf_pages * 450, seed=7)[:pdf_pages])
+            clock = StageClock()
+            ingest_pdf(data, "bench.pdf", data_dir, progress=clock, budget=MemoryBudget(0))
+            pdf = {"name": f"{pdf_pages}_pages", "pages": pdf_pages, "bytes": len(data),
+                   "ingest": clock.stages(time.perf_counter())}
+            print(f"{pdf_pages:>8} pages   ingest_pdf {pdf['ingest']['total_ms'] / 1000:7.2f} s")
+    return {"stages": rows, "pdf": pdf}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--pdf-pages", type=int, default=50)
+    args = parser.parse_args(argv)
+    run(args.sizes, args.queries, args.k, args.pdf_pages)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Exhaustive vs pruned (posting-list MaxScore) top-k on synthetic documents.
+
+    python -m benchmarks.bench_topk [--sizes 1000 10000 50000] [--queries 200] [--k 8]
+
+Prints per-query latency for both engines at each chunk count; the crossover is
+where TOPK_PRUNE_MIN_CHUNKS should sit.
+"""
+from __future__ import annotations
+from typing import List
+import argparse, random, time
+
+from app.store.vector import TfidfVectorStore
+from benchmarks.harness import latency_summary
+
+def synthetic_chunks(n: int, words_per_chunk: int = 80, vocab_size: int = 20000, seed: int = 0) -> List[str]:
+    # Zipf-distributed vocabulary, roughly like natural text
+    rnd = random.Random(seed)
+    vocab = [f"w{i}" for i in range(vocab_size)]
+    weights = [1.0 / (i + 1) for i in range(vocab_size)]
+    return [" ".join(rnd.choices(vocab, weights=weights, k=words_per_chunk)) for _ in range(n)]
+
+def synthetic_queries(n: int, vocab_size: int = 20000, seed: int = 1) -> List[str]:
+    # Questions mix a few common words with rarer content words
+    rnd = random.Random(seed)
+    return [
+        " ".join([f"w{rnd.randint(0, 50)}"] + [f"w{rnd.randint(50, vocab_size // 4)}" for _ in range(rnd.randint(2, 5))])
+        for _ in range(n)
+    ]
+
+def _time_per_query(store: TfidfVectorStore, queries: List[str], k: int, engine: str) -> List[float]:
+    out = []
+    for q in queries:
+        t0 = time.perf_counter()
+        store.top_k(q, k=k, engine=engine)
+        out.append(time.perf_counter() - t0)
+    return out
+
+def run(sizes: List[int], n_queries: int, k: int) -> List[dict]:
+    queries = synthetic_queries(n_queries)
+    rows = []
+    for n in sizes:
+        store = TfidfVectorStore.fit_from_chunks(synthetic_chunks(n))
+        store.postings  # build outside the timed region, as a loaded index would have it
+        row = {"name": f"{n}_chunks", "chunks": n}
+        for engine in ("exhaustive", "pruned"):
+            _time_per_query(store, queries[:10], k, engine)  # warm-up
+            row[engine] = latency_summary(_time_per_query(store, queries, k, engine))
+        rows.append(row)
+        print(
+            f"{n:>8} chunks  exhaustive p50 {row['exhaustive']['p50_ms']:7.3f} ms  "
+            f"pruned p50 {row['pruned']['p50_ms']:7.3f} ms  "
+            f"speedup x{row['exhaustive']['p50_ms'] / row['pruned']['p50_ms']:.2f}"
+        )
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 10000, 50000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=8)
+    args = parser.parse_args(argv)
+    run(args.sizes, args.queries, args.k)
+
+if __name__ == "__main__":
+    main()
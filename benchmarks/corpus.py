@@ -0,0 +1,89 @@
+"""
+Reproducible synthetic corpora: sentence-structured text with a Zipf vocabulary,
+a sprinkling of lease-style facts for the rule registry, and minimal PDFs.
+"""
+from __future__ import annotations
+from typing import List
+import random
+
+LEASE_FACTS = [
+    "The monthly rent is $1,250 payable on the first day of each month.",
+    "The lease term is twelve months starting on March 1, 2024.",
+    "The owner of the property is Jordan Example Holdings LLC.",
+    "The premises are located at 42 Benchmark Avenue, Springfield.",
+]
+
+def _vocab(vocab_size: int) -> List[str]:
+    return [f"w{i}" for i in range(vocab_size)]
+
+def synthetic_sentences(n: int, vocab_size: int = 20000, seed: int = 0, fact_rate: float = 0.01) -> List[str]:
+    """`n` sentences of 8-24 Zipf-distributed words; about `fact_rate` of them are lease facts."""
+    rnd = random.Random(seed)
+    vocab = _vocab(vocab_size)
+    weights = [1.0 / (i + 1) for i in range(vocab_size)]
+    out = []
+    for _ in range(n):
+        if rnd.random() < fact_rate:
+            out.append(rnd.choice(LEASE_FACTS))
+            continue
+        words = rnd.choices(vocab, weights=weights, k=rnd.randint(8, 24))
+        out.append(words[0].capitalize() + " " + " ".join(words[1:]) + ".")
+    return out
+
+def synthetic_pages(n_words: int, words_per_page: int = 450, seed: int = 0) -> List[str]:
+    """About `n_words` words of text split into pages (one paragraph per page)."""
+    sentences = synthetic_sentences(max(1, n_words // 16), seed=seed)
+    pages, current, count = [], [], 0
+    for s in sentences:
+        current.append(s)
+        count += len(s.split())
+        if count >= words_per_page:
+            pages.append(" ".join(current))
+            current, count = [], 0
+    if current:
+        pages.append(" ".join(current))
+    return pages
+
+def synthetic_questions(n: int, vocab_size: int = 20000, seed: int = 1) -> List[str]:
+    """Content questions (a common word plus rarer ones) mixed with questions that trigger rules."""
+    rnd = random.Random(seed)
+    rule_questions = ["What is the monthly rent?", "Who is the owner?", "What is the lease term?", "What is the address?"]
+    out = []
+    for i in range(n):
+        if i % 5 == 4:
+            out.append(rule_questions[(i // 5) % len(rule_questions)])
+        else:
+            words = [f"w{rnd.randint(0, 50)}"] + [f"w{rnd.randint(50, vocab_size // 4)}" for _ in range(rnd.randint(2, 5))]
+            out.append("What about " + " ".join(words) + "?")
+    return out
+
+def make_pdf(pages):
+    """Build a minimal text-only PDF (one Helvetica text block per page, one text line per input line)."""
+    def esc(s):
+        return s.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        lines = [ln for ln in text.split("\n")] or [""]
+        body = "BT /F1 11 Tf 14 TL 50 780 Td " + " ".join(f"({esc(ln)}) Tj T*" for ln in lines) + " ET"
+        objects.append(f"<< /Length {len(body.encode('latin-1'))} >>\nstream\n{body}\nendstream")
+        content_id = len(objects)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    for off in offsets:
+        out += f"{off:010d} 00000 n \n".encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    return bytes(out)
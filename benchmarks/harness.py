@@ -0,0 +1,85 @@
+"""Timing, percentile and JSON result helpers shared by the benchmark scripts."""
+from __future__ import annotations
+from typing import Callable, Dict, List, Optional, Sequence
+import json, math, os, platform, statistics, subprocess, sys, time
+from datetime import datetime, timezone
+from pathlib import Path
+
+def percentile(sorted_samples: List[float], q: float) -> float:
+    """Nearest-rank percentile of already sorted samples (q in 0..100)."""
+    if not sorted_samples:
+        return float("nan")
+    idx = min(len(sorted_samples) - 1, max(0, math.ceil(q / 100.0 * len(sorted_samples)) - 1))
+    return sorted_samples[idx]
+
+def latency_summary(samples_s: List[float], wall_s: Optional[float] = None) -> Dict[str, float]:
+    """p50/p95/p99/mean in milliseconds; throughput over `wall_s` (default: the samples' sum)."""
+    lat = sorted(samples_s)
+    wall = wall_s if wall_s is not None else sum(lat)
+    return {
+        "n": len(lat),
+        "p50_ms": 1000 * percentile(lat, 50),
+        "p95_ms": 1000 * percentile(lat, 95),
+        "p99_ms": 1000 * percentile(lat, 99),
+        "mean_ms": 1000 * statistics.fmean(lat) if lat else float("nan"),
+        "throughput_per_s": len(lat) / wall if wall > 0 else float("nan"),
+    }
+
+def time_each(fn: Callable[[object], object], items: Sequence[object], warmup: int = 5) -> List[float]:
+    """Seconds taken by fn(item) for every item, after calling it on the first `warmup` items."""
+    for item in items[:warmup]:
+        fn(item)
+    out = []
+    for item in items:
+        t0 = time.perf_counter()
+        fn(item)
+        out.append(time.perf_counter() - t0)
+    return out
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5, cwd=Path(__file__).resolve().parent).stdout.strip() or None
+    except Exception:
+        return None
+
+def environment() -> Dict[str, object]:
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+def save_results(path: str, results: Dict[str, object]) -> Path:
+    out = Path(path)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({"environment": environment(), **results}, f, indent=2)
+    return out
+
+def _flatten(obj, prefix=""):
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            yield from _flatten(v, f"{prefix}.{k}" if prefix else str(k))
+    elif isinstance(obj, list):
+        for i, v in enumerate(obj):
+            # rows are identified by their label when they have one
+            label = v.get("name", i) if isinstance(v, dict) else i
+            yield from _flatten(v, f"{prefix}[{label}]")
+    elif isinstance(obj, (int, float)):
+        yield prefix, float(obj)
+
+def compare(old_path: str, new: Dict[str, object], metric: str = "p50_ms", threshold: float = 1.10) -> List[str]:
+    """Lines describing every `metric` that got more than `threshold` times worse since `old_path`."""
+    with open(old_path, "r", encoding="utf-8") as f:
+        old = dict(_flatten(json.load(f)))
+    lines = []
+    for key, value in _flatten(new):
+        if not key.endswith(metric) or key not in old or old[key] <= 0:
+            continue
+        ratio = value / old[key]
+        if ratio > threshold:
+            lines.append(f"{key}: {old[key]:.3f} -> {value:.3f} ms (x{ratio:.2f})")
+    return lines
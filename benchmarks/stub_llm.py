@@ -0,0 +1,78 @@
+"""
+Local OpenAI-compatible chat completions server for offline load tests.
+
+    python -m benchmarks.stub_llm [--port 8001] [--latency-ms 200]
+    OPENAI_API_KEY=stub OPENAI_BASE_URL=http://127.0.0.1:8001/v1 uvicorn app.main:app
+
+Answers are deterministic (the first words of the first context chunk) and are
+returned after a fixed latency, either whole or streamed word by word when the
+request sets "stream": true.
+"""
+from __future__ import annotations
+from typing import Dict, List
+import argparse, asyncio, json, re, time, uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+def _stub_answer(messages: List[Dict[str, str]], words: int = 24) -> str:
+    prompt = messages[-1].get("content", "") if messages else ""
+    # Prompts built by app.services.providers put each chunk after a "[Chunk n]" marker
+    m = re.search(r"\[Chunk 1\](?:\\n|\s)*(.*?)(?:\\n\\n\[Chunk|\\n\\nQuestion:|$)", prompt, re.S)
+    text = (m.group(1) if m else prompt).split()
+    return " ".join(text[:words]) or "I cannot find it in the document."
+
+def create_app(latency_ms: float = 0.0) -> FastAPI:
+    app = FastAPI(title="Stub LLM")
+    # requests: completions served; in_flight/max_in_flight: concurrency seen by the server
+    app.state.stats = {"requests": 0, "in_flight": 0, "max_in_flight": 0}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats = app.state.stats
+        stats["requests"] += 1
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        try:
+            await asyncio.sleep(latency_ms / 1000.0)
+        finally:
+            stats["in_flight"] -= 1
+
+        answer = _stub_answer(body.get("messages", []))
+        model = body.get("model", "stub")
+        cid, created = f"chatcmpl-{uuid.uuid4().hex[:12]}", int(time.time())
+        if not body.get("stream"):
+            return JSONResponse({
+                "id": cid, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(answer.split()), "total_tokens": len(answer.split())},
+            })
+
+        def chunk(delta: dict, finish=None) -> str:
+            obj = {"id": cid, "object": "chat.completion.chunk", "created": created, "model": model,
+                   "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+            return f"data: {json.dumps(obj)}\n\n"
+
+        async def events():
+            yield chunk({"role": "assistant", "content": ""})
+            for i, word in enumerate(answer.split()):
+                yield chunk({"content": word if i == 0 else " " + word})
+            yield chunk({}, "stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+def main():
+    import uvicorn
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8001)
+    ap.add_argument("--latency-ms", type=float, default=200.0)
+    args = ap.parse_args()
+    uvicorn.run(create_app(args.latency_ms), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Run every benchmark and save one JSON result file, optionally comparing with an earlier one.
+
+    python -m benchmarks.suite [--sizes 1000 10000] [--out benchmarks/results/latest.json] [--compare OLD.json]
+
+Sizes are in chunks (100000 works but takes minutes). With --compare, every p50 that
+got more than --threshold times slower is listed and the exit status is 1.
+"""
+from __future__ import annotations
+import argparse, sys
+
+from benchmarks import bench_dense, bench_http, bench_stages, bench_topk
+from benchmarks.harness import compare, save_results
+
+def run(sizes, n_queries: int, k: int, pdf_pages: int, n_requests: int, concurrency: int) -> dict:
+    print("== ingest stages + per-question costs")
+    results = bench_stages.run(sizes, n_queries, k, pdf_pages)
+    print("== top-k engines")
+    results["topk"] = bench_topk.run(sizes, n_queries, k)
+    print("== dense (LSA) retrieval")
+    results["dense"] = bench_dense.run(sizes, n_queries, k, [1, 8, 32])
+    print("== HTTP routes")
+    results.update(bench_http.run(min(sizes), n_requests, concurrency))
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--pdf-pages", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--out", default="benchmarks/results/latest.json")
+    parser.add_argument("--compare", help="earlier result file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=1.10)
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.queries, args.k, args.pdf_pages, args.requests, args.concurrency)
+    print(f"Saved {save_results(args.out, results)}")
+    if args.compare:
+        slower = compare(args.compare, results, threshold=args.threshold)
+        for line in slower:
+            print("slower:", line)
+        if slower:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -2,3 +2,5 @@ import os, sys
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 if ROOT not in sys.path:
     sys.path.insert(0, ROOT)
+
+from benchmarks.corpus import make_pdf  # noqa: F401  (tests import it from conftest)
@@ -0,0 +1,46 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+
+from app.utils import admission
+from app.utils.admission import AdmissionGate, Rejected
+
+def test_gate_queues_then_rejects():
+    async def run():
+        gate = AdmissionGate("chat", limit=1, max_queue=1, wait_s=0.05)
+        await gate.acquire()
+        waiter = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Rejected) as full:
+            await gate.acquire()
+        assert full.value.status == 429 and gate.stats()["waiting"] == 1
+        gate.release()  # handed to the waiter
+        await waiter
+        assert gate.stats()["in_flight"] == 1
+        with pytest.raises(Rejected) as slow:
+            await gate.acquire()
+        assert slow.value.status == 503
+        gate.release()
+        return gate.stats()
+    stats = asyncio.run(run())
+    assert stats == {**stats, "in_flight": 0, "waiting": 0, "admitted": 2, "rejected_full": 1, "rejected_timeout": 1}
+
+def test_saturated_routes_and_oversized_uploads_are_rejected(monkeypatch):
+    from app.main import app
+    client = TestClient(app)
+    busy = AdmissionGate("chat", limit=1, max_queue=0)
+    busy.in_flight = 1
+    monkeypatch.setitem(admission.GATES, "chat", busy)
+    res = client.post("/api/chat", json={"doc_id": "x", "message": "hi"})
+    assert res.status_code == 429 and res.headers["Retry-After"] == str(admission.ADMISSION_RETRY_AFTER_S)
+    assert client.get("/api/docs/x/summary").status_code == 404  # other classes are unaffected
+
+    monkeypatch.setattr(admission, "MAX_UPLOAD_MB", 0.01)
+    pdf = b"%PDF-1.4\n" + b"0" * 20000
+    assert client.post("/api/upload", files={"file": ("big.pdf", pdf, "application/pdf")}).status_code == 413
+    # no Content-Length: cut off while the body streams in
+    body = b"--b\r\nContent-Disposition: form-data; name=\"file\"; filename=\"big.pdf\"\r\n\r\n" + pdf + b"\r\n--b--\r\n"
+    res = client.post("/api/upload", content=iter([body[i:i + 4096] for i in range(0, len(body), 4096)]),
+                      headers={"Content-Type": "multipart/form-data; boundary=b"})
+    assert res.status_code == 413
+    assert 'route_class="upload",reason="too_large"' in client.get("/metrics").text
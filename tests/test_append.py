@@ -0,0 +1,96 @@
+import time
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from conftest import make_pdf
+from benchmarks.corpus import synthetic_pages, synthetic_questions
+from app.services.ingest import append_pages, chunk_sentences, split_into_sentences
+from app.store.content import ContentIndex, DocumentShared
+from app.store.hashed import HashedTfidfStore, load_index
+from app.store.vector import TfidfVectorStore
+
+def test_hashed_index_matches_fitted_and_appends_in_place(tmp_path):
+    chunks = chunk_sentences(split_into_sentences("\n".join(synthetic_pages(150 * 120, seed=2))))
+    fitted = TfidfVectorStore.fit_from_chunks(chunks)
+    hashed = HashedTfidfStore.from_chunks(chunks)
+    questions = synthetic_questions(20)
+    for q in questions:
+        s1, i1 = fitted.top_k(q, k=5, engine="exhaustive")
+        s2, i2 = hashed.top_k(q, k=5, engine="exhaustive")
+        assert np.allclose(s1, s2, atol=1e-3)
+        s3, i3 = hashed.top_k(q, k=5, engine="pruned")
+        assert np.allclose(s2, s3, atol=1e-5) and set(i3[s3 > s3[-1] + 1e-5]) <= set(i2)
+
+    HashedTfidfStore.from_chunks(chunks[:70]).save(tmp_path / "index")
+    HashedTfidfStore.append(tmp_path / "index", chunks[70:100])
+    before = (tmp_path / "index" / "format.json").read_text()
+    assert HashedTfidfStore.append(tmp_path / "index", chunks[100:]) == len(chunks)
+    assert sorted(p.name for p in (tmp_path / "index").glob("df*.npy")) == ["df-100.npy", f"df-{len(chunks)}.npy"]
+    # the previous format.json still describes a consistent index: its rows and its df table
+    after = (tmp_path / "index" / "format.json").read_text()
+    (tmp_path / "index" / "format.json").write_text(before)
+    old = HashedTfidfStore.load(tmp_path / "index")
+    assert old.matrix.shape[0] == 100 and np.array_equal(old.df, HashedTfidfStore.from_chunks(chunks[:100]).df)
+    (tmp_path / "index" / "format.json").write_text(after)
+    appended = load_index(tmp_path / "index")
+    scores, idxs = appended.top_k_batch(questions, k=5)
+    expected = hashed.top_k_batch(questions, k=5)
+    assert np.array_equal(idxs, expected[1]) and np.allclose(scores, expected[0])
+
+def _wait(scheduler, job_id, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = scheduler.get(job_id)
+        if job.status in ("done", "failed"):
+            return job
+        time.sleep(0.02)
+    raise AssertionError("job did not finish")
+
+def test_append_endpoint_extends_document(tmp_path, monkeypatch):
+    from app.main import app
+    from app.routers import chat, docs
+    from app.services.jobs import IngestScheduler
+    from app.services.retriever import load_chunks
+    scheduler = IngestScheduler(workers=1, max_queue=4, executor="thread")
+    monkeypatch.setattr(docs, "SCHEDULER", scheduler)
+    monkeypatch.setattr(docs, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(chat, "DATA_DIR", str(tmp_path))
+    client = TestClient(app)
+
+    original = make_pdf(synthetic_pages(1200, seed=4))
+    res = client.post("/api/upload", files={"file": ("a.pdf", original, "application/pdf")})
+    doc_id = _wait(scheduler, res.json()["job_id"]).doc_id
+    before = list(load_chunks(tmp_path / doc_id))
+
+    appendix = make_pdf(["Appendix. The zeppelin hangar is painted orange. " * 20])
+    res = client.post(f"/api/docs/{doc_id}/append", files={"file": ("b.pdf", appendix, "application/pdf")})
+    assert res.status_code == 202
+    job = _wait(scheduler, res.json()["job_id"])
+    assert job.status == "done", job.error
+    assert job.doc_id == doc_id and job.stages == ["extract", "chunk", "index", "summarize", "facts", "save"]
+
+    after = list(load_chunks(tmp_path / doc_id))
+    assert after[:len(before)] == before and len(after) > len(before)
+    assert after[len(before)].startswith(" ".join(before[-1].split()[-30:]) + " Appendix.")
+    assert HashedTfidfStore.is_hashed(tmp_path / doc_id / "index")
+    meta = client.get(f"/api/docs/{doc_id}/summary").json()["meta"]
+    assert meta["num_chunks"] == len(after) and meta["updated_at"]
+
+    answer = client.post("/api/chat", json={"doc_id": doc_id, "message": "What colour is the zeppelin hangar?"}).json()
+    assert "zeppelin" in answer["sources"][0]["chunk"]
+    # the document no longer matches the original PDF, so uploading it again ingests it anew
+    res = client.post("/api/upload", files={"file": ("a.pdf", original, "application/pdf")})
+    assert res.status_code == 202
+    shared = _wait(scheduler, res.json()["job_id"]).doc_id
+    assert client.post("/api/upload", files={"file": ("a.pdf", original, "application/pdf")}).json()["doc_id"] == shared
+    # two uploads reference it now: appending would change the other one's document
+    res = client.post(f"/api/docs/{shared}/append", files={"file": ("b.pdf", appendix, "application/pdf")})
+    assert res.status_code == 409
+    with pytest.raises(DocumentShared):
+        append_pages(shared, ["More pages."], str(tmp_path), content_key="k")
+    assert list(load_chunks(tmp_path / shared)) == before
+    assert ContentIndex(str(tmp_path)).get(client.get(f"/api/docs/{shared}/summary").json()["meta"]["content_key"])["refs"] == 2
+    assert client.post("/api/docs/nope/append", files={"file": ("b.pdf", appendix, "application/pdf")}).status_code == 404
+    scheduler.shutdown()
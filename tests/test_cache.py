@@ -0,0 +1,92 @@
+from app.store.cache import DocumentCache
+
+def _cache(gens, **kw):
+    loads = []
+    def loader(key):
+        loads.append(key)
+        return f"value-{key}"
+    cache = DocumentCache(loader, generation=lambda k: gens.get(k, 0), sizeof=lambda v: 10, **kw)
+    return cache, loads
+
+def test_cache_lru_eviction_and_counters():
+    cache, loads = _cache({}, max_items=2)
+    cache.get("a"); cache.get("b"); cache.get("a")
+    cache.get("c")  # evicts "b", the least recently used
+    cache.get("a")
+    cache.get("b")
+    assert loads == ["a", "b", "c", "b"]
+    stats = cache.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 4
+    assert stats["evictions"] == 2 and stats["items"] == 2
+
+def test_cache_byte_budget_and_generation_invalidation():
+    gens = {"a": 1}
+    cache, loads = _cache(gens, max_bytes=25)
+    cache.get("a"); cache.get("b"); cache.get("c")
+    assert cache.stats()["bytes"] <= 25
+    gens["c"] = 2  # document re-ingested
+    cache.get("c")
+    assert loads == ["a", "b", "c", "c"]
+    assert cache.stats()["invalidations"] == 1
+
+def test_answer_cache_ttl_and_disk_tier(tmp_path):
+    from app.store.answers import AnswerCache
+    now = [1000.0]
+    loc = tmp_path / "doc1"
+    cache = AnswerCache(max_items=2, ttl=60, disk=True, clock=lambda: now[0])
+    cache.put(loc, "k1", {"answer": "one"})
+    now[0] += 10
+    assert cache.get(loc, "k1") == ({"answer": "one"}, 10.0)
+    # a new process finds it on disk, until it expires
+    fresh = AnswerCache(max_items=2, ttl=60, disk=True, clock=lambda: now[0])
+    assert fresh.get(loc, "k1")[0] == {"answer": "one"} and fresh.stats()["disk_hits"] == 1
+    now[0] += 60
+    assert cache.get(loc, "k1") is None and AnswerCache(disk=True, ttl=60, clock=lambda: now[0]).get(loc, "k1") is None
+    cache.put(loc, "k2", {"answer": "two"})
+    cache.invalidate(loc)
+    assert cache.get(loc, "k2") is None and not (tmp_path / ".answers" / "doc1").exists()
+
+def test_chat_answers_are_cached_per_document_generation(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.routers import chat
+    from app.services.ingest import append_pages, save_document
+    from app.store.vector import TfidfVectorStore
+
+    chunks = ["The tenant pays rent of $1200 monthly.", "A pet deposit of $300 is required."]
+    save_document("doc1", "t.pdf", chunks, TfidfVectorStore.fit_from_chunks(chunks), "summary", str(tmp_path))
+    monkeypatch.setattr(chat, "DATA_DIR", str(tmp_path))
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    client = TestClient(app)
+    ask = lambda msg, **kw: client.post("/api/chat", json={"doc_id": "doc1", "message": msg}, **kw)
+
+    first = ask("What colour is the hangar?")
+    assert first.headers["X-Answer-Cache"] == "miss"
+    again = ask("what colour is the   hangar")  # same normalized question
+    assert again.headers["X-Answer-Cache"] == "hit" and again.json() == first.json()
+    assert ask("What colour is the hangar?", headers={"Cache-Control": "no-cache"}).headers["X-Answer-Cache"] == "bypass"
+
+    append_pages("doc1", ["The hangar is painted orange."], str(tmp_path))  # new generation
+    res = ask("What colour is the hangar?")
+    assert res.headers["X-Answer-Cache"] == "miss" and "orange" in res.json()["answer"]
+    batch = client.post("/api/chat/batch", json={"doc_id": "doc1", "messages": ["What colour is the hangar?", "Pet deposit?"]})
+    assert batch.headers["X-Answer-Cache"] == "partial"
+
+def test_fallback_answers_after_llm_failure_are_not_cached(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.routers import chat
+    from app.services.ingest import save_document
+    from app.store.vector import TfidfVectorStore
+
+    chunks = ["The hangar is painted orange.", "A pet deposit of $300 is required."]
+    save_document("doc1", "t.pdf", chunks, TfidfVectorStore.fit_from_chunks(chunks), "summary", str(tmp_path))
+    monkeypatch.setattr(chat, "DATA_DIR", str(tmp_path))
+    monkeypatch.setenv("OPENAI_API_KEY", "configured")
+    async def outage(*args, **kwargs):
+        return None  # what aopenai_answer returns on a timeout or error
+    monkeypatch.setattr(chat, "aopenai_answer", outage)
+    client = TestClient(app)
+    for _ in range(2):
+        res = client.post("/api/chat", json={"doc_id": "doc1", "message": "What colour is the hangar?"})
+        assert res.headers["X-Answer-Cache"] == "miss" and "orange" in res.json()["answer"]
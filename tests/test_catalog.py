@@ -0,0 +1,50 @@
+import json
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+
+from app.store.catalog import Catalog
+
+def _write_docs(base, n):
+    t0 = datetime(2024, 1, 1)
+    for i in range(n):
+        meta = {"id": f"d{i:03d}", "filename": ("report" if i % 3 else "lease") + f"-{i}.pdf",
+                "created_at": (t0 + timedelta(minutes=i // 2)).isoformat(),  # pairs share a timestamp
+                "chunk_size": 180, "overlap": 30, "num_chunks": 1, "content_key": None}
+        (base / meta["id"]).mkdir()
+        (base / meta["id"] / "meta.json").write_text(json.dumps(meta))
+
+def test_catalog_backfills_and_paginates(tmp_path, monkeypatch):
+    from app.main import app
+    from app.routers import docs
+    _write_docs(tmp_path, 25)
+    monkeypatch.setattr(docs, "DATA_DIR", str(tmp_path))
+    client = TestClient(app)
+
+    # the first query creates the catalog from the existing directories
+    seen, cursor = [], None
+    while True:
+        res = client.get("/api/docs", params={"limit": 7, **({"cursor": cursor} if cursor else {})})
+        seen += [d["id"] for d in res.json()]
+        cursor = res.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert seen == sorted(seen, key=lambda d: (int(d[1:]) // 2, d), reverse=True)
+    assert len(seen) == 25
+
+    asc = client.get("/api/docs", params={"order": "asc", "limit": 5, "offset": 5}).json()
+    assert [d["id"] for d in asc] == [f"d{i:03d}" for i in range(5, 10)]
+    leases = client.get("/api/docs", params={"filename_prefix": "lease", "limit": 100}).json()
+    assert sorted(d["id"] for d in leases) == [f"d{i:03d}" for i in range(0, 25, 3)]
+    assert client.get("/api/docs", params={"cursor": "!!"}).status_code == 400
+
+def test_catalog_follows_save_and_delete(tmp_path):
+    from app.services.ingest import save_document
+    from app.store.vector import TfidfVectorStore
+    chunks = ["Catalog rows are written by save_document.", "Deleting a document removes its row."]
+    save_document("abc", "x.pdf", chunks, TfidfVectorStore.fit_from_chunks(chunks), "s", str(tmp_path))
+    catalog = Catalog(str(tmp_path))
+    page, _ = catalog.list()
+    assert [d["id"] for d in page] == ["abc"] and page[0]["num_chunks"] == 2
+    catalog.delete("abc")
+    assert catalog.list() == ([], None)
+    assert catalog.rebuild() == 1  # directory still there: backfilled again
@@ -13,3 +13,251 @@ def test_vector_store_topk():
     assert len(idxs) == 2
     top_texts = [chunks[i] for i in idxs]
     assert any("Eiffel Tower" in t for t in top_texts)
+
+def test_vector_store_mmap_roundtrip_and_migration(tmp_path):
+    import pickle
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from app.store.vector import VECTORIZER_PARAMS
+    from app.store.migrate import migrate_all
+
+    chunks = [
+        "The capital of France is Paris. It is known for the Eiffel Tower.",
+        "Python is a programming language commonly used for web apps.",
+        "The Eiffel Tower is located in Paris, France.",
+    ]
+    # A document written by the old pickle-based save()
+    doc = tmp_path / "abc12345"
+    doc.mkdir()
+    vec = TfidfVectorizer(**VECTORIZER_PARAMS)
+    matrix = vec.fit_transform(chunks)
+    with open(doc / "index.pkl", "wb") as f:
+        pickle.dump({"vectorizer": vec, "matrix": matrix}, f)
+
+    assert migrate_all(str(tmp_path), remove_pickle=True) == ["abc12345"]
+    assert not (doc / "index.pkl").exists()
+    store = TfidfVectorStore.load(doc / "index")
+    assert store.terms.lookup("eiffel tower") >= 0
+    expected = (vec.transform(["Eiffel Tower location"]) @ matrix.T).toarray().ravel()
+    scores, idxs = store.top_k("Eiffel Tower location", k=3)
+    assert list(idxs[:2]) == list(expected.argsort()[::-1][:2])
+    assert abs(float(scores[0]) - expected.max()) < 1e-5
+
+def test_batch_chat_matches_single_questions(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.routers import chat
+    from app.services.ingest import save_document
+
+    chunks = [
+        "The capital of France is Paris. It is known for the Eiffel Tower.",
+        "Python is a programming language commonly used for web apps.",
+        "FastAPI is a Python framework for building APIs quickly.",
+        "The Eiffel Tower is located in Paris, France.",
+    ]
+    save_document("doc1", "t.pdf", chunks, TfidfVectorStore.fit_from_chunks(chunks), "summary", str(tmp_path))
+    monkeypatch.setattr(chat, "DATA_DIR", str(tmp_path))
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+
+    client = TestClient(app)
+    questions = ["Where is the Eiffel Tower?", "What is FastAPI?", "Which language is used for web apps?"]
+    res = client.post("/api/chat/batch", json={"doc_id": "doc1", "messages": questions})
+    assert res.status_code == 200
+    results = res.json()["results"]
+    assert len(results) == len(questions)
+    for q, batched in zip(questions, results):
+        single = client.post("/api/chat", json={"doc_id": "doc1", "message": q}).json()
+        assert batched["answer"] == single["answer"]
+        assert [s["idx"] for s in batched["sources"]][:2] == [s["idx"] for s in single["sources"]][:2]
+    assert client.post("/api/chat/batch", json={"doc_id": "missing", "messages": ["x"]}).status_code == 404
+
+def test_pruned_topk_matches_exhaustive():
+    import random
+    import numpy as np
+    rnd = random.Random(7)
+    vocab = [f"w{i}" for i in range(300)]
+    weights = [1.0 / (i + 1) for i in range(300)]
+    chunks = [" ".join(rnd.choices(vocab, weights=weights, k=rnd.randint(5, 40))) for _ in range(400)]
+    store = TfidfVectorStore.fit_from_chunks(chunks)
+    for _ in range(30):
+        q = " ".join(rnd.choices(vocab, weights=weights, k=rnd.randint(1, 6)))
+        s1, i1 = store.top_k(q, k=8, engine="exhaustive")
+        s2, i2 = store.top_k(q, k=8, engine="pruned")
+        assert np.allclose(s1, s2, atol=1e-5)
+        assert set(i1[s1 > s1[-1] + 1e-5]) <= set(i2)
+    # no matching terms: both fall back to the first chunks with score 0
+    assert list(store.top_k("zzz", k=3, engine="pruned")[1]) == [0, 1, 2]
+
+def test_rule_facts_extracted_once_and_looked_up():
+    from app.services.rules import extract_facts, match_rules, rule_based_answer
+    lease = (
+        "This Lease Contract is between Residents (list all people signing the Lease Contract as residents): "
+        "John Smith, Jane Doe and us, the owner: Acme Holdings. "
+        "Monthly Stated Base Rent for the apartment is $1,250.00 per month."
+    )
+    facts = extract_facts(lease)
+    assert facts["lease.rent"] == "Monthly base rent: $1,250.00."
+    assert facts["lease.residents"] == "Residents on the lease: John Smith, Jane Doe"
+    # ingest runs the rules chunk by chunk: "lease" is only in the first chunk, the rent in a later one
+    from app.services.ingest import chunk_sentences, split_into_sentences
+    chunks = chunk_sentences(split_into_sentences(lease + " The pool opens in May. Pets need approval."), 16, 6)
+    assert len(chunks) > 2 and "lease" not in chunks[1].lower() and "Base Rent" in chunks[1]
+    chunked = extract_facts(chunks)
+    assert chunked["lease.rent"] == facts["lease.rent"] and chunked["lease.residents"] == facts["lease.residents"]
+    assert chunked["lease.owner"] == "Owner: Acme Holdings"  # bounded by the chunk, not the rest of the document
+    assert [r.name for r, _ in match_rules("What is the monthly rent?")] == ["lease.rent"]
+    assert match_rules("Summarize the current situation") == []  # "rent" inside "current" is not a trigger
+    # the stored fact answers even when the retrieved contexts miss it
+    assert rule_based_answer("What is the monthly rent?", ["unrelated lease text"], facts) == facts["lease.rent"]
+    assert rule_based_answer("What is the monthly rent?", [lease]) == facts["lease.rent"]
+    # generic triggers and fixed answers only apply to retrieved contexts on that topic
+    assert rule_based_answer("Who painted the hangar?", ["The hangar is orange."], facts) is None
+    bio = facts | extract_facts("Photosynthesis needs light. Plants absorb CO2 at a rate set by light.")
+    assert not any(name.startswith("photosynthesis.") for name in bio)
+    assert rule_based_answer("What is the rate of mitosis?", ["Mitosis takes hours."], bio) is None
+    assert rule_based_answer("What limits the rate?", ["Photosynthesis is slow."], bio).startswith("Common limiting")
+
+def test_indexed_stitch_matches_regex_stitch(tmp_path):
+    from app.store.sentences import SentenceTable
+    from app.services.retriever import LoadedDocument, stitch_answer, stitch_answer_indexed
+
+    chunks = [
+        "  The rent is $900 per month. Rent is due on the 1st! Late fees apply.",
+        "Photosynthesis converts light. The Calvin cycle fixes CO2? Yes.",
+        "No sentence boundary here",
+        "Rent, rent and more RENT. Nothing else.",
+    ]
+    SentenceTable.build(chunks).save(tmp_path / "sentences")
+    doc = LoadedDocument(store=None, chunks=chunks, facts={}, sentences=SentenceTable.load(tmp_path / "sentences"))
+    for query in ["When is the rent due?", "calvin cycle", "the of", "zebra", ""]:
+        for idxs in ([0, 1, 2, 3], [3, 0], [2]):
+            expected = stitch_answer(query, [chunks[i] for i in idxs], max_sentences=2)
+            assert stitch_answer_indexed(query, doc, idxs, max_sentences=2) == expected
+
+def test_llm_answers_pooled_bounded_and_cached(tmp_path, monkeypatch):
+    import httpx
+    from openai import AsyncOpenAI
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.routers import chat
+    from app.services import providers
+    from app.services.ingest import save_document
+    from benchmarks.stub_llm import create_app
+
+    stub = create_app(latency_ms=20)
+    made = []
+    def make_client(api_key, base_url):
+        made.append(base_url)
+        return AsyncOpenAI(api_key=api_key, base_url="http://stub/v1",
+                           http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=stub)))
+
+    chunks = [f"Topic {w} is discussed here. More text about {w} follows." for w in ("alpha", "beta", "gamma", "delta")]
+    save_document("doc1", "t.pdf", chunks, TfidfVectorStore.fit_from_chunks(chunks), "summary", str(tmp_path))
+    monkeypatch.setattr(chat, "DATA_DIR", str(tmp_path))
+    monkeypatch.setenv("OPENAI_API_KEY", "stub")
+    monkeypatch.setattr(providers, "_make_async_client", make_client)
+    monkeypatch.setattr(providers, "LLM_MAX_CONCURRENCY", 2)
+    monkeypatch.setattr(providers, "RESPONSE_CACHE", providers.ResponseCache(max_items=16, ttl=60))
+    monkeypatch.setattr(chat, "RESPONSE_CACHE", providers.RESPONSE_CACHE)
+
+    client = TestClient(app)
+    questions = [f"Explain {w}" for w in ("alpha", "beta", "gamma", "delta", "alpha beta")]
+    first = client.post("/api/chat/batch", json={"doc_id": "doc1", "messages": questions}).json()["results"]
+    assert stub.state.stats["requests"] == len(questions)
+    assert stub.state.stats["max_in_flight"] == 2
+    assert first[0]["answer"].startswith("Topic alpha")
+    assert len(made) == 1  # one pooled client for the event loop
+
+    # past the answer cache, to the LLM response cache
+    again = client.post("/api/chat/batch", json={"doc_id": "doc1", "messages": questions},
+                        headers={"Cache-Control": "no-cache"}).json()["results"]
+    assert [r["answer"] for r in again] == [r["answer"] for r in first]
+    assert stub.state.stats["requests"] == len(questions)  # served from the response cache
+    assert client.get("/api/cache/stats").json()["llm"]["hits"] == len(questions)
+
+def _sse_events(body: str):
+    import json
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+def test_chat_stream_sources_first_then_tokens(tmp_path, monkeypatch):
+    import httpx
+    from openai import AsyncOpenAI
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.routers import chat
+    from app.services import providers
+    from app.services.ingest import save_document
+    from benchmarks.stub_llm import create_app
+
+    chunks = [
+        "The capital of France is Paris. It is known for the Eiffel Tower.",
+        "Python is a programming language commonly used for web apps.",
+        "The Eiffel Tower is located in Paris, France.",
+    ]
+    save_document("doc1", "t.pdf", chunks, TfidfVectorStore.fit_from_chunks(chunks), "summary", str(tmp_path))
+    monkeypatch.setattr(chat, "DATA_DIR", str(tmp_path))
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    client = TestClient(app)
+    question = {"doc_id": "doc1", "message": "Where is the Eiffel Tower?"}
+
+    # Offline: sources, then the extractive answer as one event
+    res = client.post("/api/chat/stream", json=question)
+    assert res.headers["content-type"].startswith("text/event-stream")
+    events = _sse_events(res.text)
+    assert [e for e, _ in events] == ["sources", "answer", "done"]
+    assert events[0][1] == client.post("/api/chat", json=question).json()["sources"]
+    assert events[1][1]["answer"] == client.post("/api/chat", json=question).json()["answer"]
+
+    # With a provider: tokens as they arrive
+    stub = create_app()
+    monkeypatch.setenv("OPENAI_API_KEY", "stub")
+    monkeypatch.setattr(providers, "RESPONSE_CACHE", providers.ResponseCache(max_items=16, ttl=60))
+    monkeypatch.setattr(providers, "_make_async_client", lambda key, url: AsyncOpenAI(
+        api_key=key, base_url="http://stub/v1", http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=stub))))
+    events = _sse_events(client.post("/api/chat/stream", json=question).text)
+    kinds = [e for e, _ in events]
+    assert kinds[0] == "sources" and kinds[-1] == "done" and kinds.count("token") > 1
+    answer = "".join(d["text"] for e, d in events if e == "token")
+    assert events[-1][1]["answer"] == answer.strip()
+    assert client.post("/api/chat", json=question).json()["answer"] == answer.strip()  # cached by the stream
+    assert stub.state.stats["requests"] == 1
+    assert client.post("/api/chat/stream", json={"doc_id": "nope", "message": "x"}).status_code == 404
+
+def test_chat_stream_reports_error_when_llm_fails_mid_answer(tmp_path, monkeypatch):
+    import asyncio
+    from types import SimpleNamespace
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.routers import chat
+    from app.services import providers
+    from app.services.ingest import save_document
+
+    class BrokenStream:
+        def __init__(self):
+            self.sent = 0
+        def __aiter__(self):
+            return self
+        async def __anext__(self):
+            self.sent += 1
+            if self.sent > 2:
+                raise ConnectionError("connection reset")
+            return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=f"part{self.sent} "))])
+
+    async def create(**kwargs):
+        return BrokenStream()
+    client_ = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    chunks = ["The Eiffel Tower is located in Paris, France.", "Python is a programming language."]
+    save_document("doc1", "t.pdf", chunks, TfidfVectorStore.fit_from_chunks(chunks), "summary", str(tmp_path))
+    monkeypatch.setattr(chat, "DATA_DIR", str(tmp_path))
+    monkeypatch.setenv("OPENAI_API_KEY", "stub")
+    monkeypatch.setattr(providers, "RESPONSE_CACHE", providers.ResponseCache(max_items=16, ttl=60))
+    monkeypatch.setattr(providers, "_async_openai_client", lambda: (client_, asyncio.Semaphore(1)))
+
+    res = TestClient(app).post("/api/chat/stream", json={"doc_id": "doc1", "message": "Where is the tower?"})
+    events = _sse_events(res.text)
+    assert [e for e, _ in events] == ["sources", "token", "token", "error"]
+    assert "connection reset" in events[-1][1]["detail"]
+    assert providers.RESPONSE_CACHE.stats()["items"] == 0  # the partial text is not cached
@@ -0,0 +1,38 @@
+import json
+
+from app.services.ingest import chunk_sentences, ingest_pages, MemoryBudget
+from app.services.retriever import load_chunks
+from app.store.chunks import ChunkStore
+
+def _pages():
+    import random
+    words = [f"term{i}" for i in range(500)]
+    r = random.Random(3)
+    return [" ".join(" ".join(r.choice(words) for _ in range(10)).capitalize() + "." for _ in range(80)) for _ in range(4)]
+
+def test_ingested_chunks_stored_once_and_read_by_span(tmp_path):
+    from app.services.ingest import split_into_sentences
+    pages = _pages()
+    expected = chunk_sentences(split_into_sentences("\n".join(pages)))
+    doc_id = ingest_pages(pages, "t.pdf", str(tmp_path), budget=MemoryBudget(0))
+    chunks = load_chunks(tmp_path / doc_id)
+    assert isinstance(chunks, ChunkStore)
+    assert list(chunks) == expected and chunks[-1] == expected[-1] and chunks[1:3] == expected[1:3]
+    # overlapping words (30 of every 180) are written once
+    stored = (tmp_path / doc_id / "chunks" / "text.bin").stat().st_size
+    assert stored < 0.9 * sum(len(c.encode()) for c in expected)
+
+def test_legacy_chunks_json_fallback_and_migration(tmp_path):
+    from app.store.migrate import migrate_all
+    doc = tmp_path / "abc12345"
+    doc.mkdir()
+    legacy = ["one two three four. five six", "five six seven. eight", "unrelated text here"]
+    with open(doc / "chunks.json", "w", encoding="utf-8") as f:
+        json.dump([{"idx": i, "text": c} for i, c in enumerate(legacy)], f)
+    assert load_chunks(doc) == legacy
+
+    assert migrate_all(str(tmp_path), remove_chunks_json=True) == ["abc12345"]
+    assert not (doc / "chunks.json").exists()
+    store = load_chunks(doc)
+    assert list(store) == legacy
+    assert store.offsets[1][0] < store.offsets[0][1]  # shared "five six" detected
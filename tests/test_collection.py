@@ -0,0 +1,59 @@
+from fastapi.testclient import TestClient
+
+from app.services.ingest import save_document
+from app.store.chunks import ChunkStore
+from app.store.collection import CollectionIndex
+from app.store.vector import TfidfVectorStore
+
+DOCS = {
+    "lease1": ["The tenant pays rent monthly to the landlord.", "A pet deposit of $300 is required for each dog."],
+    "lease2": ["Parking is assigned to unit 4B.", "No pets are allowed; there is no pet deposit."],
+    "lease3": ["The pool is open from May to September.", "Quiet hours start at 10pm."],
+}
+
+def _save_all(tmp_path):
+    for doc_id, chunks in DOCS.items():
+        save_document(doc_id, f"{doc_id}.pdf", chunks, TfidfVectorStore.fit_from_chunks(chunks), "s", str(tmp_path))
+
+def test_collection_search_append_and_delete(tmp_path, monkeypatch):
+    from app.main import app
+    from app.routers import docs, search
+    monkeypatch.setattr(search, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(docs, "DATA_DIR", str(tmp_path))
+    _save_all(tmp_path)
+    client = TestClient(app)
+
+    res = client.post("/api/search", json={"query": "pet deposit", "k": 5}).json()["results"]
+    assert {(r["doc_id"], r["idx"]) for r in res[:2]} == {("lease1", 1), ("lease2", 1)}
+    assert res[0]["filename"].endswith(".pdf") and "pet deposit" in res[0]["chunk"]
+    only = client.post("/api/search", json={"query": "pet deposit", "doc_ids": ["lease2"]}).json()["results"]
+    assert [r["doc_id"] for r in only] == ["lease2"]
+    per_doc = client.post("/api/search", json={"query": "the", "k": 10, "per_doc": 1}).json()["results"]
+    assert len({r["doc_id"] for r in per_doc}) == len(per_doc)
+
+    ChunkStore.append(tmp_path / "lease3" / "chunks", ["Cats need a pet deposit too."])
+    CollectionIndex(str(tmp_path)).add("lease3", "lease3.pdf", ["Cats need a pet deposit too."], first_chunk=2)
+    res = client.post("/api/search", json={"query": "cats", "k": 1}).json()["results"]
+    assert (res[0]["doc_id"], res[0]["idx"]) == ("lease3", 2)
+
+    assert client.delete("/api/docs/lease1").json()["deleted"]
+    res = client.post("/api/search", json={"query": "pet deposit dog", "k": 5}).json()["results"]
+    assert "lease1" not in {r["doc_id"] for r in res}
+    # two of seven rows were dead: past COLLECTION_COMPACT_RATIO, so the index was rebuilt without them
+    state = CollectionIndex(str(tmp_path))._read()
+    assert state["rows"] == 5 and state["rebuilds"] == 1 and not any(s["deleted"] for s in state["segments"])
+
+def test_collection_chat_and_backfill(tmp_path, monkeypatch):
+    import shutil
+    from app.main import app
+    from app.routers import chat
+    monkeypatch.setattr(chat, "DATA_DIR", str(tmp_path))
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    _save_all(tmp_path)
+    shutil.rmtree(tmp_path / ".collection")  # documents saved before the collection index existed
+    client = TestClient(app)
+
+    res = client.post("/api/chat/collection", json={"message": "How much is the pet deposit?"}).json()
+    assert "$300" in res["answer"]
+    assert "lease1" in {s["doc_id"] for s in res["sources"]}
+    assert CollectionIndex(str(tmp_path)).exists()
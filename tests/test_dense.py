@@ -0,0 +1,89 @@
+import random
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from app.store.dense import DenseIndex
+from app.store.postings import select_top_k
+from app.store.vector import TfidfVectorStore
+
+TOPICS = [
+    "ship harbor sail captain anchor voyage",
+    "wheat harvest farmer barn tractor field",
+    "violin orchestra concert melody rehearsal conductor",
+    "telescope galaxy orbit planet comet astronomer",
+]
+
+def _chunks(n, seed=0):
+    rnd = random.Random(seed)
+    out = []
+    for i in range(n):
+        words = TOPICS[i % len(TOPICS)].split()
+        out.append(" ".join(rnd.choices(words, k=12) + [f"filler{rnd.randint(0, 500)}" for _ in range(6)]))
+    return out
+
+def test_ivf_search_and_append(tmp_path):
+    chunks = _chunks(400)
+    store = TfidfVectorStore.fit_from_chunks(chunks)
+    dense = DenseIndex.build(store.matrix, dim=8, nlist=6)
+    q = dense.embed(store.transform(["captain of the ship"]))[0]
+    exact = select_top_k(dense.vectors @ q, 10)[1]
+    # scanning every list only differs from the exact scan through the int8 pre-selection
+    assert set(map(int, dense.search(q, 10, nprobe=6)[1])) == set(map(int, exact))
+    assert all(i % len(TOPICS) == 0 for i in dense.search(q, 10, nprobe=2)[1])
+
+    dense.save(tmp_path / "dense")
+    assert DenseIndex.append(tmp_path / "dense", store.matrix[:5]) == 405
+    loaded = DenseIndex.load(tmp_path / "dense")
+    assert np.allclose(loaded.vectors[400:], dense.vectors[:5], atol=1e-5)
+    assert np.array_equal(loaded.assign[:400], dense.assign)
+
+def test_chat_retrieval_modes(tmp_path, monkeypatch):
+    import shutil
+    from app.main import app
+    from app.routers import chat
+    from app.services.ingest import save_document
+
+    chunks = _chunks(40)
+    store = TfidfVectorStore.fit_from_chunks(chunks)
+    save_document("doc1", "t.pdf", chunks, store, "summary", str(tmp_path),
+                  dense=DenseIndex.build(store.matrix, dim=4))
+    monkeypatch.setattr(chat, "DATA_DIR", str(tmp_path))
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    client = TestClient(app)
+
+    for mode in ("sparse", "dense", "hybrid"):
+        res = client.post("/api/chat", json={"doc_id": "doc1", "message": "telescope orbit", "retrieval": mode})
+        assert res.status_code == 200
+        assert "telescope" in res.json()["sources"][0]["chunk"]
+    shutil.rmtree(tmp_path / "doc1" / "dense")
+    res = client.post("/api/chat", json={"doc_id": "doc1", "message": "telescope orbit", "retrieval": "hybrid"})
+    assert res.status_code == 400
+    assert client.post("/api/chat", json={"doc_id": "doc1", "message": "x", "retrieval": "bogus"}).status_code == 422
+
+def test_ingest_builds_dense_when_opted_in_or_dense_retrieval(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.routers import chat
+    from app.services import ingest
+
+    pages = [" ".join(c.capitalize() + "." for c in _chunks(10, seed=p)) for p in range(20)]
+    monkeypatch.setattr(ingest, "RETRIEVAL_MODE", "sparse")
+    monkeypatch.setattr(ingest, "DENSE_INDEX", False)
+    plain = ingest.ingest_pages(pages, "a.pdf", str(tmp_path))
+    assert not (tmp_path / plain / "dense").exists()
+    monkeypatch.setattr(ingest, "DENSE_INDEX", True)
+    opted = ingest.ingest_pages(pages, "b.pdf", str(tmp_path))
+    assert (tmp_path / opted / "dense" / "format.json").exists()
+    monkeypatch.setattr(ingest, "DENSE_INDEX", False)
+    monkeypatch.setattr(ingest, "RETRIEVAL_MODE", "hybrid")
+    doc_id = ingest.ingest_pages(pages, "c.pdf", str(tmp_path))
+    assert (tmp_path / doc_id / "dense" / "format.json").exists()
+
+    # per-request dense retrieval under the sparse default: works with the opt-in, explains itself without
+    monkeypatch.setattr(chat, "DATA_DIR", str(tmp_path))
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    client = TestClient(app)
+    assert client.post("/api/chat", json={"doc_id": opted, "message": "telescope orbit", "retrieval": "dense"}).status_code == 200
+    res = client.post("/api/chat", json={"doc_id": plain, "message": "telescope orbit", "retrieval": "dense"})
+    assert res.status_code == 400 and "DENSE_INDEX=1" in res.json()["detail"]
@@ -22,3 +22,101 @@ def test_frequency_summary():
     summary = frequency_summarize(text, max_sentences=2)
     assert isinstance(summary, str)
     assert len(summary) > 0
+
+def _baseline_frequency_summarize(text, max_sentences=5):
+    # the regex summarizer the sentence-table ranking replaced, kept as a reference
+    import re
+    from collections import Counter
+    from app.services.summarizer import STOP
+    norm = lambda w: re.sub(r"[^a-z0-9]", "", w.lower())
+    sents = [s.strip() for s in re.split(r"(?<=[.!?])\s+(?=[A-Z0-9\"'])", text.strip()) if s.strip()]
+    if len(sents) <= max_sentences:
+        return " ".join(sents)
+    freqs = Counter(w for s in sents for w in map(norm, s.split()) if w and w not in STOP)
+    if not freqs:
+        return " ".join(sents[:max_sentences])
+    scored = [(i, sum(freqs[w] for w in map(norm, s.split()) if w and w not in STOP) / (len(s.split()) + 1e-6))
+              for i, s in enumerate(sents)]
+    top = sorted(scored, key=lambda x: x[1], reverse=True)[:max_sentences]
+    return " ".join(sents[i] for i in sorted(i for i, _ in top))
+
+def test_frequency_summary_matches_baseline_sentence_rule():
+    text = (
+        "Costs are approx. five dollars per unit and approx. six for pets. Tenants pay rent monthly. "
+        "The landlord fixes the roof, e.g. after storms! Rent is due on the 1st. of each month. "
+        "Pets require an extra deposit. Late rent costs a fee - ten dollars a day. 'Quiet hours' start at ten. "
+        "Is parking included? no. Parking costs extra for pets and tenants alike."
+    )
+    for n in (1, 2, 3, 5, 8):
+        assert frequency_summarize(text, max_sentences=n) == _baseline_frequency_summarize(text, n)
+    assert "Costs are approx. five dollars per unit and approx. six for pets." in frequency_summarize(text, 8)
+
+def _pages(n_pages, sentences_per_page=60):
+    import random
+    words = [f"term{i}" for i in range(2000)]
+    for p in range(n_pages):
+        r = random.Random(p)
+        yield " ".join(" ".join(r.choice(words) for _ in range(12)).capitalize() + "." for _ in range(sentences_per_page))
+
+def test_streaming_chunks_match_whole_text():
+    from app.services.ingest import iter_sentences
+    pages = list(_pages(5))
+    expected = chunk_sentences(split_into_sentences("\n".join(pages)))
+    assert chunk_sentences(iter_sentences(iter(pages))) == expected
+
+def test_streaming_pipeline_memory_is_bounded():
+    import tracemalloc
+    from app.services.ingest import iter_chunk_spans, iter_sentences
+    text_bytes = sum(len(p) for p in _pages(200))
+    tracemalloc.start()
+    try:
+        chunks = [c for c, _ in iter_chunk_spans(iter_sentences(_pages(200)))]
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # the retained chunk list (text + ~17% overlap) dominates; pages are never accumulated
+    assert peak < 1.5 * text_bytes
+    assert len(chunks) > 100
+
+def test_ingest_respects_memory_budget(tmp_path):
+    import pytest
+    from app.services.ingest import ingest_pages, MemoryBudget, MemoryBudgetExceeded
+    budget = MemoryBudget(8 * 1024 * 1024)
+    doc_id = ingest_pages(_pages(20), "small.pdf", str(tmp_path), budget=budget)
+    assert (tmp_path / doc_id / "summary.txt").read_text()
+    assert 0 < budget.peak <= budget.limit
+
+    with pytest.raises(MemoryBudgetExceeded):
+        ingest_pages(_pages(200), "big.pdf", str(tmp_path), budget=MemoryBudget(1024 * 1024))
+
+def test_ranked_summary_lengths_and_map_reduce(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.routers import docs
+    from app.services import summarizer
+    from app.services.ingest import ingest_pages, iter_chunk_spans, iter_sentences
+    from app.store.sentences import SentenceTable
+
+    spans = list(iter_chunk_spans(iter_sentences(_pages(20))))
+    chunks, carried = [c for c, _ in spans], [n for _, n in spans]
+    table = SentenceTable.build(chunks)
+    fresh = summarizer.fresh_sentences(table, summarizer.fresh_starts(chunks, carried))
+    # sentences repeated in the overlaps are counted once: exactly the sentences of the pages
+    assert len(fresh) == 20 * 60
+    monkeypatch.setattr(summarizer, "SUMMARY_SECTION_SENTENCES", 200)
+    reduced = summarizer.summarize_table(table, summarizer.fresh_starts(chunks, carried), 10, mode="mapreduce")
+    assert len(reduced) == 10 and set(reduced) <= set(fresh)
+
+    doc_id = ingest_pages(_pages(20), "doc.pdf", str(tmp_path))
+    monkeypatch.setattr(docs, "DATA_DIR", str(tmp_path))
+    client = TestClient(app)
+    default = client.get(f"/api/docs/{doc_id}/summary").json()["summary"]
+    assert client.get(f"/api/docs/{doc_id}/summary", params={"max_sentences": 6}).json()["summary"] == default
+    two = client.get(f"/api/docs/{doc_id}/summary", params={"max_sentences": 2}).json()["summary"]
+    assert two.count(".") == 2 and all(s.strip() + "." in default for s in two.split(".") if s.strip())
+    (tmp_path / doc_id / "summary.json").unlink()  # an older document: ranked from its sentence table
+    assert client.get(f"/api/docs/{doc_id}/summary", params={"max_sentences": 2}).json()["summary"] == two
+    assert not (tmp_path / doc_id / "summary.json").exists()  # a GET does not write; the migration does
+    from app.store.migrate import migrate_all
+    assert migrate_all(str(tmp_path), summaries=True) == [doc_id]
+    assert client.get(f"/api/docs/{doc_id}/summary", params={"max_sentences": 2}).json()["summary"] == two
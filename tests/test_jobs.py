@@ -0,0 +1,149 @@
+import time
+import pytest
+from fastapi.testclient import TestClient
+
+from conftest import make_pdf
+from app.services.jobs import IngestScheduler, QueueFull
+
+def _wait(scheduler, job_id, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = scheduler.get(job_id)
+        if job.status in ("done", "failed"):
+            return job
+        time.sleep(0.02)
+    raise AssertionError("job did not finish")
+
+def test_upload_returns_job_and_reports_stages(tmp_path, monkeypatch):
+    from app.main import app
+    from app.routers import docs
+    scheduler = IngestScheduler(workers=1, max_queue=4, executor="thread")
+    monkeypatch.setattr(docs, "SCHEDULER", scheduler)
+    monkeypatch.setattr(docs, "DATA_DIR", str(tmp_path))
+
+    from app.utils.metrics import STAGE_SECONDS
+    indexed = STAGE_SECONDS.count(pipeline="ingest", stage="index")
+
+    page = "FastAPI is a web framework. Uploads are ingested in the background. " * 15
+    pdf = make_pdf([page, page.replace("FastAPI", "Starlette")])
+    client = TestClient(app)
+    res = client.post("/api/upload", files={"file": ("a.pdf", pdf, "application/pdf")})
+    assert res.status_code == 202
+    job_id = res.json()["job_id"]
+
+    job = _wait(scheduler, job_id)
+    assert job.status == "done", job.error
+    assert job.stages == ["extract", "chunk", "index", "summarize", "facts", "save"]
+    assert STAGE_SECONDS.count(pipeline="ingest", stage="index") == indexed + 1
+    body = client.get(f"/api/jobs/{job_id}").json()
+    assert body["doc_id"] == job.doc_id
+    assert (tmp_path / job.doc_id / "meta.json").exists()
+    assert client.get("/api/jobs/nope").status_code == 404
+    scheduler.shutdown()
+
+def test_scheduler_bounded_queue(tmp_path, monkeypatch):
+    import threading
+    from app.services import jobs
+    gate = threading.Event()
+    monkeypatch.setattr(jobs, "run_ingest_job", lambda *a, **kw: gate.wait(5) and "doc")
+    scheduler = IngestScheduler(workers=1, max_queue=2, executor="thread")
+    first = scheduler.submit(b"", "a.pdf", str(tmp_path))
+    scheduler.submit(b"", "b.pdf", str(tmp_path))
+    with pytest.raises(QueueFull):
+        scheduler.submit(b"", "c.pdf", str(tmp_path))
+    gate.set()
+    assert _wait(scheduler, first.job_id).doc_id == "doc"
+    scheduler.shutdown()
+
+def test_duplicate_upload_reuses_document_with_refcount(tmp_path, monkeypatch):
+    from app.main import app
+    from app.routers import docs
+    scheduler = IngestScheduler(workers=1, max_queue=4, executor="thread")
+    monkeypatch.setattr(docs, "SCHEDULER", scheduler)
+    monkeypatch.setattr(docs, "DATA_DIR", str(tmp_path))
+
+    page = "Duplicate uploads are answered from the content index. Deletes drop one reference. " * 15
+    pdf = make_pdf([page, page.replace("Duplicate", "Repeated")])
+    client = TestClient(app)
+    upload = lambda: client.post("/api/upload", files={"file": ("a.pdf", pdf, "application/pdf")})
+    first = upload()
+    assert first.status_code == 202
+    doc_id = _wait(scheduler, first.json()["job_id"]).doc_id
+    assert len(doc_id) == 32
+
+    again = upload()
+    assert again.status_code == 200
+    assert again.json()["doc_id"] == doc_id and again.json()["status"] == "done"
+    assert scheduler.get(again.json()["job_id"]).doc_id == doc_id
+
+    assert client.delete(f"/api/docs/{doc_id}").json() == {"doc_id": doc_id, "deleted": False, "refs": 1}
+    assert (tmp_path / doc_id / "meta.json").exists()
+    assert client.delete(f"/api/docs/{doc_id}").json()["deleted"] is True
+    assert not (tmp_path / doc_id).exists()
+    assert client.delete(f"/api/docs/{doc_id}").status_code == 404
+    assert upload().status_code == 202  # ingested afresh once every reference is gone
+    scheduler.shutdown()
+
+def test_identical_inflight_uploads_share_one_job(tmp_path, monkeypatch):
+    import threading
+    from app.services import jobs
+    from app.store.content import ContentIndex
+    gate = threading.Event()
+    calls = []
+    monkeypatch.setattr(jobs, "run_ingest_job", lambda *a, **kw: calls.append(kw) or (gate.wait(5) and "doc"))
+    scheduler = IngestScheduler(workers=1, max_queue=4, executor="thread")
+    first = scheduler.submit(b"", "a.pdf", str(tmp_path), content_key="k1")
+    second = scheduler.submit(b"", "b.pdf", str(tmp_path), content_key="k1")
+    assert second.job_id == first.job_id
+    gate.set()
+    assert _wait(scheduler, first.job_id).doc_id == "doc"
+    assert len(calls) == 1 and calls[0]["content_key"] == "k1"
+    assert ContentIndex(str(tmp_path)).get("k1") == {"doc_id": "doc", "refs": 2}
+    scheduler.shutdown()
+
+def test_dead_worker_fails_its_job_and_next_upload_succeeds(tmp_path, monkeypatch):
+    import os, signal
+    from app.main import app
+    from app.routers import docs
+    scheduler = IngestScheduler(workers=1, max_queue=4, executor="process")
+    monkeypatch.setattr(docs, "SCHEDULER", scheduler)
+    monkeypatch.setattr(docs, "DATA_DIR", str(tmp_path))
+    client = TestClient(app)
+    page = "Worker processes can die while parsing a PDF. The pool must recover. " * 15
+
+    res = client.post("/api/upload", files={"file": ("a.pdf", make_pdf([page]), "application/pdf")})
+    assert res.status_code == 202
+    for proc in list(scheduler._executor._processes.values()):
+        os.kill(proc.pid, signal.SIGKILL)
+    job = _wait(scheduler, res.json()["job_id"])
+    assert job.status == "failed" and "worker died" in job.error
+
+    res = client.post("/api/upload", files={"file": ("b.pdf", make_pdf([page, page.replace("Worker", "Parser")]), "application/pdf")})
+    assert res.status_code == 202
+    job = _wait(scheduler, res.json()["job_id"], timeout=60)
+    assert job.status == "done", job.error
+    scheduler.shutdown()
+
+def test_upload_errors_are_classified(tmp_path, monkeypatch):
+    from app.main import app
+    from app.routers import docs
+    from app.services.jobs import SchedulerUnavailable
+    scheduler = IngestScheduler(workers=1, max_queue=4, executor="thread")
+    monkeypatch.setattr(docs, "SCHEDULER", scheduler)
+    monkeypatch.setattr(docs, "DATA_DIR", str(tmp_path))
+    client = TestClient(app, raise_server_exceptions=False)
+    assert client.post("/api/upload", files={"file": ("a.pdf", b"", "application/pdf")}).status_code == 400
+    assert client.post("/api/upload", files={"file": ("a.pdf", b"hello", "application/pdf")}).status_code == 400
+
+    def unavailable(*a, **kw):
+        raise SchedulerUnavailable("Ingestion workers are unavailable")
+    monkeypatch.setattr(scheduler, "submit", unavailable)
+    res = client.post("/api/upload", files={"file": ("a.pdf", make_pdf(["Some text."]), "application/pdf")})
+    assert res.status_code == 503 and res.headers["retry-after"]
+
+    def disk_full(*a, **kw):
+        raise OSError(28, "No space left on device")
+    monkeypatch.setattr(scheduler, "submit", disk_full)
+    res = client.post("/api/upload", files={"file": ("a.pdf", make_pdf(["Some text."]), "application/pdf")})
+    assert res.status_code == 500
+    scheduler.shutdown()
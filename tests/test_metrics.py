@@ -0,0 +1,50 @@
+import json, logging
+from fastapi.testclient import TestClient
+
+from app.utils import metrics
+from app.utils.metrics import ANSWER_PATH, STAGE_SECONDS, Counter, Histogram
+
+def test_histogram_and_counter_render_prometheus_text():
+    h = Histogram("t_seconds", "help", ("stage",), buckets=(0.1, 1))
+    h.observe(0.05, stage="a")
+    h.observe(0.5, stage="a")
+    h.observe(5, stage="a")
+    c = Counter("t_total", "help", ("path",))
+    c.inc(path='we"ird')
+    lines = h.render() + c.render()
+    assert 't_seconds_bucket{stage="a",le="0.1"} 1' in lines
+    assert 't_seconds_bucket{stage="a",le="1"} 2' in lines
+    assert 't_seconds_bucket{stage="a",le="+Inf"} 3' in lines
+    assert 't_seconds_count{stage="a"} 3' in lines
+    assert 't_total{path="we\\"ird"} 1' in lines
+
+def test_chat_stages_answer_path_and_timing_log(tmp_path, monkeypatch, caplog):
+    from app.main import app
+    from app.routers import chat
+    from app.services.ingest import save_document
+    from app.store.vector import TfidfVectorStore
+
+    chunks = ["The Eiffel Tower is located in Paris, France.", "Python is a programming language."]
+    save_document("doc1", "t.pdf", chunks, TfidfVectorStore.fit_from_chunks(chunks), "summary", str(tmp_path))
+    monkeypatch.setattr(chat, "DATA_DIR", str(tmp_path))
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.setattr(metrics, "TIMING_LOG", True)
+    before = {s: STAGE_SECONDS.count(pipeline="chat", stage=s) for s in ("load", "top_k", "rules", "stitch", "llm")}
+    extractive = ANSWER_PATH.value(path="extractive")
+
+    client = TestClient(app)
+    with caplog.at_level(logging.INFO, logger="app.timing"):
+        assert client.post("/api/chat", json={"doc_id": "doc1", "message": "Where is the tower?"}).status_code == 200
+    for stage in ("load", "top_k", "rules", "stitch"):
+        assert STAGE_SECONDS.count(pipeline="chat", stage=stage) == before[stage] + 1
+    assert STAGE_SECONDS.count(pipeline="chat", stage="llm") == before["llm"]  # no provider configured
+    assert ANSWER_PATH.value(path="extractive") == extractive + 1
+
+    record = json.loads(caplog.records[-1].getMessage())
+    assert record["route"] == "/api/chat" and record["status"] == 200
+    assert {"load", "top_k", "rules", "stitch"} <= set(record["stages_ms"])
+
+    body = client.get("/metrics").text
+    assert 'pdfqa_answer_path_total{path="extractive"}' in body
+    assert 'pdfqa_http_request_seconds_count{method="POST",route="/api/chat",status="200"}' in body
+    assert 'pdfqa_document_cache{stat="hits"}' in body
@@ -0,0 +1,15 @@
+from conftest import make_pdf
+from app.utils.pdf import extract_pages, extract_text_from_pdf_bytes
+
+def test_parallel_extraction_preserves_page_order():
+    pdf = make_pdf([f"This is page number {i}. It has some text." for i in range(1, 8)])
+    serial = extract_pages(pdf, workers=1)
+    sharded = extract_pages(pdf, workers=2, pages_per_shard=2, min_pages=1)
+    assert [p.page for p in sharded] == list(range(1, 8))
+    assert [p.text for p in sharded] == [p.text for p in serial]
+    assert all(f"page number {p.page}." in p.text for p in sharded)
+    assert all(p.engine == "pypdf" and p.seconds >= 0 for p in sharded)
+
+def test_extract_text_joins_pages():
+    text = extract_text_from_pdf_bytes(make_pdf(["First page.", "Second page."]))
+    assert text.splitlines() == ["First page.", "Second page."]
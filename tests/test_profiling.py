@@ -0,0 +1,43 @@
+from fastapi.testclient import TestClient
+
+from app.utils import profiling
+
+def test_token_profiled_request_is_listed_with_hotspots(tmp_path, monkeypatch):
+    from app.main import app
+    from app.routers import chat
+    from app.services.ingest import save_document
+    from app.store.vector import TfidfVectorStore
+
+    chunks = ["The Eiffel Tower is located in Paris, France.", "Python is a programming language."]
+    save_document("doc1", "t.pdf", chunks, TfidfVectorStore.fit_from_chunks(chunks), "summary", str(tmp_path))
+    monkeypatch.setattr(chat, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "secret")
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path / "profiles"))
+    client = TestClient(app)
+    question = {"doc_id": "doc1", "message": "Where is the tower?"}
+
+    assert client.post("/api/chat", json=question).status_code == 200  # no header: not profiled
+    assert client.post("/api/chat", json=question, headers={"X-Profile": "wrong"}).status_code == 200
+    assert client.post("/api/chat", json=question, headers={"X-Profile": "secret"}).status_code == 200
+
+    assert client.get("/api/profiles").status_code == 403
+    listed = client.get("/api/profiles", headers={"X-Profile": "secret"}).json()
+    assert len(listed) == 1
+    assert listed[0]["route"] == "/api/chat" and listed[0]["doc_id"] == "doc1" and listed[0]["status"] == 200
+    assert listed[0]["hotspots"] and {"function", "calls", "tottime_ms", "cumtime_ms"} <= set(listed[0]["hotspots"][0])
+    assert listed[0]["name"].endswith("_api-chat_doc1")
+    prof = client.get(f"/api/profiles/{listed[0]['name']}", headers={"X-Profile": "secret"})
+    assert prof.status_code == 200 and prof.content
+    # profiling by sampling only: no token, so the profiles are not served
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "")
+    assert client.get("/api/profiles").status_code == 404
+    assert client.get(f"/api/profiles/{listed[0]['name']}").status_code == 404
+
+def test_profile_directory_rotates(tmp_path):
+    import cProfile
+    for i in range(3):
+        p = cProfile.Profile()
+        p.runcall(sum, range(100))
+        profiling.save_profile(p, "/api/chat", f"d{i}", 200, 1.0, directory=str(tmp_path), keep=2)
+    assert [s["doc_id"] for s in profiling.list_profiles(str(tmp_path))] == ["d2", "d1"]
+    assert len(list(tmp_path.glob("*.prof"))) == 2
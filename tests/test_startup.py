@@ -0,0 +1,47 @@
+import subprocess, sys, time
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+from app.services.ingest import save_document
+from app.services.retriever import DOC_CACHE, load_document
+from app.services.warmup import RECENT_FILE, STARTUP, recent_doc_ids
+from app.store.vector import TfidfVectorStore
+
+ROOT = Path(__file__).resolve().parents[1]
+
+def test_app_import_defers_heavy_libraries():
+    # NumPy is deliberately not deferred: ten store/service modules use it at module level, it is
+    # ~80 ms of the ~640 ms `import app.main` (scikit-learn + SciPy add ~630 ms on first use), and
+    # the first document load needs it anyway. Asserted so a change either way is a decision.
+    code = "import sys, app.main; print(sorted({m.split('.')[0] for m in sys.modules} & {'sklearn', 'scipy', 'numpy'}))"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "['numpy']"
+
+def test_lifespan_warms_recent_documents(tmp_path, monkeypatch):
+    from app import main
+    for doc_id in ("a", "b", "c"):
+        chunks = [f"{doc_id} chunk about rent", f"{doc_id} chunk about pets"]
+        save_document(doc_id, f"{doc_id}.pdf", chunks, TfidfVectorStore.fit_from_chunks(chunks), "s", str(tmp_path))
+    monkeypatch.setattr(main, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "WARMUP_DOCS", 2)
+    monkeypatch.setattr(STARTUP, "documents", 0)
+    DOC_CACHE.clear()
+
+    # no history yet: the newest documents in the catalog
+    assert set(recent_doc_ids(str(tmp_path), 2)) == {"b", "c"}
+    with TestClient(main.app) as client:
+        for _ in range(200):
+            res = client.get("/ready")
+            if res.status_code == 200:
+                break
+            assert res.status_code == 503 and res.headers["retry-after"]
+            time.sleep(0.01)
+        assert res.json()["ready"] and res.json()["documents"] == 2
+        assert {p.name for p in DOC_CACHE.keys()} == {"b", "c"}
+        load_document(tmp_path / "a")
+        assert 'pdfqa_import_seconds{module="scipy.sparse"}' in client.get("/metrics").text
+    # the cache order at shutdown is the next warm-up's
+    assert (tmp_path / RECENT_FILE).exists()
+    assert recent_doc_ids(str(tmp_path), 2) == ["a", "c"]
+    DOC_CACHE.clear()
@@ -0,0 +1,111 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.services.ingest import append_pages, save_document
+from app.store import storage
+from app.store.packed import PACK_SUFFIX, PackCorrupt, PackedFile
+from app.store.sentences import SentenceTable
+from app.store.vector import TfidfVectorStore
+
+CHUNKS = ["The tenant pays rent of $1200 monthly.", "A pet deposit of $300 is required.", "Quiet hours start at 10pm."]
+
+def _save(tmp_path, doc_id="doc1"):
+    save_document(doc_id, "lease.pdf", CHUNKS, TfidfVectorStore.fit_from_chunks(CHUNKS), "Rent is due monthly.", str(tmp_path))
+
+def test_packed_document_roundtrip(tmp_path, monkeypatch):
+    from app.main import app
+    from app.routers import chat, docs
+    from app.store.catalog import CATALOG_FILE
+    monkeypatch.setattr(storage, "DOCUMENT_STORAGE", "packed")
+    monkeypatch.setattr(chat, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(docs, "DATA_DIR", str(tmp_path))
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    _save(tmp_path)
+    # one file, nothing left in staging
+    assert (tmp_path / f"doc1{PACK_SUFFIX}").is_file() and not (tmp_path / "doc1").exists()
+    assert not any((tmp_path / storage.STAGING_DIR).iterdir())
+    pack = PackedFile(tmp_path / f"doc1{PACK_SUFFIX}")
+    assert {"meta.json", "chunks/text.bin", "index/data.npy", "summary.txt"} <= set(pack.sections)
+    assert pack.verify() == []
+
+    client = TestClient(app)
+    res = client.post("/api/chat", json={"doc_id": "doc1", "message": "How much is the pet deposit?"}).json()
+    assert "$300" in res["answer"]
+    assert client.get("/api/docs/doc1/summary").json()["summary"] == "Rent is due monthly."
+    (tmp_path / CATALOG_FILE).unlink()  # backfilled from the packed file
+    assert [d["id"] for d in client.get("/api/docs").json()] == ["doc1"]
+
+    append_pages("doc1", ["The zeppelin hangar is painted orange."], str(tmp_path))
+    assert client.get("/api/docs/doc1/summary").json()["meta"]["num_chunks"] == 4
+    res = client.post("/api/chat", json={"doc_id": "doc1", "message": "What colour is the zeppelin hangar?"}).json()
+    assert "zeppelin" in res["sources"][0]["chunk"]
+    assert client.delete("/api/docs/doc1").json()["deleted"]
+    assert not (tmp_path / f"doc1{PACK_SUFFIX}").exists()
+
+@pytest.mark.parametrize("layout", ["dir", "packed"])
+def test_failed_save_leaves_no_document(tmp_path, monkeypatch, layout):
+    monkeypatch.setattr(storage, "DOCUMENT_STORAGE", layout)
+    _save(tmp_path, "good")
+
+    def crash(self, path):
+        raise OSError("disk full")
+    monkeypatch.setattr(SentenceTable, "save", crash)
+    with pytest.raises(OSError):
+        _save(tmp_path, "bad")
+    store = storage.DocumentStorage(str(tmp_path))
+    assert store.doc_ids() == ["good"] and not store.exists("bad")
+
+def test_corrupt_pack_is_detected(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DOCUMENT_STORAGE", "packed")
+    _save(tmp_path)
+    path = tmp_path / f"doc1{PACK_SUFFIX}"
+    offset = PackedFile(path).sections["summary.txt"]["offset"]
+    data = bytearray(path.read_bytes())
+    data[offset] ^= 0xFF
+    path.write_bytes(bytes(data))
+    pack = PackedFile(path)
+    assert pack.verify() == ["summary.txt"]
+    with pytest.raises(PackCorrupt):
+        pack.read_bytes("summary.txt")
+    path.write_bytes(bytes(data[:len(data) // 2]))
+    with pytest.raises(PackCorrupt):
+        PackedFile(path)
+
+def test_directory_generations_survive_crashes(tmp_path, monkeypatch):
+    import os
+    from app.services.retriever import load_document
+    monkeypatch.setattr(storage, "DOCUMENT_STORAGE", "dir")
+    _save(tmp_path)
+    location = tmp_path / "doc1"
+    first = os.readlink(location)
+    _save(tmp_path)  # a re-save moves the link in one rename and drops the old generation
+    assert location.is_symlink() and os.readlink(location) != first
+    assert [g.name for g in (tmp_path / storage.GENERATIONS_DIR / "doc1").iterdir()] == [os.path.basename(os.readlink(location))]
+
+    # a crash mid-append leaves the previous generation untouched, row counts consistent
+    def crash(self, path):
+        raise OSError("disk full")
+    monkeypatch.setattr(SentenceTable, "save", crash)
+    with pytest.raises(OSError):
+        append_pages("doc1", ["The zeppelin hangar is painted orange."], str(tmp_path))
+    monkeypatch.undo()
+    doc = load_document(location)
+    assert len(doc.chunks) == len(CHUNKS) == doc.store.matrix.shape[0]
+    assert not any((tmp_path / storage.STAGING_DIR).iterdir())
+
+    # older releases re-saved with two renames; a crash between them left only `.staging/<doc_id>-*/old`
+    orphan = tmp_path / storage.STAGING_DIR / "doc1-x1y2"
+    orphan.mkdir()
+    os.replace(location.resolve(), orphan / "old")
+    location.unlink()
+    store = storage.DocumentStorage(str(tmp_path))
+    assert store.doc_ids() == ["doc1"] and store.exists("doc1")
+    assert load_document(location).chunks[0] == CHUNKS[0]
+
+    # a plain directory from before generations becomes one on its next save
+    os.replace(location.resolve(), tmp_path / "legacy")
+    location.unlink()
+    os.replace(tmp_path / "legacy", location)
+    _save(tmp_path)
+    assert location.is_symlink() and store.read_meta("doc1")["num_chunks"] == len(CHUNKS)
+    assert store.delete("doc1") is None and not os.path.lexists(location) and store.doc_ids() == []